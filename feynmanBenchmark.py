@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks for the SVG line primitives, the named sheets and the 3D model,
+built with CadQuery and with the numpy extrusion.
+
+  ./feynmanBenchmark.py run --out baseline.json
+  ./feynmanBenchmark.py compare baseline.json
+
+run times every case and writes the best time per call to a JSON file.
+compare times them again, or reads a second JSON file, and lists every case
+that got slower than the baseline by more than the threshold or is missing
+from the new results, exiting with status 1 if there are any.  Pass
+--allow-missing to only fail on slower cases.
+"""
+
+import os
+import sys
+import json
+import time
+import math
+import argparse
+import shutil
+import platform
+import tempfile
+import numpy
+import feynmanGraphSVG
+import feynmanExtrude
+from feynmanGraphSVG import PathBuffer,straightLine,straightLineArrow,wavyLine,spiralLine,vertexCircle
+
+LENGTHS = (50.,100.,200.,400.)
+WIDTHS = (2.5,5.,10.)
+BENCHMARK_SHEETS = ("Hff","Hgamgam","HVV","Backgrounds")
+PRIMITIVES = (
+  ("straightLine",straightLine,{}),
+  ("straightLineArrow",straightLineArrow,{}),
+  ("wavyLine",wavyLine,{}),
+  ("spiralLine",spiralLine,{}),
+)
+
+def bestTime(func,repeat=5,minTime=0.05):
+  """
+  Best time per call of func() over repeat rounds, each calling it enough
+  times to run for at least minTime seconds.
+  """
+  number = 1
+  while True:
+    start = time.perf_counter()
+    for i in range(number):
+      func()
+    elapsed = time.perf_counter()-start
+    if elapsed >= minTime:
+      break
+    number *= 2 if elapsed <= 0. else max(2,int(math.ceil(minTime/elapsed)))
+  best = elapsed/number
+  for iRepeat in range(repeat-1):
+    start = time.perf_counter()
+    for i in range(number):
+      func()
+    best = min(best,(time.perf_counter()-start)/number)
+  return best
+
+def primitiveCase(primitive,length,kwargs):
+  def run():
+    primitive(PathBuffer(),(10.,10.),(10.+length,10.),**kwargs)
+  return run
+
+def vertexCase(length,width,nLines=3):
+  """
+  vertexCircle at the meeting point of nLines straight lines of the given
+  length and width.  The lines stop width short of the vertex, which sets
+  the radius.  Only the vertex circle is timed.
+  """
+  p1 = numpy.array([250.,250.])
+  endLists = []
+  for iLine in range(nLines):
+    angle = 2*numpy.pi*iLine/nLines
+    p2 = p1+length*numpy.array([numpy.cos(angle),numpy.sin(angle)])
+    endLists.append(straightLine(PathBuffer(),p1,p2,capped1=False,width=width))
+  def run():
+    vertexCircle(PathBuffer(),p1,endLists,radius=width)
+  return run
+
+def sheetCase(name,outDir):
+  def run():
+    feynmanGraphSVG.renderSheet(name,outDir)
+  return run
+
+def loadDiagramModule():
+  """
+  Imports feynmanDiagram, returning (module,None) or (None,reason) if
+  CadQuery or the module can't be loaded here.
+  """
+  try:
+    import feynmanDiagram
+  except Exception as error:
+    return None,"%s: %s" % (type(error).__name__,error)
+  return feynmanDiagram,None
+
+def cachedBuildCase(module,cacheDir):
+  """
+  feynmanDiagram.build with its solid caches in cacheDir, so the benchmark
+  doesn't read or fill the user's own cache.
+  """
+  solidCache = module.SolidCache(cacheDir)
+  componentCache = module.SolidCache(os.path.join(cacheDir,"components"),maxMemory=64)
+  def run():
+    saved = module.solidCache,module.componentCache
+    module.solidCache,module.componentCache = solidCache,componentCache
+    try:
+      module.build()
+    finally:
+      module.solidCache,module.componentCache = saved
+  return run
+
+def cases(outDir):
+  """
+  Yields (name,function) for every benchmark case, and (name,None) with the
+  reason for any that have to be skipped.
+  """
+  for primitiveName,primitive,kwargs in PRIMITIVES:
+    for length in LENGTHS:
+      for width in WIDTHS:
+        options = dict(kwargs,width=width)
+        yield "%s/length=%g/width=%g" % (primitiveName,length,width),primitiveCase(primitive,length,options)
+  for length in LENGTHS:
+    for width in WIDTHS:
+      yield "vertexCircle/length=%g/width=%g" % (length,width),vertexCase(length,width)
+  for name in BENCHMARK_SHEETS:
+    yield "sheet/%s" % name,sheetCase(name,outDir)
+  yield "feynmanExtrude.diagram",lambda: feynmanExtrude.extrudeDiagram()
+  module,reason = loadDiagramModule()
+  if module is None:
+    yield "feynmanDiagram.build",reason
+  else:
+    yield "feynmanDiagram.build",lambda: module.build(cache=False)
+    yield "feynmanDiagram.build/fuzzy",lambda: module.build(tolerance=1e-4,cache=False)
+    yield "feynmanDiagram.build/parallel",lambda: module.build(processes=5,cache=False)
+    yield "feynmanDiagram.build/cached",cachedBuildCase(module,os.path.join(outDir,"cache"))
+
+def runBenchmarks(pattern=None,repeat=5,minTime=0.05,log=None):
+  """
+  Times every case whose name contains pattern.  Returns the results as a
+  dict ready to be saved as JSON.
+  """
+  outDir = tempfile.mkdtemp(prefix="feynmanBenchmark")
+  results = {}
+  skipped = {}
+  for name,func in cases(outDir):
+    if pattern is not None and pattern not in name:
+      continue
+    if not callable(func):
+      skipped[name] = func
+      if log is not None:
+        log("%-40s skipped (%s)" % (name,func))
+      continue
+    results[name] = bestTime(func,repeat,minTime)
+    if log is not None:
+      log("%-40s %10.3f ms" % (name,1e3*results[name]))
+  shutil.rmtree(outDir)
+  return {
+    'python':platform.python_version(),
+    'numpy':numpy.__version__,
+    'machine':platform.machine(),
+    'time':time.strftime("%Y-%m-%d %H:%M:%S"),
+    'results':results,
+    'skipped':skipped,
+  }
+
+def compareResults(baseline,current,threshold=0.1):
+  """
+  Returns a list of (name,baseline seconds,current seconds,ratio) for the
+  cases in both that got slower by more than the fraction threshold, the
+  worst first.
+  """
+  regressions = []
+  for name,seconds in current['results'].items():
+    if name not in baseline['results']:
+      continue
+    ratio = seconds/baseline['results'][name]
+    if ratio > 1.+threshold:
+      regressions.append((name,baseline['results'][name],seconds,ratio))
+  regressions.sort(key=lambda regression: -regression[3])
+  return regressions
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Times the feynman graph primitives, sheets and 3D model")
+  subparsers = parser.add_subparsers(dest="command")
+  runParser = subparsers.add_parser("run",help="time the benchmarks and save the results")
+  runParser.add_argument("--out",default="benchmark.json",help="JSON file to write the results to")
+  compareParser = subparsers.add_parser("compare",help="compare against a saved baseline")
+  compareParser.add_argument("baseline",help="JSON file with the baseline results")
+  compareParser.add_argument("current",nargs="?",help="JSON file with the results to check, the benchmarks are run if not given")
+  compareParser.add_argument("--threshold",type=float,default=0.1,help="fraction slower than the baseline that counts as a regression")
+  compareParser.add_argument("--allow-missing",action="store_true",help="don't fail when baseline cases are missing from the current results")
+  for subparser in (runParser,compareParser):
+    subparser.add_argument("--filter",help="only run the cases with names containing this")
+    subparser.add_argument("--repeat",type=int,default=5,help="number of timing rounds, the best is kept")
+  args = parser.parse_args(argv)
+  if args.command is None:
+    parser.print_help()
+    return 0
+  if args.command == "run":
+    results = runBenchmarks(args.filter,args.repeat,log=print)
+    with open(args.out,'w') as outFile:
+      json.dump(results,outFile,indent=2,sort_keys=True)
+    print("results written to %s" % args.out)
+    return 0
+  with open(args.baseline) as inFile:
+    baseline = json.load(inFile)
+  if args.current is None:
+    current = runBenchmarks(args.filter,args.repeat)
+  else:
+    with open(args.current) as inFile:
+      current = json.load(inFile)
+  regressions = compareResults(baseline,current,args.threshold)
+  expected = [name for name in baseline['results'] if args.filter is None or args.filter in name]
+  missing = sorted(set(expected)-set(current['results']))
+  for name in missing:
+    print("%-40s missing" % name)
+  for name,before,after,ratio in regressions:
+    print("%-40s %10.3f ms -> %10.3f ms  (%+.0f%%)" % (name,1e3*before,1e3*after,100*(ratio-1)))
+  print("%d of %d cases slower by more than %.0f%%" % (len(regressions),len(current['results']),100*args.threshold))
+  if missing:
+    print("%d baseline cases missing%s" % (len(missing)," (allowed)" if args.allow_missing else ""))
+  return 1 if regressions or (missing and not args.allow_missing) else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1,85 +1,35 @@
 #!/usr/bin/env python
 
+import io
+import os
+import json
+import hashlib
+import tempfile
+import time
+import collections
+import multiprocessing
 if __name__ == "__main__":
   import sys
   sys.path.append("/tmp/silly/")
   sys.path.append("/tmp/silly/FreeCAD")
-  from cadquery import *
-  import math
+from cadquery import *
+from feynmanLayout import wiggleOutline,lineOutline,diagramComponents
 #
 # Important MetaData
 #
 UOM = "mm"
 
-sqrt = math.sqrt
-def distance2d(p1,p2):
-    return sqrt((p1[1]-p2[1])**2+(p1[0]-p2[0])**2)
-def getVector2d(p1,p2):
-    return (p2[0]-p1[0],p2[1],p1[1])
-def getnormVector2d(p1,p2):
-    dist = distance2d(p1,p2)
-    vec = getVector2d(p1,p2)
-    return (vec[0]/dist,vec[1]/dist)
-def scaleVector2d(p,sf):
-    return (p[0]*sf,p[1]*sf)
-def addVectors2d(p1,p2):
-    return (p1[0]+p2[0],p1[1]+p2[1])
-
 def makeWiggle(wp,endPoint,wigglePeriod=5.0,amplitude=2,width=0.25):
-    currentPoint = (0,0)
-    nPoints = int(distance2d(currentPoint,endPoint)/wigglePeriod)*8
-    normVector = getnormVector2d(currentPoint,endPoint)
-    perpVector = (-normVector[1],normVector[0])
-    advanceVector = scaleVector2d(normVector,wigglePeriod/8.)
-    ampVector = scaleVector2d(perpVector,amplitude)
-    currentPoint = addVectors2d(currentPoint,scaleVector2d(perpVector,width/2.))
-    wp = wp.lineTo(currentPoint[0],currentPoint[1])
-    for i in range(nPoints/8):
-        currentPointM1 = addVectors2d(addVectors2d(currentPoint,advanceVector),scaleVector2d(ampVector,0.7))
-        currentPoint = addVectors2d(addVectors2d(currentPointM1,advanceVector),scaleVector2d(ampVector,0.3))
-        wp = wp.threePointArc(currentPointM1,currentPoint)
-        currentPointM1 = addVectors2d(addVectors2d(currentPoint,advanceVector),scaleVector2d(ampVector,-0.3))
-        currentPoint = addVectors2d(addVectors2d(currentPointM1,advanceVector),scaleVector2d(ampVector,-0.7))
-        wp = wp.threePointArc(currentPointM1,currentPoint)
-        currentPointM1 = addVectors2d(addVectors2d(currentPoint,advanceVector),scaleVector2d(ampVector,-0.7))
-        currentPoint = addVectors2d(addVectors2d(currentPointM1,advanceVector),scaleVector2d(ampVector,-0.3))
-        wp = wp.threePointArc(currentPointM1,currentPoint)
-        currentPointM1 = addVectors2d(addVectors2d(currentPoint,advanceVector),scaleVector2d(ampVector,0.3))
-        currentPoint = addVectors2d(addVectors2d(currentPointM1,advanceVector),scaleVector2d(ampVector,0.7))
-        wp = wp.threePointArc(currentPointM1,currentPoint)
-    currentPoint = addVectors2d(currentPoint,scaleVector2d(perpVector,-width))
-    wp = wp.lineTo(currentPoint[0],currentPoint[1])
-    advanceVector = scaleVector2d(advanceVector,-1)
-    ampVector = scaleVector2d(ampVector,-1)
-    for i in range(nPoints/8):
-        currentPointM1 = addVectors2d(addVectors2d(currentPoint,advanceVector),scaleVector2d(ampVector,0.7))
-        currentPoint = addVectors2d(addVectors2d(currentPointM1,advanceVector),scaleVector2d(ampVector,0.3))
-        wp = wp.threePointArc(currentPointM1,currentPoint)
-        currentPointM1 = addVectors2d(addVectors2d(currentPoint,advanceVector),scaleVector2d(ampVector,-0.3))
-        currentPoint = addVectors2d(addVectors2d(currentPointM1,advanceVector),scaleVector2d(ampVector,-0.7))
-        wp = wp.threePointArc(currentPointM1,currentPoint)
-        currentPointM1 = addVectors2d(addVectors2d(currentPoint,advanceVector),scaleVector2d(ampVector,-0.7))
-        currentPoint = addVectors2d(addVectors2d(currentPointM1,advanceVector),scaleVector2d(ampVector,-0.3))
-        wp = wp.threePointArc(currentPointM1,currentPoint)
-        currentPointM1 = addVectors2d(addVectors2d(currentPoint,advanceVector),scaleVector2d(ampVector,0.3))
-        currentPoint = addVectors2d(addVectors2d(currentPointM1,advanceVector),scaleVector2d(ampVector,0.7))
-        wp = wp.threePointArc(currentPointM1,currentPoint)
-    #currentPoint = scaleVector2d(perpVector,-width/2.)
-    #wp = wp.lineTo(currentPoint[0],currentPoint[1])
+    for edge in wiggleOutline(endPoint,wigglePeriod,amplitude,width):
+      if edge[0] == "arc":
+        wp = wp.threePointArc(edge[1],edge[2])
+      else:
+        wp = wp.lineTo(edge[1][0],edge[1][1])
     wp = wp.close()
     return wp
-    
+
 def makeLine(wp,endPoint,arrow=False,forward=True,width=0.25):
-    normVector = getnormVector2d((0.0,0.0),endPoint)
-    perpVector = (-normVector[1],normVector[0])
-    listOfPoints = []
-    listOfPoints.append(scaleVector2d(perpVector,-width/2.))
-    listOfPoints.append(scaleVector2d(perpVector,width/2.))
-    listOfPoints.append(addVectors2d(endPoint,scaleVector2d(perpVector,width/2.)))
-    listOfPoints.append(addVectors2d(endPoint,scaleVector2d(perpVector,-width/2.)))
-    listOfPoints.append(scaleVector2d(perpVector,-width))
-
-    return wp.polyline(listOfPoints)
+    return wp.polyline(lineOutline(endPoint,width)).close()
 #
 # PARAMETERS and PRESETS
 # These parameters can be manipulated by end users
@@ -102,7 +52,9 @@ upperRightExternalIsBoson  = Silly(False)
 lowerLeftExternalIsBoson  = Silly(False)
 lowerRightExternalIsBoson  = Silly(False)
 
-if __name__ != "__main__":
+# the customizer provides FloatParam and BooleanParam, without it (run as a
+# script or imported) the defaults above are used
+if "FloatParam" in globals():
   propagatorLength = FloatParam(min=1.0,max=100.0,
                         presets={'default':50.0},group="Size", 
                         desc="Length of the propagator line"
@@ -144,71 +96,377 @@ if __name__ != "__main__":
 
 #
 # Other Variables.
-# These are used in the script but not exposed to users to change with the GUI
+# The layout, such as the angle of the external legs, is in feynmanLayout
 
-externalAngle = 45.
-externalAngleRad = externalAngle*math.pi/180.
-externalLenX = abs(externalLength.value*math.cos(externalAngleRad))
-externalLenY = abs(externalLength.value*math.sin(externalAngleRad))
+PARAMETER_NAMES = [
+  "propagatorLength","externalLength","bosonWidth","fermionWidth",
+  "arrowWidth","arrowLength","thickness","vertexDiameter",
+  "propagatorIsBoson","upperLeftExternalIsBoson","upperRightExternalIsBoson",
+  "lowerLeftExternalIsBoson","lowerRightExternalIsBoson",
+]
+# bump this when a change to the geometry makes cached solids stale
+CACHE_VERSION = 3
 
-#
-# Your build method. It must return a solid object
-#
-def build():
-    depth = thickness.value
-    world = Workplane(Plane.XY())
-    circleL = world.pushPoints([(-propagatorLength.value/2.,0)]).circle(vertexDiameter.value).extrude(depth)
-    circleR = world.pushPoints([(propagatorLength.value/2.,0)]).circle(vertexDiameter.value).extrude(depth)
-    circleLWorld = circleL.faces(">Z").workplane(offset=-depth)
-    circleRWorld = circleR.faces(">Z").workplane(offset=-depth)
-
-    propagator = None
-    ulExt = None
-    llExt = None
-    urExt = None
-    lrExt = None
-    
-    if propagatorIsBoson.value:
-      propagator = makeWiggle(circleLWorld,(propagatorLength.value,0.),width=bosonWidth.value).extrude(depth)
-    else:
-      propagator = makeLine(circleLWorld,(propagatorLength.value,0.),width=fermionWidth.value).extrude(depth)
-    
-    if upperLeftExternalIsBoson.value:
-      ulExt = makeWiggle(circleLWorld,(-externalLenX,externalLenY),width=bosonWidth.value).extrude(depth)
-    else:
-      ulExt = makeLine(circleLWorld,(-externalLenX,externalLenY),width=fermionWidth.value).extrude(depth)
+class SolidCache(object):
+    """
+    Two tier cache of solids.  The maxMemory most recently used solids are
+    kept in memory and every solid is saved as a BREP file in directory,
+    which is kept under maxBytes by deleting the least recently used files.
+    With directory None only the memory tier is used.
+    """
 
-    if lowerLeftExternalIsBoson.value:
-      llExt = makeWiggle(circleLWorld,(-externalLenX,-externalLenY),width=bosonWidth.value).extrude(depth)
-    else:
-      llExt = makeLine(circleLWorld,(-externalLenX,-externalLenY),width=fermionWidth.value).extrude(depth)
+    def __init__(self,directory=None,maxBytes=256*1024*1024,maxMemory=16):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.maxMemory = maxMemory
+        self.memory = collections.OrderedDict()
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+    def key(self,values):
+        """
+        Hex digest of the JSON serializable values, dict keys sorted.
+        """
+        text = json.dumps([CACHE_VERSION,values],sort_keys=True)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def fileName(self,key):
+        return os.path.join(self.directory,key+".brep")
+
+    def remember(self,key,shape):
+        self.memory[key] = shape
+        while len(self.memory) > self.maxMemory:
+            self.memory.popitem(last=False)
+
+    def get(self,key):
+        """
+        The cached solid for key, or None.
+        """
+        if key in self.memory:
+            shape = self.memory.pop(key)
+            self.memory[key] = shape
+            self.hits += 1
+            return shape
+        if self.directory is not None and os.path.exists(self.fileName(key)):
+            # other processes sharing the directory can evict the file at
+            # any time, which is just a miss
+            try:
+                shape = Shape.importBrep(self.fileName(key))
+            except ValueError:
+                shape = None
+            if shape is not None:
+                # the file's modification time is its last use for eviction
+                try:
+                    os.utime(self.fileName(key),None)
+                except OSError:
+                    pass
+                self.remember(key,shape)
+                self.diskHits += 1
+                return shape
+        self.misses += 1
+        return None
+
+    def put(self,key,shape):
+        self.remember(key,shape)
+        if self.directory is None:
+            return
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # another process may have just made it
+                if not os.path.isdir(self.directory):
+                    raise
+        # write then rename so other processes never load half a file
+        tmpName = "%s.%d.tmp" % (self.fileName(key),os.getpid())
+        shape.exportBrep(tmpName)
+        os.rename(tmpName,self.fileName(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used BREP files until they fit in maxBytes.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".brep"):
+                path = os.path.join(self.directory,name)
+                # skip files other processes delete while we look
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((info.st_mtime,info.st_size,path))
+        total = sum(size for mtime,size,path in entries)
+        for mtime,size,path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+def parameterValues():
+    """
+    The values of all the user parameters by name.
+    """
+    return dict((name,globals()[name].value) for name in PARAMETER_NAMES)
 
-    if upperRightExternalIsBoson.value:
-      urExt = makeWiggle(circleRWorld,(externalLenX,externalLenY),width=bosonWidth.value).extrude(depth)
+cacheDirectory = os.environ.get("FEYNMAN_DIAGRAM_CACHE",os.path.join(tempfile.gettempdir(),"feynmanDiagramCache"))
+solidCache = SolidCache(cacheDirectory)
+componentCache = SolidCache(os.path.join(cacheDirectory,"components"),maxMemory=64)
+# fused unions of some of the placed components, in memory only, with the
+# set of placed component keys each one is the union of
+fusedCache = SolidCache(maxMemory=8)
+fusedComponents = collections.OrderedDict()
+previousComponents = frozenset()
+
+def fuseAll(shapes,tolerance=None):
+    """
+    Fuses all the component solids in one boolean operation instead of one
+    union per component.  A tolerance turns on fuzzy mode so near
+    coincident faces are merged.  The legs overlap the vertex circles, so
+    the faster glue mode, which is only right for solids that just touch,
+    can't be used.
+    """
+    fused = shapes[0].fuse(*shapes[1:],tol=tolerance).clean()
+    return Workplane(Plane.XY()).newObject([fused])
+
+def fuseChanged(specs,shapes,tolerance=None):
+    """
+    fuseAll for build, fusing only the components that changed since the
+    previous build into a cached union of the rest.  The first change to a
+    component fuses the unchanged ones and keeps their union in fusedCache,
+    so further changes to the same components, like dragging a slider, only
+    fuse those into it.
+    """
+    global previousComponents
+    placed = [fusedCache.key([list(spec),tolerance]) for spec in specs]
+    current = frozenset(placed)
+    unchanged = current & previousComponents
+    previousComponents = current
+    # the largest cached union of components that are all still there
+    base = None
+    baseComponents = frozenset()
+    for key,components in list(fusedComponents.items()):
+      if components <= current and len(components) > len(baseComponents):
+        shape = fusedCache.get(key)
+        if shape is None:
+          del fusedComponents[key]
+          continue
+        base = shape
+        baseComponents = components
+    if len(unchanged) > max(1,len(baseComponents)) and len(unchanged) < len(current):
+      baseComponents = unchanged
+      base = fuseAll([shape for key,shape in zip(placed,shapes) if key in unchanged],tolerance).val()
+      key = fusedCache.key(sorted(unchanged))
+      fusedCache.put(key,base)
+      fusedComponents[key] = unchanged
+      while len(fusedComponents) > fusedCache.maxMemory:
+        fusedComponents.popitem(last=False)
+    if base is None:
+      return fuseAll(shapes,tolerance)
+    changed = [shape for key,shape in zip(placed,shapes) if key not in baseComponents]
+    if not changed:
+      return Workplane(Plane.XY()).newObject([base])
+    return fuseAll([base]+changed,tolerance)
+
+def componentSpecs():
+    """
+    The components of the diagram at the current parameter values, see
+    feynmanLayout.diagramComponents.
+    """
+    return diagramComponents(parameterValues())
+
+def buildLocalComponent(kind,endPoint,width,depth):
+    """
+    Builds the solid for a component with its vertex at the origin.
+    """
+    wp = Workplane(Plane.XY())
+    if kind == "circle":
+      return wp.circle(width).extrude(depth).val()
+    if kind == "wiggle":
+      return makeWiggle(wp,endPoint,width=width).extrude(depth).val()
+    return makeLine(wp,endPoint,width=width).extrude(depth).val()
+
+def buildComponent(spec):
+    """
+    Builds the solid for one componentSpecs tuple.
+    """
+    kind,origin,endPoint,width,depth = spec
+    return buildLocalComponent(kind,endPoint,width,depth).translate(Vector(origin[0],origin[1],0.))
+
+def buildLocalComponentBrep(local):
+    """
+    buildLocalComponent for worker processes, taking its arguments as one
+    tuple and returning the solid as BREP data.
+    """
+    stream = io.BytesIO()
+    buildLocalComponent(*local).exportBrep(stream)
+    return stream.getvalue()
+
+def buildComponents(specs,processes=None,cache=None):
+    """
+    Builds the solids for specs, in a pool of processes worker processes if
+    processes > 1.  The workers send their solids back as BREP.
+
+    Components are built with their vertex at the origin and moved into
+    place, so with a SolidCache as cache they are keyed only by their kind,
+    end point, width and depth: a parameter change only rebuilds the
+    components it changes, and the two vertex circles are built once.
+    """
+    localSpecs = [(kind,tuple(endPoint) if endPoint is not None else None,width,depth) for kind,origin,endPoint,width,depth in specs]
+    shapes = {}
+    if cache is not None:
+        for local in localSpecs:
+            key = cache.key(list(local))
+            if key not in shapes:
+                shapes[key] = cache.get(key)
+        keys = [cache.key(list(local)) for local in localSpecs]
+    else:
+        keys = list(range(len(localSpecs)))
+    # the distinct components still to build, the slow wiggles first so they
+    # don't end up last in the worker queue
+    missing = collections.OrderedDict()
+    for key,local in zip(keys,localSpecs):
+        if shapes.get(key) is None:
+            missing[key] = local
+    missingKeys = sorted(missing,key=lambda key: missing[key][0] != "wiggle")
+    if not processes or processes <= 1 or len(missingKeys) <= 1:
+        built = [buildLocalComponent(*missing[key]) for key in missingKeys]
     else:
-      urExt = makeLine(circleRWorld,(externalLenX,externalLenY),width=fermionWidth.value).extrude(depth)
+        pool = multiprocessing.Pool(min(processes,len(missingKeys)))
+        try:
+            breps = pool.map(buildLocalComponentBrep,[missing[key] for key in missingKeys],chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        built = [Shape.importBrep(io.BytesIO(brep)) for brep in breps]
+    for key,shape in zip(missingKeys,built):
+        shapes[key] = shape
+        if cache is not None:
+            cache.put(key,shape)
+    return [shapes[key].translate(Vector(spec[1][0],spec[1][1],0.)) for key,spec in zip(keys,specs)]
 
-    if lowerRightExternalIsBoson.value:
-      lrExt = makeWiggle(circleRWorld,(externalLenX,-externalLenY),width=bosonWidth.value).extrude(depth)
+def exportBinarySTL(shape,fileName,tolerance=0.1,angularTolerance=0.1):
+    """
+    Writes shape, a Shape or Workplane, to fileName as binary STL, meshed
+    with the given linear (mm) and angular (radians) tolerances.
+    """
+    if isinstance(shape,Workplane):
+        shape = shape.val()
+    shape.exportStl(fileName,tolerance,angularTolerance,ascii=False,relative=False)
+
+#
+# Your build method. It must return a solid object
+#
+def build(tolerance=None,processes=None,cache=True):
+    """
+    Builds the diagram from the current parameter values.  Unless cache is
+    False, finished solids are looked up in and saved to solidCache, keyed
+    by all the parameters and build options that change the result, and
+    the components in componentCache.  A change then only rebuilds the
+    components it touches and fuses them into the union of the rest, see
+    fuseChanged.
+    """
+    key = None
+    if cache and solidCache is not None:
+        key = solidCache.key([parameterValues(),tolerance])
+        shape = solidCache.get(key)
+        if shape is not None:
+            return Workplane(Plane.XY()).newObject([shape])
+    specs = componentSpecs()
+    shapes = buildComponents(specs,processes,componentCache if cache else None)
+    if cache:
+        result = fuseChanged(specs,shapes,tolerance)
     else:
-      lrExt = makeLine(circleRWorld,(externalLenX,-externalLenY),width=fermionWidth.value).extrude(depth)
-
-    result = circleL
-    result = result.union(propagator)
-    result = result.union(circleR)
-    result = result.union(ulExt)
-    result = result.union(llExt)
-    result = result.union(urExt)
-    result = result.union(lrExt)
-    print "Did everything"
+        result = fuseAll(shapes,tolerance)
+    if key is not None:
+        solidCache.put(key,result.val())
+    print("Did everything")
     return result
 
+def checkRebuild(values,cacheDir):
+    """
+    Checks that changing the parameters in values only rebuilds the
+    components they touch, and that fusing the changed components into the
+    union of the rest gives the same solid as an uncached build.  Builds
+    with empty caches in cacheDir at the current values, with values set,
+    back at the current values and with values set again, the last two
+    reusing the fused union of the components the two share.  Returns a
+    dict per build with the components it changed, rebuilt and loaded from
+    the cache, whether it reused a fused union, its time, whether its
+    validity and volume match an uncached build and whether it all came out
+    as expected.  The parameters are restored after.
+    """
+    global solidCache,componentCache,fusedCache,fusedComponents,previousComponents
+    saved = solidCache,componentCache,fusedCache,fusedComponents,previousComponents,parameterValues()
+    # whole solids aren't kept, so every build fuses
+    solidCache = SolidCache(maxMemory=0)
+    componentCache = SolidCache(os.path.join(cacheDir,"components"),maxMemory=64)
+    fusedCache = SolidCache(maxMemory=8)
+    fusedComponents = collections.OrderedDict()
+    previousComponents = frozenset()
+    start = saved[-1]
+    rows = []
+    try:
+      before = set()
+      placed = []
+      for settings in (start,values,start,values):
+        for name,value in settings.items():
+          globals()[name].value = value
+        specs = componentSpecs()
+        placed.append(frozenset(specs))
+        after = set(spec[:1]+spec[2:] for spec in specs)
+        componentCache.hits = componentCache.diskHits = componentCache.misses = 0
+        fusedCache.hits = 0
+        begin = time.time()
+        cached = build().val()
+        seconds = time.time()-begin
+        uncached = build(cache=False).val()
+        row = {
+          'changed':len(after-before),
+          'rebuilt':componentCache.misses,
+          'reused':componentCache.hits+componentCache.diskHits,
+          'fusedReused':fusedCache.hits > 0,
+          'seconds':seconds,
+          'matches':cached.isValid() and uncached.isValid() and abs(cached.Volume()-uncached.Volume()) <= 1e-6*abs(uncached.Volume()),
+        }
+        expectFused = len(rows) >= 2 and 2 <= len(placed[0] & placed[1]) < len(placed[-1])
+        row['ok'] = row['matches'] and row['rebuilt'] == row['changed'] and row['fusedReused'] == expectFused
+        rows.append(row)
+        before |= after
+    finally:
+      solidCache,componentCache,fusedCache,fusedComponents,previousComponents = saved[:-1]
+      for name,value in start.items():
+        globals()[name].value = value
+    return rows
+
 if __name__ == "__main__":
-  result = build()
-  stlStr = exporters.toString(result,"STL")
-  f = open("output.stl",'w')
-  f.write(stlStr)
-  f.close()
+  import argparse
+  import shutil
+  from feynmanParameters import parseSettings
+  parser = argparse.ArgumentParser(description="Builds the diagram and writes output.stl")
+  parser.add_argument("--check",action="append",default=[],metavar="NAME=VALUE",help="instead check that changing these parameters only rebuilds the components they touch and matches an uncached build")
+  args = parser.parse_args()
+  if not args.check:
+    result = build(processes=multiprocessing.cpu_count())
+    exportBinarySTL(result,"output.stl")
+    sys.exit(0)
+  try:
+    values = parseSettings(args.check,parameterValues())
+  except ValueError as error:
+    parser.error(str(error))
+  cacheDir = tempfile.mkdtemp(prefix="feynmanDiagram")
+  try:
+    rows = checkRebuild(values,cacheDir)
+  finally:
+    shutil.rmtree(cacheDir)
+  for label,row in zip(("start","changed","back","changed again"),rows):
+    print("%-14s components changed %d, rebuilt %d, from the cache %d, fused union reused %s, %.3f s, %s" % (label,row['changed'],row['rebuilt'],row['reused'],row['fusedReused'],row['seconds'],"matches uncached build" if row['matches'] else "DOESN'T MATCH uncached build"))
+  sys.exit(0 if all(row['ok'] for row in rows) else 1)
   #stepStr = exporters.toString(result,"STEP")
   #f = open("output.step",'w')
   #f.write(stepStr)
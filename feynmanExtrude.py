@@ -0,0 +1,619 @@
+#!/usr/bin/env python
+
+"""
+Extrudes flat feynman diagram outlines straight to STL with numpy, without
+CadQuery or OpenCascade.
+
+Every diagram is a 2D outline extruded by a thickness, so the solid is a
+prism: the path the SVG primitives draw is flattened to polylines (the
+Beziers and arcs sampled finely enough to stay within a tolerance of the
+curve), the pieces are stitched end to end into closed loops, loops inside
+an odd number of others become holes, and each outer loop with its holes is
+triangulated by ear clipping for the top and bottom caps.  The side walls
+are two triangles per outline edge.
+
+The feynmanDiagram model is extruded from the outlines of its components
+in feynmanLayout, the same ones its CadQuery solids are built from, merged
+into the outline of their union.
+
+  ./feynmanExtrude.py sheet Hff --depth 3 --out Hff.stl
+  ./feynmanExtrude.py diagram --set propagatorIsBoson=false --out output.stl
+"""
+
+import sys
+import argparse
+import numpy
+import feynmanGraphSVG
+from feynmanGraphSVG import PATH_COMMANDS,PATH_ARITY
+from feynmanGeometry import toAbsolute,arcCenters
+from feynmanParameters import parseSettings
+from feynmanLayout import wiggleOutline,lineOutline,diagramComponents
+
+CODE_M = PATH_COMMANDS.index("M")
+CODE_Q = PATH_COMMANDS.index("Q")
+CODE_C = PATH_COMMANDS.index("C")
+CODE_A = PATH_COMMANDS.index("A")
+
+# the feynmanDiagram parameters this backend uses, with the same defaults
+DIAGRAM_DEFAULTS = {
+  'propagatorLength':50.,
+  'externalLength':30.,
+  'bosonWidth':2.,
+  'fermionWidth':2.,
+  'thickness':3.,
+  'vertexDiameter':3.,
+  'propagatorIsBoson':True,
+  'upperLeftExternalIsBoson':False,
+  'upperRightExternalIsBoson':False,
+  'lowerLeftExternalIsBoson':False,
+  'lowerRightExternalIsBoson':False,
+}
+
+STL_DTYPE = numpy.dtype([('normal','<f4',(3,)),('vertices','<f4',(3,3)),('attribute','<u2')])
+
+def interiorSamples(index,nSegments,offsets):
+  """
+  For commands index each split into nSegments pieces, returns the command
+  number, t in (0,1) and output position of every sample but the end point.
+  """
+  nInterior = nSegments-1
+  iCommand = numpy.repeat(numpy.arange(len(index)),nInterior)
+  j = numpy.arange(nInterior.sum())-numpy.repeat(numpy.cumsum(nInterior)-nInterior,nInterior)+1
+  t = j/nSegments[iCommand].astype(numpy.float64)
+  return iCommand,t[:,numpy.newaxis],offsets[index[iCommand]]+j-1
+
+def flattenCommands(codes,coords,tolerance=0.05):
+  """
+  Flattens path commands to a list of (n,2) polylines, one per subpath,
+  staying within tolerance of the curves.
+  """
+  codes,coords,previous = toAbsolute(codes,coords)
+  if len(codes) == 0:
+    return []
+  arity = PATH_ARITY[codes]
+  starts = numpy.cumsum(arity)-arity
+  ends = coords[(starts+arity-2)[:,numpy.newaxis]+numpy.arange(2)]
+  counts = numpy.ones(len(codes),dtype=int)
+
+  def controlPoints(code,nPoints):
+    index = numpy.flatnonzero(codes == code)
+    points = coords[starts[index][:,numpy.newaxis]+numpy.arange(2*nPoints)].reshape(-1,nPoints,2)
+    return index,numpy.concatenate((previous[index][:,numpy.newaxis],points),axis=1)
+
+  # Wang's bound on the number of segments from the second differences
+  iQuad,quads = controlPoints(CODE_Q,2)
+  secondDiff = numpy.hypot(*(quads[:,0]-2*quads[:,1]+quads[:,2]).T)
+  nQuad = numpy.maximum(numpy.ceil(numpy.sqrt(secondDiff/(4.*tolerance))),1).astype(int)
+  counts[iQuad] = nQuad
+  iCubic,cubics = controlPoints(CODE_C,3)
+  secondDiff = numpy.maximum(numpy.hypot(*(cubics[:,0]-2*cubics[:,1]+cubics[:,2]).T),numpy.hypot(*(cubics[:,1]-2*cubics[:,2]+cubics[:,3]).T))
+  nCubic = numpy.maximum(numpy.ceil(numpy.sqrt(0.75*secondDiff/tolerance)),1).astype(int)
+  counts[iCubic] = nCubic
+  iArc = numpy.flatnonzero(codes == CODE_A)
+  arcParams = coords[starts[iArc][:,numpy.newaxis]+numpy.arange(5)]
+  arcs = numpy.stack((previous[iArc],ends[iArc]),axis=1)
+  nArc = numpy.ones(len(iArc),dtype=int)
+  if len(iArc):
+    center,rx,ry,phi,theta1,deltaTheta = arcCenters(arcs,arcParams)
+    valid = numpy.isfinite(center).all(axis=1) & (rx > 0.) & (ry > 0.) & numpy.isfinite(deltaTheta)
+    radius = numpy.where(valid,numpy.maximum(rx,ry),1.)
+    step = 2*numpy.arccos(numpy.clip(1.-tolerance/radius,-1.,1.))
+    nArc = numpy.where(valid,numpy.maximum(numpy.ceil(numpy.abs(numpy.nan_to_num(deltaTheta))/step),1),1).astype(int)
+    counts[iArc] = nArc
+
+  offsets = numpy.cumsum(counts)-counts
+  points = numpy.empty((counts.sum(),2))
+  points[offsets+counts-1] = ends
+  iCommand,t,position = interiorSamples(iQuad,nQuad,offsets)
+  q = quads[iCommand]
+  points[position] = (1-t)**2*q[:,0]+2*(1-t)*t*q[:,1]+t**2*q[:,2]
+  iCommand,t,position = interiorSamples(iCubic,nCubic,offsets)
+  c = cubics[iCommand]
+  points[position] = (1-t)**3*c[:,0]+3*(1-t)**2*t*c[:,1]+3*(1-t)*t**2*c[:,2]+t**3*c[:,3]
+  if len(iArc):
+    iCommand,t,position = interiorSamples(iArc,nArc,offsets)
+    theta = theta1[iCommand]+t[:,0]*deltaTheta[iCommand]
+    cosPhi = numpy.cos(phi[iCommand])
+    sinPhi = numpy.sin(phi[iCommand])
+    x = rx[iCommand]*numpy.cos(theta)
+    y = ry[iCommand]*numpy.sin(theta)
+    points[position] = center[iCommand]+numpy.stack((cosPhi*x-sinPhi*y,sinPhi*x+cosPhi*y),axis=1)
+
+  # a path that doesn't start with a move starts from the origin
+  subpath = numpy.repeat(numpy.cumsum(codes == CODE_M),counts)
+  if codes[0] != CODE_M:
+    points = numpy.vstack((previous[:1],points))
+    subpath = numpy.concatenate(([0],subpath))
+  pieces = numpy.split(points,numpy.flatnonzero(numpy.diff(subpath))+1)
+  return [piece for piece in pieces if len(piece) > 1]
+
+def splitLoop(loop,joints,tolerance):
+  """
+  Splits loop where it passes through the same point twice, joints being
+  the indices of the points where its pieces were joined.
+  """
+  for a in range(len(joints)):
+    for b in range(a+1,len(joints)):
+      i,j = joints[a],joints[b]
+      if numpy.hypot(*(loop[j]-loop[i])) <= tolerance:
+        outer = numpy.concatenate((loop[:i],loop[j:]))
+        outerJoints = [k for k in joints if k < i]+[k-(j-i) for k in joints[b:]]
+        return splitLoop(outer,outerJoints,tolerance)+splitLoop(loop[i:j],[k-i for k in joints[a:b]],tolerance)
+  return [loop]
+
+def stitchLoops(polylines,tolerance=1e-3):
+  """
+  Joins polylines whose ends meet, within tolerance, into closed loops.
+  Where more than two ends meet, the walk takes the next piece counter
+  clockwise from the one it came in on, so outlines touching at a point
+  don't cross over, and the loop is split if it comes back through that
+  point.  Returns (loops,openChains): the loops as (n,2) arrays without the
+  repeated closing point, and the pieces that could not be closed, each
+  joined up as far as it goes both ways.
+  """
+  loops = []
+  chains = []
+  for polyline in polylines:
+    if numpy.hypot(*(polyline[-1]-polyline[0])) <= tolerance:
+      loops.append(polyline[:-1])
+    else:
+      chains.append(polyline)
+  # hash both ends of every open chain by grid cell
+  cells = {}
+  for iChain,chain in enumerate(chains):
+    for atEnd,point in ((False,chain[0]),(True,chain[-1])):
+      cell = tuple(numpy.floor(point/tolerance).astype(int).tolist())
+      cells.setdefault(cell,[]).append((iChain,atEnd))
+
+  def findNeighbours(point,used):
+    found = []
+    cx,cy = numpy.floor(point/tolerance).astype(int).tolist()
+    for x in (cx-1,cx,cx+1):
+      for y in (cy-1,cy,cy+1):
+        for iChain,atEnd in cells.get((x,y),()):
+          if not used[iChain]:
+            end = chains[iChain][-1 if atEnd else 0]
+            if numpy.hypot(*(end-point)) <= tolerance:
+              found.append((iChain,atEnd))
+    return found
+
+  def turn(back,tail,neighbour):
+    # counter clockwise angle from the way back to the way out
+    iChain,atEnd = neighbour
+    out = chains[iChain][-2 if atEnd else 1]-tail
+    return (numpy.arctan2(out[1],out[0])-numpy.arctan2(back[1],back[0])) % (2*numpy.pi)
+
+  used = numpy.zeros(len(chains),dtype=bool)
+  openChains = []
+  for iChain in range(len(chains)):
+    if used[iChain]:
+      continue
+    used[iChain] = True
+    pieces = [chains[iChain]]
+    joints = []
+    nPoints = len(chains[iChain])
+    atJunction = False
+    turnedBack = False
+    while True:
+      tail = pieces[-1][-1]
+      if len(pieces) > 1 and numpy.hypot(*(tail-pieces[0][0])) <= tolerance:
+        loop = numpy.concatenate([pieces[0]]+[piece[1:] for piece in pieces[1:]])[:-1]
+        loops.extend(splitLoop(loop,joints,tolerance) if atJunction else [loop])
+        break
+      found = findNeighbours(tail,used)
+      if not found:
+        if turnedBack:
+          openChains.append(numpy.concatenate([pieces[0]]+[piece[1:] for piece in pieces[1:]]))
+          break
+        # a dead end, carry on from the other end so the piece is whole
+        turnedBack = True
+        pieces = [piece[::-1] for piece in pieces[::-1]]
+        joints = [nPoints-1-k for k in joints[::-1]]
+        continue
+      if len(found) > 1:
+        atJunction = True
+        back = pieces[-1][-2]-tail
+        found.sort(key=lambda neighbour: turn(back,tail,neighbour))
+      iNext,atEnd = found[0]
+      used[iNext] = True
+      nextChain = chains[iNext]
+      pieces.append(nextChain[::-1] if atEnd else nextChain)
+      joints.append(nPoints-1)
+      nPoints += len(nextChain)-1
+  return loops,openChains
+
+def cleanLoop(loop,tolerance=1e-9):
+  """
+  Drops repeated points from a loop, and points in the middle of a straight
+  run so the caps and walls meet at the same vertices.
+  """
+  step = numpy.hypot(*(numpy.roll(loop,-1,axis=0)-loop).T)
+  loop = loop[step > tolerance]
+  before = loop-numpy.roll(loop,1,axis=0)
+  after = numpy.roll(loop,-1,axis=0)-loop
+  cross = before[:,0]*after[:,1]-before[:,1]*after[:,0]
+  dot = (before*after).sum(axis=1)
+  lengths = numpy.hypot(*before.T)*numpy.hypot(*after.T)
+  return loop[(numpy.abs(cross) > tolerance*lengths) | (dot <= 0.)]
+
+def signedArea(loop):
+  x,y = loop[:,0],loop[:,1]
+  return 0.5*(numpy.dot(x,numpy.roll(y,-1))-numpy.dot(y,numpy.roll(x,-1)))
+
+def pointInLoop(point,loop):
+  """
+  Even-odd test of whether point is inside loop.
+  """
+  a = loop
+  b = numpy.roll(loop,-1,axis=0)
+  crosses = (a[:,1] > point[1]) != (b[:,1] > point[1])
+  with numpy.errstate(divide='ignore',invalid='ignore'):
+    x = a[:,0]+(point[1]-a[:,1])*(b[:,0]-a[:,0])/(b[:,1]-a[:,1])
+  return bool(numpy.count_nonzero(crosses & (point[0] < x)) % 2)
+
+def nestLoops(loops):
+  """
+  Groups loops into polygons.  Returns a list of (outer,holes) with the
+  outer loop counterclockwise and the holes clockwise.  A loop inside an
+  even number of others is an outer loop, otherwise it is a hole of the
+  smallest loop around it.
+  """
+  areas = numpy.array([abs(signedArea(loop)) for loop in loops])
+  inside = [[j for j in range(len(loops)) if j != i and areas[j] > areas[i] and pointInLoop(loops[i][0],loops[j])] for i in range(len(loops))]
+  polygons = {}
+  holes = []
+  for i,loop in enumerate(loops):
+    if len(inside[i]) % 2 == 0:
+      polygons[i] = (loop if signedArea(loop) > 0 else loop[::-1],[])
+    else:
+      holes.append(i)
+  for i in holes:
+    parent = min(inside[i],key=lambda j: areas[j])
+    if parent in polygons:
+      polygons[parent][1].append(loops[i] if signedArea(loops[i]) < 0 else loops[i][::-1])
+  return [polygons[i] for i in sorted(polygons)]
+
+def segmentsCross(p,q,a,b):
+  """
+  Whether segment p-q properly crosses any of the segments a[i]-b[i].
+  """
+  def orient(u,v,w):
+    return (v[...,0]-u[...,0])*(w[...,1]-u[...,1])-(v[...,1]-u[...,1])*(w[...,0]-u[...,0])
+  d1 = orient(a,b,p)
+  d2 = orient(a,b,q)
+  d3 = orient(p,q,a)
+  d4 = orient(p,q,b)
+  return bool(numpy.any((d1*d2 < 0) & (d3*d4 < 0)))
+
+def bridgeHoles(outer,holes):
+  """
+  Joins the holes into the outer loop with zero width cuts so the polygon
+  can be triangulated as a single loop.
+  """
+  holes = sorted(holes,key=lambda hole: -hole[:,0].max())
+  for iHole,hole in enumerate(holes):
+    iPoint = int(hole[:,0].argmax())
+    point = hole[iPoint]
+    others = [outer]+holes[iHole:]
+    a = numpy.vstack(others)
+    b = numpy.vstack([numpy.roll(loop,-1,axis=0) for loop in others])
+    for iOuter in numpy.argsort(numpy.hypot(*(outer-point).T)).tolist():
+      if not segmentsCross(point,outer[iOuter],a,b):
+        break
+    outer = numpy.vstack((outer[:iOuter+1],numpy.roll(hole,-iPoint,axis=0),hole[iPoint:iPoint+1],outer[iOuter:]))
+  return outer
+
+def findEars(points,eps,chunk=1<<20):
+  """
+  Which corners of the closed polygon points are ears: convex, with no
+  reflex corner inside or on the triangle they make with their neighbours.
+  Copies of the triangle's own corners, which bridges make, don't count.
+  """
+  before = numpy.roll(points,1,axis=0)
+  after = numpy.roll(points,-1,axis=0)
+  cross = (points[:,0]-before[:,0])*(after[:,1]-points[:,1])-(points[:,1]-before[:,1])*(after[:,0]-points[:,0])
+  ears = cross > eps
+  reflex = points[~ears]
+  candidates = numpy.flatnonzero(ears)
+  step = max(1,chunk//max(1,len(reflex)))
+  for first in range(0,len(candidates),step):
+    index = candidates[first:first+step]
+    corners = numpy.stack((before[index],points[index],after[index]),axis=1)[:,:,numpy.newaxis,:]
+    inside = numpy.ones((len(index),len(reflex)),dtype=bool)
+    for k in range(3):
+      u = corners[:,k]
+      v = corners[:,(k+1)%3]
+      inside &= (v[...,0]-u[...,0])*(reflex[:,1]-u[...,1])-(v[...,1]-u[...,1])*(reflex[:,0]-u[...,0]) >= -eps
+      inside &= (reflex != u).any(axis=2)
+    ears[index] = ~inside.any(axis=1)
+  return ears,cross
+
+def triangulateLoop(loop):
+  """
+  Ear clips a counterclockwise loop.  Returns an (m,3) array of indices
+  into loop.  Every round finds all the ears at once and clips as many as
+  it can without clipping two neighbours.
+  """
+  ring = numpy.arange(len(loop))
+  if len(ring) < 3:
+    return numpy.zeros((0,3),dtype=int)
+  eps = 1e-12*(numpy.abs(loop).max()+1.)**2
+  triangles = []
+  while len(ring) > 3:
+    ears,cross = findEars(loop[ring],eps)
+    # collinear corners are clipped too, as slivers, so the cap edges still
+    # match the walls
+    ears |= numpy.abs(cross) <= eps
+    if not ears.any():
+      ears[numpy.argmax(cross)] = True
+    # every other corner of each run of ears
+    starts = ears & ~numpy.roll(ears,1)
+    runStart = numpy.maximum.accumulate(numpy.where(starts,numpy.arange(len(ring)),0))
+    clip = ears & ((numpy.arange(len(ring))-runStart) % 2 == 0)
+    if clip[0] and clip[-1]:
+      clip[-1] = False
+    clip[numpy.flatnonzero(clip)[len(ring)-3:]] = False
+    index = numpy.flatnonzero(clip)
+    triangles.append(numpy.stack((ring[index-1],ring[index],ring[(index+1) % len(ring)]),axis=1))
+    ring = ring[~clip]
+  triangles.append(ring[numpy.newaxis])
+  return numpy.concatenate(triangles)
+
+def extrudeLoops(loops,depth):
+  """
+  Triangles (m,3,3) of the prism of height depth over the closed loops,
+  with outward facing windings.
+  """
+  loops = [cleanLoop(loop) for loop in loops]
+  loops = [loop for loop in loops if len(loop) >= 3]
+  triangles = []
+  for outer,holes in nestLoops(loops):
+    merged = bridgeHoles(outer,holes)
+    cap = merged[triangulateLoop(merged)]
+    bottom = numpy.concatenate((cap[:,::-1],numpy.zeros(cap.shape[:2]+(1,))),axis=2)
+    top = numpy.concatenate((cap,numpy.full(cap.shape[:2]+(1,),float(depth))),axis=2)
+    triangles.extend((bottom,top))
+    for loop in [outer]+holes:
+      a = loop
+      b = numpy.roll(loop,-1,axis=0)
+      zero = numpy.zeros((len(loop),1))
+      height = numpy.full((len(loop),1),float(depth))
+      a0 = numpy.hstack((a,zero))
+      b0 = numpy.hstack((b,zero))
+      a1 = numpy.hstack((a,height))
+      b1 = numpy.hstack((b,height))
+      triangles.append(numpy.stack((a0,b0,b1),axis=1))
+      triangles.append(numpy.stack((a0,b1,a1),axis=1))
+  if not triangles:
+    return numpy.zeros((0,3,3))
+  return numpy.concatenate(triangles)
+
+def writeBinarySTL(triangles,fileName):
+  """
+  Writes (m,3,3) triangles to fileName as binary STL.
+  """
+  triangles = numpy.asarray(triangles,dtype=numpy.float64)
+  normals = numpy.cross(triangles[:,1]-triangles[:,0],triangles[:,2]-triangles[:,0])
+  lengths = numpy.sqrt((normals**2).sum(axis=1))
+  normals /= numpy.where(lengths > 0.,lengths,1.)[:,numpy.newaxis]
+  records = numpy.zeros(len(triangles),dtype=STL_DTYPE)
+  records['normal'] = normals
+  records['vertices'] = triangles
+  with open(fileName,"wb") as stlFile:
+    stlFile.write(b"feynmanExtrude binary STL".ljust(80,b" "))
+    stlFile.write(numpy.array([len(records)],dtype='<u4').tobytes())
+    stlFile.write(records.tobytes())
+
+def formatEnds(chains,flipY=False):
+  sign = -1. if flipY else 1.
+  return ", ".join("(%g,%g)-(%g,%g)" % (chain[0][0],sign*chain[0][1],chain[-1][0],sign*chain[-1][1]) for chain in chains)
+
+def extrudePath(path,depth,tolerance=0.05,allowOpen=False):
+  """
+  Triangles of the prism over everything a PathBuffer draws, with y flipped
+  so that, seen from above, the model looks like the SVG.  Returns
+  (triangles,nOpen) with nOpen the number of outlines that didn't close,
+  which are left out.  Raises ValueError if there are any, unless allowOpen.
+  """
+  polylines = flattenCommands(*path.commandArrays(),tolerance=tolerance)
+  loops,openChains = stitchLoops([polyline*(1.,-1.) for polyline in polylines])
+  if openChains and not allowOpen:
+    raise ValueError("%d outlines don't close, their ends are at %s" % (len(openChains),formatEnds(openChains,flipY=True)))
+  return extrudeLoops(loops,depth),len(openChains)
+
+def arcPoints(start,through,end,tolerance=0.05):
+  """
+  Points after start along the circular arc from start through through to
+  end, with chords that stay within tolerance of the arc.
+  """
+  (ax,ay),(bx,by),(cx,cy) = start,through,end
+  d = 2.*(ax*(by-cy)+bx*(cy-ay)+cx*(ay-by))
+  ux = ((ax**2+ay**2)*(by-cy)+(bx**2+by**2)*(cy-ay)+(cx**2+cy**2)*(ay-by))/d
+  uy = ((ax**2+ay**2)*(cx-bx)+(bx**2+by**2)*(ax-cx)+(cx**2+cy**2)*(bx-ax))/d
+  radius = numpy.hypot(ax-ux,ay-uy)
+  angles = numpy.arctan2((ay-uy,by-uy,cy-uy),(ax-ux,bx-ux,cx-ux))
+  sweep = (angles[2]-angles[0]) % (2*numpy.pi)
+  if (angles[1]-angles[0]) % (2*numpy.pi) > sweep:
+    sweep -= 2*numpy.pi
+  n = segmentCount(abs(sweep),radius,tolerance)
+  steps = angles[0]+sweep*numpy.arange(1,n)/n
+  points = numpy.column_stack((ux+radius*numpy.cos(steps),uy+radius*numpy.sin(steps)))
+  return numpy.vstack((points,[end]))
+
+def segmentCount(angle,radius,tolerance):
+  """
+  How many chords an arc of angle and radius needs to stay within tolerance.
+  """
+  if tolerance >= radius:
+    return max(1,int(numpy.ceil(angle/(numpy.pi/2.))))
+  return max(1,int(numpy.ceil(angle/(2.*numpy.arccos(1.-tolerance/radius)))))
+
+def componentLoop(spec,tolerance=0.05):
+  """
+  The outline of a feynmanLayout.diagramComponents component as an (n,2)
+  loop, with its arcs flattened to within tolerance.
+  """
+  kind,origin,endPoint,width,depth = spec
+  if kind == "circle":
+    n = max(segmentCount(2*numpy.pi,width,tolerance),3)
+    angles = 2*numpy.pi*numpy.arange(n)/n
+    points = width*numpy.column_stack((numpy.cos(angles),numpy.sin(angles)))
+  elif kind == "wiggle":
+    pieces = [numpy.zeros((1,2))]
+    current = (0.,0.)
+    for edge in wiggleOutline(endPoint,width=width):
+      if edge[0] == "arc":
+        pieces.append(arcPoints(current,edge[1],edge[2],tolerance))
+      else:
+        pieces.append(numpy.array([edge[1]]))
+      current = edge[-1]
+    points = numpy.vstack(pieces)
+  else:
+    points = numpy.array(lineOutline(endPoint,width),dtype=float)
+  return points+numpy.array(origin,dtype=float)
+
+def pointsInLoop(points,loop,chunk=1<<20):
+  """
+  pointInLoop for an (n,2) array of points at once.
+  """
+  a = loop
+  b = numpy.roll(loop,-1,axis=0)
+  with numpy.errstate(divide='ignore',invalid='ignore'):
+    slope = (b[:,0]-a[:,0])/(b[:,1]-a[:,1])
+  inside = numpy.zeros(len(points),dtype=bool)
+  step = max(1,chunk//max(1,len(loop)))
+  for start in range(0,len(points),step):
+    p = points[start:start+step,numpy.newaxis]
+    crosses = (a[:,1] > p[...,1]) != (b[:,1] > p[...,1])
+    x = a[:,0]+(p[...,1]-a[:,1])*slope
+    inside[start:start+step] = numpy.count_nonzero(crosses & (p[...,0] < x),axis=1) % 2 == 1
+  return inside
+
+def unionLoops(loops):
+  """
+  Outline of the union of the regions inside the simple loops, as (loops,
+  openChains) like stitchLoops.  Each loop is split where it crosses the
+  others, the pieces inside another loop are dropped and the rest are
+  stitched back together.  Edges that lie along each other's aren't
+  handled, the model has none.
+  """
+  loops = [loop if signedArea(loop) > 0 else loop[::-1] for loop in loops]
+  lower = [loop.min(axis=0) for loop in loops]
+  upper = [loop.max(axis=0) for loop in loops]
+
+  def overlap(i,j):
+    return i != j and numpy.all(lower[i] <= upper[j]) and numpy.all(lower[j] <= upper[i])
+
+  # where each loop's edges cross the other loops, as edge index plus the
+  # fraction along the edge, with the same crossing point for both loops
+  cuts = [[] for loop in loops]
+  for i in range(len(loops)):
+    for j in range(i+1,len(loops)):
+      if not overlap(i,j):
+        continue
+      a = loops[i]
+      r = numpy.roll(a,-1,axis=0)-a
+      c = loops[j]
+      s = numpy.roll(c,-1,axis=0)-c
+      denominator = r[:,numpy.newaxis,0]*s[:,1]-r[:,numpy.newaxis,1]*s[:,0]
+      qp = c-a[:,numpy.newaxis]
+      with numpy.errstate(divide='ignore',invalid='ignore'):
+        t = (qp[...,0]*s[:,1]-qp[...,1]*s[:,0])/denominator
+        u = (qp[...,0]*r[:,numpy.newaxis,1]-qp[...,1]*r[:,numpy.newaxis,0])/denominator
+      iEdge,jEdge = numpy.nonzero((denominator != 0.) & (t > 0.) & (t < 1.) & (u > 0.) & (u < 1.))
+      if len(iEdge):
+        tCut = t[iEdge,jEdge]
+        points = a[iEdge]+tCut[:,numpy.newaxis]*r[iEdge]
+        cuts[i].append((iEdge+tCut,points))
+        cuts[j].append((jEdge+u[iEdge,jEdge],points))
+  chains = []
+  result = []
+  for i,loop in enumerate(loops):
+    positions = numpy.concatenate([numpy.arange(len(loop),dtype=float)]+[position for position,points in cuts[i]])
+    points = numpy.vstack([loop]+[points for position,points in cuts[i]])
+    points = points[numpy.argsort(positions,kind='stable')]
+    middles = 0.5*(points+numpy.roll(points,-1,axis=0))
+    keep = numpy.ones(len(points),dtype=bool)
+    for j in range(len(loops)):
+      if overlap(i,j):
+        keep &= ~pointsInLoop(middles,loops[j])
+    if keep.all():
+      result.append(points)
+      continue
+    # runs of kept edges, starting after a dropped one
+    first = int(numpy.flatnonzero(~keep)[0])+1
+    points = numpy.roll(points,-first,axis=0)
+    keep = numpy.roll(keep,-first)
+    edges = numpy.flatnonzero(keep)
+    if len(edges) == 0:
+      continue
+    breaks = numpy.flatnonzero(numpy.diff(edges) > 1)+1
+    for run in numpy.split(edges,breaks):
+      chains.append(numpy.vstack((points[run],points[(run[-1]+1) % len(points)])))
+  loops,openChains = stitchLoops(chains)
+  return result+loops,openChains
+
+def diagramLoops(tolerance=0.05,**values):
+  """
+  The outline of the feynmanDiagram model, from the same layout and outline
+  arithmetic as its CadQuery components, as (loops,openChains,depth).
+  values override DIAGRAM_DEFAULTS.
+  """
+  parameters = dict(DIAGRAM_DEFAULTS)
+  parameters.update(values)
+  specs = diagramComponents(parameters)
+  loops,openChains = unionLoops([componentLoop(spec,tolerance) for spec in specs])
+  return loops,openChains,parameters['thickness']
+
+def extrudeDiagram(tolerance=0.05,allowOpen=False,**values):
+  """
+  Triangles of the feynmanDiagram model, values overriding DIAGRAM_DEFAULTS.
+  Returns (triangles,nOpen) like extrudePath.
+  """
+  loops,openChains,depth = diagramLoops(tolerance,**values)
+  if openChains and not allowOpen:
+    raise ValueError("%d outlines don't close, their ends are at %s" % (len(openChains),formatEnds(openChains)))
+  return extrudeLoops(loops,depth),len(openChains)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Extrudes feynman diagram outlines to binary STL without CadQuery")
+  subparsers = parser.add_subparsers(dest="command")
+  sheetParser = subparsers.add_parser("sheet",help="extrude everything on a named SVG sheet")
+  sheetParser.add_argument("name",help="sheet name, see feynmanGraphSVG.py list")
+  sheetParser.add_argument("--depth",type=float,default=3.,help="thickness in mm")
+  diagramParser = subparsers.add_parser("diagram",help="extrude the feynmanDiagram model")
+  diagramParser.add_argument("--set",action="append",default=[],metavar="NAME=VALUE",help="set a feynmanDiagram parameter, can be given more than once")
+  for subparser in (sheetParser,diagramParser):
+    subparser.add_argument("--out",default="output.stl",help="STL file to write")
+    subparser.add_argument("--tolerance",type=float,default=0.05,help="how far the flattened outline may stray from the curves, in mm")
+    subparser.add_argument("--allow-open",action="store_true",help="leave out outlines that don't close instead of failing")
+  args = parser.parse_args(argv)
+  if args.command is None:
+    parser.print_help()
+    return 0
+  if args.command == "sheet":
+    if args.name not in feynmanGraphSVG.SHEETS:
+      parser.error("unknown sheet %s, choose from: %s" % (args.name," ".join(feynmanGraphSVG.SHEETS)))
+    path = feynmanGraphSVG.PathBuffer()
+    feynmanGraphSVG.SHEETS[args.name][0](path)
+  else:
+    try:
+      values = parseSettings(args.set,DIAGRAM_DEFAULTS)
+    except ValueError as error:
+      parser.error(str(error))
+  try:
+    if args.command == "sheet":
+      triangles,nOpen = extrudePath(path,args.depth,args.tolerance,args.allow_open)
+    else:
+      triangles,nOpen = extrudeDiagram(args.tolerance,args.allow_open,**values)
+  except ValueError as error:
+    print("%s, pass --allow-open to leave them out" % error)
+    return 1
+  writeBinarySTL(triangles,args.out)
+  print("%d triangles written to %s" % (len(triangles),args.out))
+  if nOpen:
+    print("%d outlines didn't close and were left out" % nOpen)
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
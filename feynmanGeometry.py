@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+"""
+Geometry of the paths drawn by feynmanGraphSVG.
+
+The q, c and A commands the primitives emit bulge out past their end points,
+so bounding boxes are found from the extrema of each segment: the roots of
+the derivative for the quadratic and cubic Beziers and the axis crossing
+angles of the ellipse for the arcs.  Everything is vectorized over all the
+segments of a path at once.
+"""
+
+import numpy
+import feynmanGraphSVG
+from feynmanGraphSVG import PATH_COMMANDS,PATH_ARITY
+
+IS_ABSOLUTE = numpy.array([cmd.isupper() for cmd in PATH_COMMANDS])
+IS_MOVE = numpy.array([cmd in "Mm" for cmd in PATH_COMMANDS])
+IS_ARC = numpy.array([cmd in "Aa" for cmd in PATH_COMMANDS])
+
+def toAbsolute(codes,coords):
+  """
+  Rewrites path commands with absolute coordinates.  Returns (codes,coords,
+  previous) where codes are all upper case and previous (n,2) holds the
+  current point before each command.
+  """
+  codes = numpy.asarray(codes)
+  coords = numpy.asarray(coords,dtype=numpy.float64)
+  arity = PATH_ARITY[codes]
+  starts = numpy.cumsum(arity)-arity
+  # the end point of every command is its last coordinate pair
+  endIndex = starts+arity-2
+  ends = numpy.stack((coords[endIndex],coords[endIndex+1]),axis=1) if len(codes) else numpy.zeros((0,2))
+  isAbsolute = IS_ABSOLUTE[codes]
+  # current point after command i is the last absolute end point plus the
+  # relative moves since then
+  relative = numpy.where(isAbsolute[:,numpy.newaxis],0.,ends)
+  relativeSum = numpy.cumsum(relative,axis=0)
+  lastAbsolute = numpy.maximum.accumulate(numpy.where(isAbsolute,numpy.arange(len(codes)),-1)) if len(codes) else numpy.zeros(0,dtype=int)
+  base = numpy.zeros((len(codes),2))
+  hasAbsolute = lastAbsolute >= 0
+  base[hasAbsolute] = ends[lastAbsolute[hasAbsolute]]-relativeSum[lastAbsolute[hasAbsolute]]
+  current = base+relativeSum
+  previous = numpy.vstack((numpy.zeros((1,2)),current[:-1]))
+  origin = numpy.where(isAbsolute[:,numpy.newaxis],0.,previous)
+  # shift every x,y pair by the origin, except the radii, rotation and flags
+  # of arcs
+  iCommand = numpy.repeat(numpy.arange(len(codes)),arity)
+  local = numpy.arange(len(coords))-starts[iCommand]
+  isArc = IS_ARC[codes][iCommand]
+  shifted = ~isArc | (local >= 5)
+  axis = (local-5*isArc) % 2
+  absCoords = coords+numpy.where(shifted,origin[iCommand,axis],0.)
+  return codes-codes % 2,absCoords,previous
+
+def absoluteSegments(codes,coords):
+  """
+  Converts path commands to absolute segments, dropping the moves.  Returns a
+  dict of arrays:
+
+    'lines'  (n,2,2) start and end points
+    'quads'  (n,3,2) start, control and end points
+    'cubics' (n,4,2) start, two control and end points
+    'arcs'   (n,2,2) start and end points, plus 'arcParams' (n,5) with
+             rx, ry, x axis rotation in degrees, large arc and sweep flags
+  """
+  codes,coords,previous = toAbsolute(codes,coords)
+  arity = PATH_ARITY[codes]
+  starts = numpy.cumsum(arity)-arity
+
+  def points(cmd,nPoints):
+    mask = codes == PATH_COMMANDS.index(cmd)
+    index = starts[mask][:,numpy.newaxis]+numpy.arange(2*nPoints)
+    result = coords[index].reshape(-1,nPoints,2)
+    return numpy.concatenate((previous[mask][:,numpy.newaxis,:],result),axis=1)
+
+  segments = {}
+  segments['lines'] = points("L",1)
+  segments['quads'] = points("Q",2)
+  segments['cubics'] = points("C",3)
+  arcMask = codes == PATH_COMMANDS.index("A")
+  arcCoords = coords[starts[arcMask][:,numpy.newaxis]+numpy.arange(7)].reshape(-1,7)
+  segments['arcs'] = numpy.stack((previous[arcMask],arcCoords[:,5:7]),axis=1)
+  segments['arcParams'] = arcCoords[:,:5]
+  return segments
+
+def quadBounds(quads):
+  """
+  (n,4) xmin,ymin,xmax,ymax of each quadratic Bezier in the (n,3,2) quads.
+  """
+  p0,c,p1 = quads[:,0],quads[:,1],quads[:,2]
+  denominator = p0-2*c+p1
+  with numpy.errstate(divide='ignore',invalid='ignore'):
+    t = numpy.where(denominator != 0.,(p0-c)/denominator,0.)
+  t = numpy.clip(t,0.,1.)
+  extreme = (1-t)**2*p0+2*(1-t)*t*c+t**2*p1
+  return numpy.hstack((numpy.minimum(numpy.minimum(p0,p1),extreme),numpy.maximum(numpy.maximum(p0,p1),extreme)))
+
+def cubicBounds(cubics):
+  """
+  (n,4) xmin,ymin,xmax,ymax of each cubic Bezier in the (n,4,2) cubics.
+  """
+  p0,c1,c2,p1 = cubics[:,0],cubics[:,1],cubics[:,2],cubics[:,3]
+  # derivative / 3 = a t^2 + b t + c
+  a = -p0+3*c1-3*c2+p1
+  b = 2*(p0-2*c1+c2)
+  c = c1-p0
+  discriminant = b**2-4*a*c
+  sqrtDisc = numpy.sqrt(numpy.maximum(discriminant,0.))
+  with numpy.errstate(divide='ignore',invalid='ignore'):
+    isQuadratic = numpy.abs(a) > 1e-12
+    t1 = numpy.where(isQuadratic,(-b+sqrtDisc)/(2*a),numpy.where(b != 0.,-c/b,0.))
+    t2 = numpy.where(isQuadratic,(-b-sqrtDisc)/(2*a),t1)
+  noRoot = isQuadratic & (discriminant < 0.)
+  lo = numpy.minimum(p0,p1)
+  hi = numpy.maximum(p0,p1)
+  for t in (t1,t2):
+    t = numpy.where(noRoot,0.,numpy.clip(numpy.nan_to_num(t),0.,1.))
+    point = (1-t)**3*p0+3*(1-t)**2*t*c1+3*(1-t)*t**2*c2+t**3*p1
+    lo = numpy.minimum(lo,point)
+    hi = numpy.maximum(hi,point)
+  return numpy.hstack((lo,hi))
+
+def arcCenters(arcs,arcParams):
+  """
+  Converts SVG end point arcs to center form following the SVG spec.
+  Returns (center (n,2), rx, ry, phi in radians, theta1, deltaTheta).
+  """
+  p0,p1 = arcs[:,0],arcs[:,1]
+  rx = numpy.abs(arcParams[:,0])
+  ry = numpy.abs(arcParams[:,1])
+  phi = numpy.radians(arcParams[:,2])
+  largeArc = arcParams[:,3] != 0
+  sweep = arcParams[:,4] != 0
+  cosPhi = numpy.cos(phi)
+  sinPhi = numpy.sin(phi)
+  half = (p0-p1)/2.
+  x1 = cosPhi*half[:,0]+sinPhi*half[:,1]
+  y1 = -sinPhi*half[:,0]+cosPhi*half[:,1]
+  with numpy.errstate(divide='ignore',invalid='ignore'):
+    scale = numpy.sqrt(numpy.maximum(x1**2/rx**2+y1**2/ry**2,1.))
+    rx = rx*scale
+    ry = ry*scale
+    numerator = rx**2*ry**2-rx**2*y1**2-ry**2*x1**2
+    coef = numpy.sqrt(numpy.maximum(numerator/(rx**2*y1**2+ry**2*x1**2),0.))
+    coef = numpy.where(largeArc == sweep,-coef,coef)
+    cx1 = coef*rx*y1/ry
+    cy1 = -coef*ry*x1/rx
+    ux = (x1-cx1)/rx
+    uy = (y1-cy1)/ry
+    vx = (-x1-cx1)/rx
+    vy = (-y1-cy1)/ry
+  mid = (p0+p1)/2.
+  center = numpy.stack((cosPhi*cx1-sinPhi*cy1+mid[:,0],sinPhi*cx1+cosPhi*cy1+mid[:,1]),axis=1)
+  theta1 = numpy.arctan2(uy,ux)
+  deltaTheta = numpy.mod(numpy.arctan2(vy,vx)-theta1,2*numpy.pi)
+  deltaTheta = numpy.where(~sweep & (deltaTheta > 0.),deltaTheta-2*numpy.pi,deltaTheta)
+  return center,rx,ry,phi,theta1,deltaTheta
+
+def arcBounds(arcs,arcParams):
+  """
+  (n,4) xmin,ymin,xmax,ymax of each elliptical arc.
+  """
+  lo = numpy.minimum(arcs[:,0],arcs[:,1])
+  hi = numpy.maximum(arcs[:,0],arcs[:,1])
+  if len(arcs) == 0:
+    return numpy.hstack((lo,hi))
+  center,rx,ry,phi,theta1,deltaTheta = arcCenters(arcs,arcParams)
+  valid = numpy.isfinite(center).all(axis=1) & (rx > 0.) & (ry > 0.)
+  cosPhi = numpy.cos(phi)
+  sinPhi = numpy.sin(phi)
+  thetaX = numpy.arctan2(-ry*sinPhi,rx*cosPhi)
+  thetaY = numpy.arctan2(ry*cosPhi,rx*sinPhi)
+  for theta in (thetaX,thetaX+numpy.pi,thetaY,thetaY+numpy.pi):
+    # is theta within the swept angle, going in the sweep direction?
+    along = numpy.where(deltaTheta >= 0.,numpy.mod(theta-theta1,2*numpy.pi),numpy.mod(theta1-theta,2*numpy.pi))
+    inside = valid & (along <= numpy.abs(deltaTheta))
+    point = numpy.stack((
+      center[:,0]+rx*cosPhi*numpy.cos(theta)-ry*sinPhi*numpy.sin(theta),
+      center[:,1]+rx*sinPhi*numpy.cos(theta)+ry*cosPhi*numpy.sin(theta),
+    ),axis=1)
+    lo = numpy.where(inside[:,numpy.newaxis],numpy.minimum(lo,point),lo)
+    hi = numpy.where(inside[:,numpy.newaxis],numpy.maximum(hi,point),hi)
+  return numpy.hstack((lo,hi))
+
+def segmentBounds(segments):
+  """
+  (n,4) bounds of every segment returned by absoluteSegments, lines first,
+  then quads, cubics and arcs.
+  """
+  lines = segments['lines']
+  return numpy.vstack((
+    numpy.hstack((lines.min(axis=1),lines.max(axis=1))).reshape(-1,4),
+    quadBounds(segments['quads']).reshape(-1,4),
+    cubicBounds(segments['cubics']).reshape(-1,4),
+    arcBounds(segments['arcs'],segments['arcParams']).reshape(-1,4),
+  ))
+
+def commandsBBox(codes,coords):
+  """
+  (xmin,ymin,xmax,ymax) of everything the commands draw, or None if they
+  don't draw anything.
+  """
+  bounds = segmentBounds(absoluteSegments(codes,coords))
+  if len(bounds) == 0:
+    return None
+  return tuple(numpy.hstack((bounds[:,:2].min(axis=0),bounds[:,2:].max(axis=0))).tolist())
+
+def pathBBox(path):
+  """
+  Bounding box of a PathBuffer.
+  """
+  return commandsBBox(*path.commandArrays())
+
+def primitiveBBox(primitive,p1,p2,**kwargs):
+  """
+  Bounding box of the line primitive(path,p1,p2,**kwargs) would draw.
+  """
+  path = feynmanGraphSVG.PathBuffer()
+  primitive(path,p1,p2,**kwargs)
+  return pathBBox(path)
+
+def diagramBBox(diagram):
+  """
+  Bounding box of a feynmanGraphSVG.Diagram.
+  """
+  path = feynmanGraphSVG.PathBuffer()
+  diagram.render(path)
+  return pathBBox(path)
@@ -1,9 +1,389 @@
 #!/usr/bin/env python
 
+import os
+import sys
+import time
+import collections
+import argparse
+import functools
+import inspect
+import json
+import re
+import concurrent.futures
+from xml.sax.saxutils import escape
 import numpy
 import svgwrite
 from math import sqrt,pi
 
+PATH_COMMANDS = "MmLlQqCcAa"
+PATH_CODES = dict((cmd,i) for i,cmd in enumerate(PATH_COMMANDS))
+PATH_ARITY = numpy.array([2,2,2,2,4,4,6,6,7,7])
+PATH_COMMANDS_ARC = numpy.array([c in "Aa" for c in PATH_COMMANDS])
+PATH_TOKEN = re.compile(r"[A-Za-z]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+def pathTokens(elements):
+  """
+  Flattens svgwrite style path elements (d strings, command letters, numbers
+  and nested sequences of them) into command letters and floats.
+  """
+  for element in elements:
+    if element is None:
+      continue
+    if isinstance(element,str):
+      for token in PATH_TOKEN.findall(element):
+        yield token if token.isalpha() else float(token)
+    elif isinstance(element,(list,tuple,numpy.ndarray)):
+      for token in pathTokens(element):
+        yield token
+    else:
+      yield float(element)
+
+class PathBuffer(svgwrite.path.Path):
+  """
+  An svgwrite path that stores its commands as an array of command codes plus
+  a flat float64 array of coordinates.  Primitives append straight into the
+  arrays and the d attribute is only formatted once, when the drawing is saved.
+
+  If precision is given, the d attribute is written by a PathEncoder with that
+  many decimals and bytesSaved records how much shorter it came out.
+  """
+
+  def __init__(self,d=None,precision=None,**extra):
+    self.codes = numpy.zeros(64,dtype=numpy.uint8)
+    self.coords = numpy.zeros(256,dtype=numpy.float64)
+    self.nCodes = 0
+    self.nCoords = 0
+    self.precision = precision
+    self.bytesSaved = 0
+    super(PathBuffer,self).__init__(d,**extra)
+
+  def _reserve(self,nCodes,nCoords):
+    if self.nCodes+nCodes > len(self.codes):
+      self.codes = numpy.resize(self.codes,max(2*len(self.codes),self.nCodes+nCodes))
+    if self.nCoords+nCoords > len(self.coords):
+      self.coords = numpy.resize(self.coords,max(2*len(self.coords),self.nCoords+nCoords))
+
+  def append(self,cmd,values):
+    """
+    Appends a single command, values being the command's coordinates.
+    """
+    code = PATH_CODES[cmd]
+    nValues = PATH_ARITY[code]
+    self._reserve(1,nValues)
+    self.codes[self.nCodes] = code
+    self.coords[self.nCoords:self.nCoords+nValues] = values
+    self.nCodes += 1
+    self.nCoords += nValues
+
+  def extend(self,cmd,values):
+    """
+    Appends len(values) copies of command cmd, values being an (n,arity) array.
+    """
+    values = numpy.asarray(values,dtype=numpy.float64)
+    self.extendCommands(cmd*len(values),values)
+
+  def extendCommands(self,cmds,coords):
+    """
+    Appends the commands in the string or list cmds, taking their coordinates
+    in order from the flat sequence coords.
+    """
+    self.extendCodes(numpy.array([PATH_CODES[cmd] for cmd in cmds],dtype=numpy.uint8),coords)
+
+  def extendCodes(self,codes,coords):
+    """
+    extendCommands taking an array of command codes instead of letters.
+    """
+    coords = numpy.asarray(coords,dtype=numpy.float64).ravel()
+    if PATH_ARITY[codes].sum() != len(coords):
+      raise ValueError("Wrong number of coordinates for path commands "+"".join(PATH_COMMANDS[code] for code in codes))
+    self._reserve(len(codes),len(coords))
+    self.codes[self.nCodes:self.nCodes+len(codes)] = codes
+    self.coords[self.nCoords:self.nCoords+len(coords)] = coords
+    self.nCodes += len(codes)
+    self.nCoords += len(coords)
+
+  def push(self,*elements):
+    """
+    svgwrite style push, taking ['l',x,y] lists, d strings or loose letters
+    and numbers, kept so old scripts still work.  Coordinates after a
+    complete command repeat it, as in SVG, a move repeating as a line.
+    """
+    cmd = None
+    values = []
+    for token in pathTokens(elements):
+      if isinstance(token,str):
+        if token not in PATH_CODES:
+          raise ValueError("Unsupported path command %s, PathBuffer only stores %s" % (token,PATH_COMMANDS))
+        if values:
+          raise ValueError("Path command %s has %d coordinates, it needs %d" % (cmd,len(values),PATH_ARITY[PATH_CODES[cmd]]))
+        cmd = token
+        continue
+      if cmd is None:
+        raise ValueError("Path data has to start with a command")
+      values.append(token)
+      if len(values) == PATH_ARITY[PATH_CODES[cmd]]:
+        self.append(cmd,values)
+        values = []
+        cmd = {'M':'L','m':'l'}.get(cmd,cmd)
+    if values:
+      raise ValueError("Path command %s has %d coordinates, it needs %d" % (cmd,len(values),PATH_ARITY[PATH_CODES[cmd]]))
+
+  def commandArrays(self):
+    """
+    Returns the (codes,coords) arrays actually in use.
+    """
+    return self.codes[:self.nCodes],self.coords[:self.nCoords]
+
+  def toD(self):
+    """
+    Formats the whole command buffer as an SVG path d string.
+    """
+    codes,coords = self.commandArrays()
+    d = formatPathData(codes,coords)
+    if self.precision is None:
+      return d
+    compact = PathEncoder(self.precision).encode(codes,coords)
+    self.bytesSaved = len(d)-len(compact)
+    return compact
+
+  def get_xml(self):
+    d = self.toD()
+    if self.precision is None:
+      self.attribs['d'] = d
+      return super(svgwrite.path.Path,self).get_xml()
+    # svgwrite's validator doesn't accept the compact syntax, so only add
+    # the d attribute after it has checked the others
+    self.attribs.pop('d',None)
+    xml = super(svgwrite.path.Path,self).get_xml()
+    attribs = dict(xml.attrib,d=d)
+    xml.attrib.clear()
+    for name in sorted(attribs):
+      xml.set(name,attribs[name])
+    return xml
+
+class StreamingDrawing(object):
+  """
+  Drop-in for the svgwrite.Drawing calls the sheets use that writes the SVG
+  file as it is drawn instead of holding the whole document in memory.  Paths
+  made with path() write their d data out in chunks as the primitives fill
+  them, so memory use does not grow with the size of the sheet.  Only one
+  path can be open at a time; add() closes it.
+  """
+
+  def __init__(self,filename,size=("100%","100%"),viewBox=None):
+    self.filename = filename
+    self.openPath = None
+    self.file = open(filename,'w',encoding='utf-8')
+    attribs = {'baseProfile':'full','version':'1.1','width':size[0],'height':size[1]}
+    if viewBox is not None:
+      attribs['viewBox'] = viewBox
+    attribs['xmlns'] = 'http://www.w3.org/2000/svg'
+    attribs['xmlns:ev'] = 'http://www.w3.org/2001/xml-events'
+    attribs['xmlns:xlink'] = 'http://www.w3.org/1999/xlink'
+    self.file.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+    self.file.write('<svg %s><defs />' % formatAttributes(attribs))
+
+  def path(self,precision=None,**attribs):
+    if self.openPath is not None:
+      raise ValueError("Only one streaming path can be open at a time")
+    self.openPath = StreamingPath(self.file,precision=precision,**attribs)
+    return self.openPath
+
+  def add(self,path):
+    if path is not self.openPath:
+      raise ValueError("Can only add the currently open streaming path")
+    path.close()
+    self.openPath = None
+
+  def save(self):
+    if self.openPath is not None:
+      self.add(self.openPath)
+    self.file.write('</svg>')
+    self.file.close()
+
+class StreamingPath(PathBuffer):
+  """
+  PathBuffer that writes its commands out to an open file every flushSize
+  commands, as part of a StreamingDrawing.
+  """
+
+  def __init__(self,file,flushSize=4096,precision=None,**attribs):
+    self.file = file
+    self.flushSize = flushSize
+    self.pathAttribs = attribs
+    self.nWritten = 0
+    self.encoder = None
+    if precision is not None:
+      self.encoder = PathEncoder(precision)
+    super(StreamingPath,self).__init__()
+    self.file.write('<path d="')
+
+  def append(self,cmd,values):
+    super(StreamingPath,self).append(cmd,values)
+    if self.nCodes >= self.flushSize:
+      self.flush()
+
+  def extendCodes(self,codes,coords):
+    super(StreamingPath,self).extendCodes(codes,coords)
+    if self.nCodes >= self.flushSize:
+      self.flush()
+
+  def flush(self):
+    if self.nCodes == 0:
+      return
+    d = self.toD()
+    if self.encoder is not None:
+      # the encoder carries its state over from the previous chunk
+      compact = self.encoder.encode(*self.commandArrays())
+      self.bytesSaved += len(d)+(self.nWritten > 0)-len(compact)
+      d = compact
+    elif self.nWritten:
+      self.file.write(' ')
+    self.file.write(d)
+    self.nWritten += self.nCodes
+    self.nCodes = 0
+    self.nCoords = 0
+
+  def close(self):
+    self.flush()
+    self.file.write('" %s />' % formatAttributes(self.pathAttribs))
+
+def formatAttributes(attribs):
+  """
+  Formats XML attributes the way svgwrite does: python style names with
+  underscores become dashes and attributes are sorted by name.
+  """
+  attribs = dict((name.replace('_','-'),value) for name,value in attribs.items())
+  return " ".join('%s="%s"' % (name,escape(str(attribs[name]),{'"':'&quot;'})) for name in sorted(attribs))
+
+def formatPathData(codes,coords):
+  """
+  Formats command codes and flat coordinates as a d string in one pass: all
+  the numbers are formatted together and then interleaved with the letters.
+  """
+  if len(codes) == 0:
+    return ""
+  arity = PATH_ARITY[codes]
+  valueStrs = [repr(v) for v in coords.tolist()]
+  # arc rotation and flags are written as integers
+  arcStarts = (numpy.cumsum(arity)-arity)[PATH_COMMANDS_ARC[codes]]
+  for iArc in arcStarts.tolist():
+    for i in range(iArc+2,iArc+5):
+      valueStrs[i] = "%d" % coords[i]
+  tokens = numpy.empty(len(codes)+len(coords),dtype=object)
+  letterPos = numpy.cumsum(arity+1)-arity-1
+  isLetter = numpy.zeros(len(tokens),dtype=bool)
+  isLetter[letterPos] = True
+  tokens[letterPos] = numpy.array(list(PATH_COMMANDS),dtype=object)[codes]
+  tokens[~isLetter] = valueStrs
+  return " ".join(tokens.tolist())
+
+class PathEncoder(object):
+  """
+  Writes path commands as compact d data: coordinates rounded to precision
+  decimals without trailing zeros or leading "0", separators only where the
+  next number would otherwise run on, repeated command letters dropped and
+  runs of moves merged into one.  Relative coordinates are taken from the
+  rounded current point so rounding errors don't add up along a path.  The
+  state carries over between encode calls, so a path can be encoded in chunks.
+  """
+
+  def __init__(self,precision=3):
+    self.precision = precision
+    self.scale = 10**precision
+    self.current = numpy.zeros(2)
+    self.qCurrent = (0,0)
+    self.lastCmd = None
+    self.lastToken = ""
+    self.pendingMove = None
+
+  def quantize(self,point):
+    return (int(numpy.floor(point[0]*self.scale+0.5)),int(numpy.floor(point[1]*self.scale+0.5)))
+
+  def formatNumber(self,n):
+    if self.precision == 0:
+      return str(n)
+    digits = str(abs(n)).rjust(self.precision+1,'0')
+    intPart = digits[:-self.precision]
+    fracPart = digits[-self.precision:].rstrip('0')
+    result = intPart
+    if fracPart:
+      if intPart == '0':
+        intPart = ''
+      result = intPart+'.'+fracPart
+    if n < 0:
+      result = '-'+result
+    return result
+
+  def emit(self,tokens,cmd,numbers):
+    if cmd != self.lastCmd or cmd in 'Mm':
+      tokens.append(cmd)
+      self.lastToken = cmd
+    self.lastCmd = cmd
+    for number in numbers:
+      if self.lastToken[-1:].isdigit() or self.lastToken[-1:] == '.':
+        if not (number[0] == '-' or (number[0] == '.' and '.' in self.lastToken)):
+          tokens.append(' ')
+      tokens.append(number)
+      self.lastToken = number
+
+  def emitPoints(self,tokens,cmd,points):
+    """
+    Emits points (absolute) for cmd, relative to the rounded current point if
+    cmd is lower case, and moves the current point to the last one.
+    """
+    numbers = []
+    for point in points:
+      q = self.quantize(point)
+      if cmd.islower():
+        q = (q[0]-self.qCurrent[0],q[1]-self.qCurrent[1])
+      numbers.extend([self.formatNumber(q[0]),self.formatNumber(q[1])])
+    self.emit(tokens,cmd,numbers)
+    self.current = numpy.array(points[-1])
+    self.qCurrent = self.quantize(self.current)
+
+  def flushMove(self,tokens):
+    if self.pendingMove is not None:
+      cmd,point = self.pendingMove
+      self.pendingMove = None
+      self.emitPoints(tokens,cmd,[point])
+
+  def encode(self,codes,coords):
+    tokens = []
+    iCoord = 0
+    for code in codes.tolist():
+      cmd = PATH_COMMANDS[code]
+      nValues = PATH_ARITY[code]
+      values = coords[iCoord:iCoord+nValues]
+      iCoord += nValues
+      origin = self.current
+      if cmd.isupper():
+        origin = numpy.zeros(2)
+      if cmd in 'Mm':
+        # only the end of a run of moves matters
+        point = origin+values
+        if self.pendingMove is None:
+          self.pendingMove = (cmd,point)
+        else:
+          self.pendingMove = (self.pendingMove[0],point)
+        self.current = point
+        continue
+      self.flushMove(tokens)
+      if cmd in 'Aa':
+        end = origin+values[5:7]
+        q = self.quantize(end)
+        if cmd == 'a':
+          q = (q[0]-self.qCurrent[0],q[1]-self.qCurrent[1])
+        numbers = [self.formatNumber(int(numpy.floor(v*self.scale+0.5))) for v in values[0:2]]
+        numbers += ["%d" % v for v in values[2:5]]
+        numbers += [self.formatNumber(q[0]),self.formatNumber(q[1])]
+        self.emit(tokens,cmd,numbers)
+        self.current = end
+        self.qCurrent = self.quantize(end)
+      else:
+        self.emitPoints(tokens,cmd,list(origin+values.reshape(-1,2)))
+    return "".join(tokens)
+
 def subtractVertexDistance(p1,p2,width):
   p1 = numpy.array(p1,dtype=numpy.dtype(float))
   p2 = numpy.array(p2,dtype=numpy.dtype(float))
@@ -13,11 +393,14 @@ def subtractVertexDistance(p1,p2,width):
   normedPerpVec = numpy.array([-normedPropVec[1],normedPropVec[0]])
   return p1+width*normedPropVec,p2-width*normedPropVec
 
-def rotate(p1,angle):
-  p1 = numpy.array(p1,dtype=numpy.dtype(float))
+def rotationMatrix(angle):
   angle *= numpy.pi/180.
-  rotMatrix = numpy.array([[numpy.cos(angle), -numpy.sin(angle)], 
+  return numpy.array([[numpy.cos(angle), -numpy.sin(angle)], 
                    [numpy.sin(angle),  numpy.cos(angle)]])
+
+def rotate(p1,angle):
+  p1 = numpy.array(p1,dtype=numpy.dtype(float))
+  rotMatrix = rotationMatrix(angle)
   result =  rotMatrix.dot(p1)
   return result
 
@@ -33,6 +416,327 @@ def makeEndPoints(p1,p2,width):
   normedPerpVec = numpy.array([-normedPropVec[1],normedPropVec[0]])
   return (p1+normedPerpVec*width/2.,p1-normedPerpVec*width/2.),(p2+normedPerpVec*width/2.,p2-normedPerpVec*width/2.)
 
+primitiveOptionsCache = {}
+
+def primitiveOptions(primitive):
+  """
+  The names and defaults of a line primitive's options, the arguments after
+  path, p1 and p2.  Worked out once per primitive.
+  """
+  options = primitiveOptionsCache.get(primitive)
+  if options is None:
+    parameters = list(inspect.signature(primitive).parameters.values())[3:]
+    options = (tuple(parameter.name for parameter in parameters),dict((parameter.name,parameter.default) for parameter in parameters))
+    primitiveOptionsCache[primitive] = options
+  return options
+
+class ShapeCache(object):
+  """
+  Bounded LRU cache of line primitive geometry.
+
+  A line's commands only depend on its length and the primitive's options,
+  so each shape is drawn once along the x axis from the origin and later
+  copies are just rotated and translated onto their end points.  Keeps hits
+  and misses counters.
+  """
+
+  def __init__(self,maxSize=256):
+    self.maxSize = maxSize
+    self.shapes = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def key(self,primitive,length,kwargs,precision=9):
+    """
+    Identifies a shape by the primitive, its length rounded to precision
+    decimals and all its options, defaults filled in.
+    """
+    names,defaults = primitiveOptions(primitive)
+    for name in kwargs:
+      if name not in defaults:
+        raise TypeError("%s() got an unexpected keyword argument '%s'" % (primitive.__name__,name))
+    options = tuple([kwargs.get(name,defaults[name]) for name in names])
+    return (primitive.__name__,round(length,precision),options)
+
+  def localShape(self,primitive,length,kwargs,key=None):
+    """
+    Returns (codes,coords,isAbsolute,ends) of the shape drawn from the origin
+    along x, drawing and storing it on a miss.
+    """
+    if key is None:
+      key = self.key(primitive,length,kwargs)
+    shape = self.shapes.get(key)
+    if shape is not None:
+      self.hits += 1
+      self.shapes.move_to_end(key)
+      return shape
+    self.misses += 1
+    local = PathBuffer()
+    ends = primitive(local,(0.,0.),(length,0.),**kwargs)
+    codes,coords = local.commandArrays()
+    # every coordinate pair of an upper case command is an absolute point
+    isAbsolute = numpy.repeat(numpy.array([cmd.isupper() for cmd in PATH_COMMANDS])[codes],PATH_ARITY[codes]//2)
+    shape = (codes.copy(),coords.reshape(-1,2).copy(),isAbsolute,numpy.array(ends))
+    self.shapes[key] = shape
+    if self.maxSize is not None and len(self.shapes) > self.maxSize:
+      self.shapes.popitem(last=False)
+    return shape
+
+  def draw(self,primitive,path,p1,p2,kwargs):
+    """
+    Draws primitive(path,p1,p2,**kwargs) from the cache and returns its ends.
+    """
+    p1,length,angle = linePlacement(p1,p2)
+    shape = self.localShape(primitive,length,kwargs)
+    return placeShape(path,shape,p1,angle)
+
+def linePlacement(p1,p2):
+  """
+  Returns p1 as an array, the length of the line p1-p2 and its angle in
+  degrees: what places a shape drawn along x from the origin onto p1-p2.
+  """
+  p1 = numpy.array(p1,dtype=numpy.dtype(float))
+  p2 = numpy.array(p2,dtype=numpy.dtype(float))
+  propVec = p2-p1
+  length = sqrt(numpy.dot(propVec,propVec))
+  return p1,length,numpy.arctan2(propVec[1],propVec[0])*180./numpy.pi
+
+def placeShape(path,shape,p1,angle):
+  """
+  Appends a ShapeCache shape to path, rotated by angle degrees about the
+  origin and moved to p1.  Returns the shape's ends, moved the same way.
+  """
+  codes,points,isAbsolute,ends = shape
+  rotMatrix = rotationMatrix(angle)
+  points = points.dot(rotMatrix.T)
+  points[isAbsolute] += p1
+  path.extendCodes(codes,points)
+  ends = ends.dot(rotMatrix.T)+p1
+  return (tuple(ends[0]),tuple(ends[1]))
+
+class SymbolPath(PathBuffer):
+  """
+  PathBuffer that keeps line primitives as symbols: each distinct line shape
+  goes into <defs> once and every line is a <use> of it, rotated and
+  translated into place.  Vertex arcs are drawn into this path as usual.
+  Call addTo(dwg) instead of dwg.add(path).  With flatten, addTo expands all
+  the uses back into this one path for cutters that can't handle <use>.
+
+  Line lengths are rounded to lengthPrecision decimals, by default the
+  output precision or 3 without one, so lines that only differ below that
+  share a symbol.
+  """
+
+  def __init__(self,d=None,flatten=False,lengthPrecision=None,**extra):
+    self.flatten = flatten
+    self.symbols = ShapeCache(maxSize=None)
+    self.symbolIds = {}
+    self.symbolPaths = []
+    self.uses = []
+    super(SymbolPath,self).__init__(d,**extra)
+    if lengthPrecision is None:
+      lengthPrecision = 3 if self.precision is None else self.precision
+    self.lengthPrecision = lengthPrecision
+
+  def placeLine(self,primitive,p1,p2,kwargs):
+    """
+    Records a use of the line primitive(path,p1,p2,**kwargs), returning its ends.
+    """
+    p1,length,angle = linePlacement(p1,p2)
+    length = round(length,self.lengthPrecision)
+    key = self.symbols.key(primitive,length,kwargs)
+    shape = self.symbols.localShape(primitive,length,kwargs,key)
+    if key not in self.symbolIds:
+      self.symbolIds[key] = "%s%d" % (primitive.__name__,len(self.symbolIds))
+    self.uses.append((key,p1,angle))
+    codes,points,isAbsolute,ends = shape
+    ends = ends.dot(rotationMatrix(angle).T)+p1
+    return (tuple(ends[0]),tuple(ends[1]))
+
+  def addTo(self,dwg):
+    if self.flatten:
+      for key,p1,angle in self.uses:
+        placeShape(self,self.symbols.shapes[key],p1,angle)
+      dwg.add(self)
+      return
+    attribs = dict((name,value) for name,value in self.attribs.items() if name not in ('d','id'))
+    for key,symbolId in self.symbolIds.items():
+      codes,points,isAbsolute,ends = self.symbols.shapes[key]
+      symbol = PathBuffer(factory=dwg,id=symbolId,precision=self.precision,**attribs)
+      symbol.extendCodes(codes,points)
+      self.symbolPaths.append(symbol)
+      dwg.defs.add(symbol)
+    for key,p1,angle in self.uses:
+      dwg.add(dwg.use('#'+self.symbolIds[key],transform=self.formatTransform(p1,angle)))
+    if self.nCodes:
+      dwg.add(self)
+
+  def formatTransform(self,p1,angle):
+    """
+    The transform attribute of a use, rounded like the path data if there
+    is an output precision.  The angle gets two more decimals since its
+    error grows along the line.
+    """
+    if self.precision is None:
+      return "translate(%r %r) rotate(%r)" % (float(p1[0]),float(p1[1]),float(angle))
+    translate = PathEncoder(self.precision)
+    rotate = PathEncoder(self.precision+2)
+    x,y = translate.quantize(p1)
+    return "translate(%s %s) rotate(%s)" % (translate.formatNumber(x),translate.formatNumber(y),rotate.formatNumber(int(numpy.floor(angle*rotate.scale+0.5))))
+
+shapeCache = None
+
+def enableShapeCache(maxSize=256):
+  """
+  Routes the line primitives through a new module level ShapeCache, or turns
+  caching off again if maxSize is 0.
+  """
+  global shapeCache
+  shapeCache = None
+  if maxSize > 0:
+    shapeCache = ShapeCache(maxSize)
+  return shapeCache
+
+class RenderStats(object):
+  """
+  Call counts, wall time, path commands and bytes of path data emitted per
+  sheet and per primitive, collected by the instrumented decorator while
+  enabled with enableStats.  Rows are keyed by (sheet,primitive).
+  """
+
+  FIELDS = ('calls','seconds','commands','bytes')
+
+  def __init__(self):
+    self.sheet = None
+    self.rows = collections.OrderedDict()
+
+  def record(self,name,seconds,commands=0,nBytes=0,calls=1):
+    row = self.rows.setdefault((self.sheet,name),[0,0.,0,0])
+    row[0] += calls
+    row[1] += seconds
+    row[2] += commands
+    row[3] += nBytes
+
+  def asDicts(self,sheet=None):
+    """
+    The rows as a list of dicts, only for the given sheet if one is given.
+    """
+    return [dict(zip(('sheet','primitive')+self.FIELDS,key+tuple(row))) for key,row in self.rows.items() if sheet is None or key[0] == sheet]
+
+  def merge(self,rows):
+    """
+    Adds in rows from asDicts, as returned by worker processes.
+    """
+    for row in rows:
+      key = (row['sheet'],row['primitive'])
+      total = self.rows.setdefault(key,[0,0.,0,0])
+      for i,field in enumerate(self.FIELDS):
+        total[i] += row[field]
+
+  def table(self):
+    """
+    Formats the rows, plus totals per primitive, as a text table.
+    """
+    totals = collections.OrderedDict()
+    for (sheet,name),row in self.rows.items():
+      total = totals.setdefault(name,[0,0.,0,0])
+      for i in range(4):
+        total[i] += row[i]
+    lines = ["%-14s %-18s %8s %11s %9s %10s" % ("sheet","primitive","calls","time","commands","bytes")]
+    rows = list(self.rows.items())+[(("total",name),row) for name,row in totals.items()]
+    for (sheet,name),(calls,seconds,commands,nBytes) in rows:
+      lines.append("%-14s %-18s %8d %9.2fms %9d %10d" % (sheet,name,calls,1e3*seconds,commands,nBytes))
+    return "\n".join(lines)
+
+stats = None
+
+def enableStats(enable=True):
+  """
+  Starts collecting RenderStats in the module level stats, or turns it off.
+  """
+  global stats
+  stats = RenderStats() if enable else None
+  return stats
+
+def emittedCommands(path):
+  return getattr(path,'nWritten',0)+path.nCodes
+
+# number of instrumented calls in progress, calls made from inside another
+# are counted in the outer one's row only
+instrumentedDepth = 0
+
+def instrumented(primitive):
+  """
+  Decorator recording calls of a drawing function in stats.  When stats is
+  off this costs one global lookup per call.
+  """
+  name = primitive.__name__
+  @functools.wraps(primitive)
+  def wrapper(path,*args,**kwargs):
+    global instrumentedDepth
+    if stats is None or instrumentedDepth or not isinstance(path,PathBuffer):
+      return primitive(path,*args,**kwargs)
+    # hold back streaming flushes so the new commands can be measured
+    flushSize = getattr(path,'flushSize',None)
+    if flushSize is not None:
+      path.flushSize = sys.maxsize
+    nCodes = path.nCodes
+    nCoords = path.nCoords
+    start = time.perf_counter()
+    instrumentedDepth += 1
+    try:
+      result = primitive(path,*args,**kwargs)
+    finally:
+      instrumentedDepth -= 1
+    seconds = time.perf_counter()-start
+    codes = path.codes[nCodes:path.nCodes]
+    coords = path.coords[nCoords:path.nCoords]
+    if path.precision is None:
+      nBytes = len(formatPathData(codes,coords))
+    else:
+      nBytes = len(PathEncoder(path.precision).encode(codes,coords))
+    stats.record(name,seconds,len(codes),nBytes)
+    if flushSize is not None:
+      path.flushSize = flushSize
+      if path.nCodes >= flushSize:
+        path.flush()
+    return result
+  return wrapper
+
+def plainPath(primitive):
+  """
+  Decorator letting a drawing function draw on a plain svgwrite path as well
+  as a PathBuffer: it draws into a PathBuffer and pushes the result onto the
+  path as d data.
+  """
+  @functools.wraps(primitive)
+  def wrapper(path,*args,**kwargs):
+    if isinstance(path,PathBuffer):
+      return primitive(path,*args,**kwargs)
+    buffer = PathBuffer()
+    result = primitive(buffer,*args,**kwargs)
+    if buffer.nCodes:
+      path.push(formatPathData(*buffer.commandArrays()))
+    return result
+  return wrapper
+
+def cachedShape(primitive):
+  """
+  Decorator letting shapeCache, when enabled, serve calls of a line primitive,
+  and turning calls on a SymbolPath into symbol uses.
+  """
+  @functools.wraps(primitive)
+  def wrapper(path,p1,p2,*args,**kwargs):
+    if isinstance(path,SymbolPath) and not args:
+      return path.placeLine(primitive,p1,p2,kwargs)
+    if shapeCache is None or args or not isinstance(path,PathBuffer):
+      return primitive(path,p1,p2,*args,**kwargs)
+    return shapeCache.draw(primitive,path,p1,p2,kwargs)
+  return wrapper
+
+@plainPath
+@instrumented
+@cachedShape
 def wavyLine(path,p1,p2,capped1=True,capped2=True,amp=7.,period=23.0,width=5.0):
   p1,p2 = subtractVertexDistance(p1,p2,width)
   width2 = 1.5*width
@@ -55,42 +759,47 @@ def wavyLine(path,p1,p2,capped1=True,capped2=True,amp=7.,period=23.0,width=5.0):
   #print "distance: ",distance
   #print "nOsc: ",nOsc
   #print "period: ",period
-  nExtra = 0
   quartWidthPropVec = 0.25*width*normedPropVec
-  path.push(['M']+list(p1))
+  # Every oscillation is the same 4 relative q commands, so build that block
+  # once per side and tile it out to a (nOsc*4,4) array of control/end points
+  oscForward = numpy.array([
+    numpy.concatenate((propVec+ampVec+quartWidthPropVec,2*propVec+ampVec+2*quartWidthPropVec)),
+    numpy.concatenate((propVec+quartWidthPropVec,2*propVec-ampVec+2*quartWidthPropVec)),
+    numpy.concatenate((propVec-ampVec,2*propVec-ampVec)),
+    numpy.concatenate((propVec,2*propVec+ampVec)),
+  ])
+  propVec *= -1
+  ampVec *= -1
+  oscBackward = numpy.array([
+    numpy.concatenate((propVec+ampVec-quartWidthPropVec,2*propVec+ampVec-2*quartWidthPropVec)),
+    numpy.concatenate((propVec-quartWidthPropVec,2*propVec-ampVec-2*quartWidthPropVec)),
+    numpy.concatenate((propVec-ampVec,2*propVec-ampVec)),
+    numpy.concatenate((propVec,2*propVec+ampVec)),
+  ])
+  oscForward = numpy.tile(oscForward,(nOsc,1))
+  oscBackward = numpy.tile(oscBackward,(nOsc,1))
+  path.append('M',p1)
   if capped1:
-    path.push(['l']+list(normedPerpVec*width2/2.))
+    path.append('l',normedPerpVec*width2/2.)
   else:
-    path.push(['m']+list(normedPerpVec*width2/2.))
-  for iOsc in range(nOsc):
-    path.push(['q']+list(propVec+ampVec+quartWidthPropVec)+list(2*propVec+ampVec+2*quartWidthPropVec))
-    path.push(['q']+list(propVec+quartWidthPropVec)+list(2*propVec-ampVec+2*quartWidthPropVec))
-    nExtra+=4
-    path.push(['q']+list(propVec-ampVec)+list(2*propVec-ampVec))
-    path.push(['q']+list(propVec)+list(2*propVec+ampVec))
-  path.push(['l']+list(2*quartWidthPropVec))
-  nExtra+=2
+    path.append('m',normedPerpVec*width2/2.)
+  path.extend('q',oscForward)
+  path.append('l',2*quartWidthPropVec)
   if capped2:
-    path.push(['l']+list(-normedPerpVec*width2))
+    path.append('l',-normedPerpVec*width2)
   else:
-    path.push(['m']+list(-normedPerpVec*width2))
-  propVec *= -1
-  ampVec *= -1
-  for iOsc in range(nOsc):
-    path.push(['q']+list(propVec+ampVec-quartWidthPropVec)+list(2*propVec+ampVec-2*quartWidthPropVec))
-    path.push(['q']+list(propVec-quartWidthPropVec)+list(2*propVec-ampVec-2*quartWidthPropVec))
-    nExtra+=4
-    path.push(['q']+list(propVec-ampVec)+list(2*propVec-ampVec))
-    path.push(['q']+list(propVec)+list(2*propVec+ampVec))
-  path.push(['l']+list(-2*quartWidthPropVec))
-  nExtra+=2
+    path.append('m',-normedPerpVec*width2)
+  path.extend('q',oscBackward)
+  path.append('l',-2*quartWidthPropVec)
   if capped1:
-    path.push(['l']+list(normedPerpVec*width2/2.))
+    path.append('l',normedPerpVec*width2/2.)
   else:
-    path.push(['m']+list(normedPerpVec*width2/2.))
-  #print "nExtra",nExtra
+    path.append('m',normedPerpVec*width2/2.)
   return makeEndPoints(p1,p2,width2)
 
+@plainPath
+@instrumented
+@cachedShape
 def spiralLine(path,p1,p2,capped1=True,capped2=True,amp=23.0,period=23.0,width=5.):
   width2 = width
   widthSF = 0.97
@@ -105,8 +814,6 @@ def spiralLine(path,p1,p2,capped1=True,capped2=True,amp=23.0,period=23.0,width=5
   period = distance/nLoops
   normedPropVec = propVec/distance
   normedPerpVec = numpy.array([-normedPropVec[1],normedPropVec[0]])
-  ampVec = amp*normedPerpVec
-  propVec /= nLoops
   loopDistance = distance/nLoops
   #print "propVec: ",propVec
   #print "ampVec: ",ampVec
@@ -115,35 +822,47 @@ def spiralLine(path,p1,p2,capped1=True,capped2=True,amp=23.0,period=23.0,width=5
   #print "distance: ",distance
   #print "nLoops: ",nLoops
   #print "period: ",period
-  path.push(['M']+list(p1))
+  # Each loop is the same run of relative commands, so lay one loop out in
+  # the line's local (along,perp) frame, rotate it into place with a single
+  # matrix product and repeat it nLoops times
+  frame = numpy.array([normedPropVec,normedPerpVec])
+  backLength = loopDistance-2*width
+  innerAmp = amp-2*width
+  forwardLoop = numpy.array([
+    [0.25*loopDistance,0.],[0.5*loopDistance,-0.2*amp],
+    [0.25*loopDistance,0.2*amp],[0.5*loopDistance,0.2*amp],
+  ]).dot(frame)
+  backwardLoop = numpy.array([
+    [-0.25*backLength,0.],[-0.5*backLength,-0.16*amp],
+    [2*width,-0.5*amp],[2*width,-amp],[-width,-amp],
+    [-3*width,0.],[-3*width,0.5*amp],[-width,amp],
+    [width,-width],
+    [2*width,-0.5*innerAmp],[width,-innerAmp],[0.,-innerAmp],
+    [0.,innerAmp],
+    [-2*width,-0.5*innerAmp],[-width,-innerAmp],[0.,-innerAmp],
+    [-width,width+innerAmp],
+    [-0.25*backLength,0.16*amp],[-0.5*backLength,0.16*amp],
+  ]).dot(frame)
+  path.append('M',p1)
   if capped1:
-    path.push(['l']+list(normedPerpVec*width2/2.))
+    path.append('l',normedPerpVec*width2/2.)
   else:
-    path.push(['m']+list(normedPerpVec*width2/2.))
-  for iCrossings in range(nLoops):
-    path.push(['q']+list(0.25*propVec)+list(0.5*propVec-0.2*ampVec))
-    path.push(['q']+list(0.25*propVec+0.2*ampVec)+list(0.5*propVec+0.2*ampVec))
+    path.append('m',normedPerpVec*width2/2.)
+  path.extendCommands('qq'*nLoops,numpy.tile(forwardLoop.ravel(),nLoops))
   if capped2:
-    path.push(['l']+list(-normedPerpVec*width2))
+    path.append('l',-normedPerpVec*width2)
   else:
-    path.push(['m']+list(-normedPerpVec*width2))
-  propVec *= -1
-  for iCrossings in range(nLoops):
-    path.push(['q']+list(-0.25*(loopDistance-2*width)*normedPropVec)+list(-0.5*(loopDistance-2*width)*normedPropVec-0.16*ampVec))
-    path.push(['c']+list(2*normedPropVec*width-0.5*ampVec)+list(2*normedPropVec*width-ampVec)+list(-normedPropVec*width-ampVec))
-    path.push(['c']+list(-3*normedPropVec*width)+list(-3*normedPropVec*width+0.5*ampVec)+list(-normedPropVec*width+ampVec))
-    path.push(['m']+list(normedPropVec*width-normedPerpVec*width))
-    path.push(['c']+list(2*normedPropVec*width-0.5*((amp-2*width)*normedPerpVec))+list(normedPropVec*width-((amp-2*width)*normedPerpVec))+list(-(amp-2*width)*normedPerpVec))
-    path.push(['m']+list((amp-2*width)*normedPerpVec))
-    path.push(['c']+list(-2*normedPropVec*width-0.5*((amp-2*width)*normedPerpVec))+list(-normedPropVec*width-((amp-2*width)*normedPerpVec))+list(-(amp-2*width)*normedPerpVec))
-    path.push(['m']+list(-normedPropVec*width+normedPerpVec*width+(amp-2*width)*normedPerpVec))
-    path.push(['q']+list(-0.25*(loopDistance-2*width)*normedPropVec+0.16*ampVec)+list(-0.5*(loopDistance-2*width)*normedPropVec+0.16*ampVec))
+    path.append('m',-normedPerpVec*width2)
+  path.extendCommands('qccmcmcmq'*nLoops,numpy.tile(backwardLoop.ravel(),nLoops))
   if capped1:
-    path.push(['l']+list(normedPerpVec*width2/2.))
+    path.append('l',normedPerpVec*width2/2.)
   else:
-    path.push(['m']+list(normedPerpVec*width2/2.))
+    path.append('m',normedPerpVec*width2/2.)
   return makeEndPoints(p1,p2,width2)
 
+@plainPath
+@instrumented
+@cachedShape
 def straightLine(path,p1,p2,capped1=True,capped2=True,width=5.0):
   p1,p2 = subtractVertexDistance(p1,p2,width)
   p1 = numpy.array(p1,dtype=numpy.dtype(float))
@@ -152,24 +871,27 @@ def straightLine(path,p1,p2,capped1=True,capped2=True,width=5.0):
   distance = sqrt(numpy.dot(propVec,propVec))
   normedPropVec = propVec/distance
   normedPerpVec = numpy.array([-normedPropVec[1],normedPropVec[0]])
-  path.push(['M']+list(p1))
+  path.append('M',p1)
   if capped1:
-    path.push(['l']+list(normedPerpVec*width/2.))
+    path.append('l',normedPerpVec*width/2.)
   else:
-    path.push(['m']+list(normedPerpVec*width/2.))
-  path.push(['l']+list(propVec))
+    path.append('m',normedPerpVec*width/2.)
+  path.append('l',propVec)
   if capped2:
-    path.push(['l']+list(-normedPerpVec*width))
+    path.append('l',-normedPerpVec*width)
   else:
-    path.push(['m']+list(-normedPerpVec*width))
+    path.append('m',-normedPerpVec*width)
   propVec *= -1
-  path.push(['l']+list(propVec))
+  path.append('l',propVec)
   if capped1:
-    path.push(['l']+list(normedPerpVec*width/2.))
+    path.append('l',normedPerpVec*width/2.)
   else:
-    path.push(['m']+list(normedPerpVec*width/2.))
+    path.append('m',normedPerpVec*width/2.)
   return makeEndPoints(p1,p2,width)
 
+@plainPath
+@instrumented
+@cachedShape
 def straightLineArrow(path,p1,p2,capped1=True,capped2=True,forward=True,width=5.0,arrowLength=15.0,arrowWidth=None):
   p1,p2 = subtractVertexDistance(p1,p2,width)
   if arrowWidth == None:
@@ -180,42 +902,117 @@ def straightLineArrow(path,p1,p2,capped1=True,capped2=True,forward=True,width=5.
   distance = sqrt(numpy.dot(propVec,propVec))
   normedPropVec = propVec/distance
   normedPerpVec = numpy.array([-normedPropVec[1],normedPropVec[0]])
-  path.push(['M']+list(p1))
+  path.append('M',p1)
   if capped1:
-    path.push(['l']+list(normedPerpVec*width/2.))
+    path.append('l',normedPerpVec*width/2.)
   else:
-    path.push(['m']+list(normedPerpVec*width/2.))
-  path.push(['l']+list(normedPropVec*(distance/2.-arrowLength/2.)))
+    path.append('m',normedPerpVec*width/2.)
+  path.append('l',normedPropVec*(distance/2.-arrowLength/2.))
   if forward:
-    path.push(['l']+list(normedPerpVec*arrowWidth))
-    path.push(['l']+list(normedPropVec*arrowLength-normedPerpVec*arrowWidth))
+    path.append('l',normedPerpVec*arrowWidth)
+    path.append('l',normedPropVec*arrowLength-normedPerpVec*arrowWidth)
   else:
-    path.push(['l']+list(normedPropVec*arrowLength+normedPerpVec*arrowWidth))
-    path.push(['l']+list(-normedPerpVec*arrowWidth))
-  path.push(['l']+list(normedPropVec*(distance/2.-arrowLength/2.)))
+    path.append('l',normedPropVec*arrowLength+normedPerpVec*arrowWidth)
+    path.append('l',-normedPerpVec*arrowWidth)
+  path.append('l',normedPropVec*(distance/2.-arrowLength/2.))
   if capped2:
-    path.push(['l']+list(-normedPerpVec*width))
+    path.append('l',-normedPerpVec*width)
   else:
-    path.push(['m']+list(-normedPerpVec*width))
+    path.append('m',-normedPerpVec*width)
   # Back the other way
-  path.push(['l']+list(-normedPropVec*(distance/2.-arrowLength/2.)))
+  path.append('l',-normedPropVec*(distance/2.-arrowLength/2.))
   if forward:
-    path.push(['l']+list(-normedPropVec*arrowLength-normedPerpVec*arrowWidth))
-    path.push(['l']+list(normedPerpVec*arrowWidth))
+    path.append('l',-normedPropVec*arrowLength-normedPerpVec*arrowWidth)
+    path.append('l',normedPerpVec*arrowWidth)
   else:
-    path.push(['l']+list(-normedPerpVec*arrowWidth))
-    path.push(['l']+list(-normedPropVec*arrowLength+normedPerpVec*arrowWidth))
-  path.push(['l']+list(-normedPropVec*(distance/2.-arrowLength/2.)))
+    path.append('l',-normedPerpVec*arrowWidth)
+    path.append('l',-normedPropVec*arrowLength+normedPerpVec*arrowWidth)
+  path.append('l',-normedPropVec*(distance/2.-arrowLength/2.))
   if capped1:
-    path.push(['l']+list(normedPerpVec*width/2.))
+    path.append('l',normedPerpVec*width/2.)
   else:
-    path.push(['m']+list(normedPerpVec*width/2.))
+    path.append('m',normedPerpVec*width/2.)
   return makeEndPoints(p1,p2,width)
 
+class EndIndex(object):
+  """
+  Uniform grid over all the line ends on a sheet, built once so each vertex
+  only has to look at the ends in the grid cells around it.
+
+  endLists is a list of the values returned by the line primitives.  Pass an
+  EndIndex to vertexCircle in place of the list of ends, or use vertexCircles
+  to find and draw all the vertices at once.
+  """
+
+  def __init__(self,endLists,cellSize=8.):
+    self.ends = [end for obj in endLists for end in obj]
+    self.points = numpy.array([[end[0],end[1]] for end in self.ends],dtype=numpy.dtype(float)).reshape(-1,2,2)
+    self.cellSize = cellSize
+    self.grid = {}
+    cells = numpy.floor(self.points[:,0]/cellSize).astype(int)
+    for iEnd,cell in enumerate(map(tuple,cells.tolist())):
+      self.grid.setdefault(cell,[]).append(iEnd)
+
+  def candidates(self,p1,reach):
+    """
+    Indices of the ends whose first point is in a grid cell within reach of p1.
+    """
+    lo = numpy.floor((p1-reach)/self.cellSize).astype(int)
+    hi = numpy.floor((p1+reach)/self.cellSize).astype(int)
+    result = []
+    for ix in range(lo[0],hi[0]+1):
+      for iy in range(lo[1],hi[1]+1):
+        result.extend(self.grid.get((ix,iy),[]))
+    result.sort()
+    return result
+
+  def query(self,p1,radius=5.,tolerance=1.5):
+    """
+    Returns the ends with both points within tolerance of radius from p1.
+    """
+    return self.queryAll([p1],radius,tolerance)[0]
+
+  def queryAll(self,points,radius=5.,tolerance=1.5):
+    """
+    Batch version of query, returning a list of ends for each point.
+    """
+    points = numpy.array(points,dtype=numpy.dtype(float)).reshape(-1,2)
+    iVertices = []
+    iEnds = []
+    for iVertex,p1 in enumerate(points):
+      candidates = self.candidates(p1,radius+tolerance)
+      iVertices.extend([iVertex]*len(candidates))
+      iEnds.extend(candidates)
+    iVertices = numpy.array(iVertices,dtype=int)
+    iEnds = numpy.array(iEnds,dtype=int)
+    result = [[] for p1 in points]
+    if len(iEnds) == 0:
+      return result
+    offsets = self.points[iEnds]-points[iVertices][:,numpy.newaxis,:]
+    distances = numpy.sqrt((offsets**2).sum(axis=2))
+    matches = (abs(distances-radius) < tolerance).all(axis=1)
+    for iVertex,iEnd in zip(iVertices[matches].tolist(),iEnds[matches].tolist()):
+      result[iVertex].append(self.ends[iEnd])
+    return result
+
+@plainPath
+@instrumented
+def vertexCircles(path,points,endIndex,radius=5.):
+  """
+  Draws a vertex circle at each of points, looking up all their ends in the
+  EndIndex endIndex with one batch query.
+  """
+  for p1,thisVertexEnds in zip(points,endIndex.queryAll(points,radius)):
+    vertexArcs(path,p1,thisVertexEnds)
+
+@plainPath
+@instrumented
 def vertexCircle(path,p1,endList,radius=5.):
   p1 = numpy.array(p1,dtype=numpy.dtype(float))
+  if isinstance(endList,EndIndex):
+    vertexArcs(path,p1,endList.query(p1,radius))
+    return
   thisVertexEnds = []
-  radiusList = []
   for obj in endList:
     for end in obj:
       otherPointNearVertex = False
@@ -225,11 +1022,23 @@ def vertexCircle(path,p1,endList,radius=5.):
         if abs(distance-radius) < 1.5:
           if otherPointNearVertex:
             thisVertexEnds.append(end)
-            radiusList.append(distance)
           else:
             otherPointNearVertex = True
-  newRad = numpy.mean(radiusList)
   #print "nEnds: ",len(thisVertexEnds)
+  vertexArcs(path,p1,thisVertexEnds)
+
+# vertex arcs shorter than this, in mm, are left out
+ARC_TOLERANCE = 1e-6
+
+@plainPath
+@instrumented
+def vertexArcs(path,p1,thisVertexEnds):
+  """
+  Draws the arcs of the vertex circle at p1 between the given line ends, each
+  end being the pair of points returned by a line primitive for that vertex.
+  """
+  p1 = numpy.array(p1,dtype=numpy.dtype(float))
+  newRad = numpy.mean([sqrt(numpy.dot(p1-end[1],p1-end[1])) for end in thisVertexEnds])
   endsList = []
   for end in thisVertexEnds:
     vec0 = end[0]-p1
@@ -267,20 +1076,23 @@ def vertexCircle(path,p1,endList,radius=5.):
   #  print i
   #  print end
   #print "###################"
-  #path.push(['M']+list(p1))
+  #path.append('M',p1)
   #path.push(['l']+[newRad,0.])
-  #path.push(['M']+list(p1))
+  #path.append('M',p1)
   #path.push(['l']+[0.,newRad])
   for i,end in enumerate(endsList):
     #if i != 0:
     #    continue
     #print list(endsList[i-1]['second'])
     #print list(end['first'])
-    path.push(['M']+list(endsList[i-1]['second']))
+    isSame = endsList[i] is endsList[i-1]
+    # lines that overlap at the vertex leave no gap to close
+    if not isSame and numpy.allclose(endsList[i-1]['second'],end['first'],rtol=0.,atol=ARC_TOLERANCE):
+      continue
+    path.append('M',endsList[i-1]['second'])
     advanceAngle = end['firstAngle'] - endsList[i-1]['secondAngle']
     #print end['firstAngle']*180/numpy.pi , endsList[i-1]['secondAngle']*180/numpy.pi
     #print advanceAngle*180/numpy.pi
-    isSame = endsList[i] is endsList[i-1]
     #print "isSame: ",isSame
     sweepFlag = None
     largeArc = None
@@ -306,448 +1118,677 @@ def vertexCircle(path,p1,endList,radius=5.):
       sweepFlag = 1
       largeArc = 0
     #print sweepFlag,largeArc
-    path.push(['A']+[newRad,newRad,0,largeArc,sweepFlag]+list(end['first']))
+    path.append('A',[newRad,newRad,0,largeArc,sweepFlag]+list(end['first']))
+
+LINE_PRIMITIVES = {
+  'wavy':wavyLine,
+  'spiral':spiralLine,
+  'straight':straightLine,
+  'arrow':straightLineArrow,
+}
+
+class Diagram(object):
+  """
+  A feynman graph as named vertices joined by typed edges.
 
-#dwg = svgwrite.Drawing('test.svg',size=("181mm","181mm"),viewBox="0 0 181 181")
-#dwg = svgwrite.Drawing('test.svg',size=("384mm","384mm"),viewBox="0 0 384 384")
-#dwg = svgwrite.Drawing('test.svg',size=("790mm","384mm"),viewBox="0 0 790 384")
-color = svgwrite.rgb(0, 0, 255) # for cutting
+  Edge ends are either vertex names or plain (x,y) points for external legs.
+  The adjacency index records, for each vertex, which end of which edge meets
+  it, so render() can hand every vertex exactly its own line ends instead of
+  vertexCircle searching for them.  Ends on a vertex are left uncapped and
+  free ends are capped unless capped1/capped2 are given explicitly.
+  """
+
+  def __init__(self):
+    self.vertices = {}
+    self.edges = []
+    self.adjacency = {}
+
+  def addVertex(self,name,point):
+    self.vertices[name] = numpy.array(point,dtype=numpy.dtype(float))
+    self.adjacency[name] = []
+    return name
+
+  def addEdge(self,kind,start,end,**kwargs):
+    """
+    Adds an edge drawn by LINE_PRIMITIVES[kind] and returns its index.
+    Extra keyword arguments are passed on to the primitive.
+    """
+    if kind not in LINE_PRIMITIVES:
+      raise ValueError("Unknown edge kind: "+str(kind))
+    iEdge = len(self.edges)
+    for iEnd,vertex in enumerate((start,end)):
+      if isinstance(vertex,str):
+        if vertex not in self.vertices:
+          raise ValueError("Unknown vertex: "+vertex)
+        self.adjacency[vertex].append((iEdge,iEnd))
+    self.edges.append((kind,start,end,kwargs))
+    return iEdge
+
+  def point(self,vertex):
+    if isinstance(vertex,str):
+      return self.vertices[vertex]
+    return numpy.array(vertex,dtype=numpy.dtype(float))
+
+  def render(self,path,offset=(0.,0.)):
+    """
+    Draws all edges and then all vertex circles onto path, moved by offset.
+    Returns the list of end point pairs of each edge, as the line primitives
+    return them.
+    """
+    offset = numpy.array(offset,dtype=numpy.dtype(float))
+    edgeEnds = []
+    for kind,start,end,kwargs in self.edges:
+      kwargs = dict(kwargs)
+      kwargs.setdefault('capped1',not isinstance(start,str))
+      kwargs.setdefault('capped2',not isinstance(end,str))
+      edgeEnds.append(LINE_PRIMITIVES[kind](path,self.point(start)+offset,self.point(end)+offset,**kwargs))
+    for name,point in self.vertices.items():
+      incident = [edgeEnds[iEdge][iEnd] for iEdge,iEnd in self.adjacency[name]]
+      if incident:
+        vertexArcs(path,point+offset,incident)
+    return edgeEnds
+
+colorCut = svgwrite.rgb(0, 0, 255) # for cutting
 colorEngrave = svgwrite.rgb(255, 0, 0) # for engraving
-#color = colorEngrave
-suffix = ""
-if color == colorEngrave:
-  suffix = "_engrave"
-width = "0.01mm" # production value
-width = "0.2mm" # testing value
+widthProduction = "0.01mm" # production value
+widthTesting = "0.2mm" # testing value
+
+# Ponoko sheet sizes in mm: (181,181), (384,384) and (790,384)
+SHEETS = collections.OrderedDict()
+
+def sheet(name,size):
+  """
+  Decorator registering a function that draws onto a path as the named sheet
+  of the given (width,height) in mm.
+  """
+  def register(builder):
+    SHEETS[name] = (builder,size)
+    return builder
+  return register
+
+def renderSheet(name,outDir=".",engrave=False,strokeWidth=widthTesting,stream=False,symbols=False,flatten=False,precision=None,info=None,optimize=False,dedupe=False):
+  """
+  Draws the named sheet and saves it as outDir/name.svg, or name_engrave.svg
+  in red for engraving.  With stream the file is written out as it is drawn
+  by a StreamingDrawing.  With symbols repeated line shapes are written once
+  as <defs> and placed with <use>, unless flatten is also given.  precision
+  selects compact path data with that many decimals.  dedupe removes
+  segments that would be cut twice and optimize reorders the subpaths to cut
+  down the laser head travel, both with feynmanToolpath.  Returns
+  the file name and fills in the dict info, if given, with figures about the
+  sheet.
+  """
+  builder,size = SHEETS[name]
+  suffix = ""
+  if engrave:
+    suffix = "_engrave"
+  fileName = os.path.join(outDir,name+suffix+'.svg')
+  renderDrawing(builder,size,fileName,engrave,strokeWidth,stream,symbols,flatten,precision,info,optimize,dedupe)
+  return fileName
+
+def renderDrawing(builder,size,fileName,engrave=False,strokeWidth=widthTesting,stream=False,symbols=False,flatten=False,precision=None,info=None,optimize=False,dedupe=False):
+  """
+  Saves what builder(path) draws as a (width,height) mm sheet in fileName,
+  with the same options as renderSheet.
+  """
+  if stream and symbols:
+    raise ValueError("Symbol output can't be streamed")
+  if (optimize or dedupe) and (stream or symbols):
+    raise ValueError("Toolpath passes need the whole path in one buffer")
+  color = colorCut
+  if engrave:
+    color = colorEngrave
+  sizeAttribs = dict(size=("%gmm" % size[0],"%gmm" % size[1]),viewBox="0 0 %g %g" % size)
+  if stream:
+    dwg = StreamingDrawing(fileName,**sizeAttribs)
+    path = dwg.path(precision=precision,stroke=color,stroke_width=strokeWidth,fill="none")
+  elif symbols:
+    dwg = svgwrite.Drawing(fileName,**sizeAttribs)
+    path = SymbolPath(factory=dwg,flatten=flatten,precision=precision,stroke=color,stroke_width=strokeWidth,fill="none")
+  else:
+    dwg = svgwrite.Drawing(fileName,**sizeAttribs)
+    path = PathBuffer(factory=dwg,precision=precision,stroke=color,stroke_width=strokeWidth,fill="none")
+  if stats is not None:
+    stats.sheet = statsSheet(fileName)
+  builder(path)
+  if optimize or dedupe:
+    import feynmanToolpath
+  if dedupe:
+    start = time.perf_counter()
+    duplicates = feynmanToolpath.dedupePath(path)
+    if stats is not None:
+      stats.record('dedupe',time.perf_counter()-start,path.nCodes)
+    if info is not None:
+      info['duplicates'] = duplicates
+  if optimize:
+    start = time.perf_counter()
+    travel = feynmanToolpath.optimizePath(path)
+    if stats is not None:
+      stats.record('optimize',time.perf_counter()-start,path.nCodes)
+    if info is not None:
+      info['travel'] = travel
+  start = time.perf_counter()
+  if symbols:
+    path.addTo(dwg)
+  else:
+    dwg.add(path)
+  dwg.save()
+  if stats is not None:
+    stats.record('save',time.perf_counter()-start,emittedCommands(path),os.path.getsize(fileName))
+  if info is not None and precision is not None:
+    info['bytesSaved'] = path.bytesSaved
+    if symbols:
+      info['bytesSaved'] += sum(symbol.bytesSaved for symbol in path.symbolPaths)
+
+def statsSheet(fileName):
+  """
+  The sheet name stats rows are recorded under for a drawing saved as
+  fileName.
+  """
+  return os.path.splitext(os.path.basename(fileName))[0]
+
+def timedRenderSheet(name,outDir=".",**options):
+  """
+  renderSheet, returning (name,fileName,seconds taken,info dict).  If stats
+  is on, info['stats'] holds the sheet's rows.
+  """
+  start = time.time()
+  info = {}
+  fileName = renderSheet(name,outDir,info=info,**options)
+  if stats is not None:
+    info['stats'] = stats.asDicts(statsSheet(fileName))
+  return name,fileName,time.time()-start,info
+
+def initWorker(cacheSize=0,collectStats=False):
+  enableShapeCache(cacheSize)
+  enableStats(collectStats)
+
+def renderSheets(names,outDir=".",jobs=1,cacheSize=0,**options):
+  """
+  Renders the named sheets, fanning them out over a pool of jobs worker
+  processes if jobs > 1.  Each worker writes its own file and, if cacheSize
+  is given, keeps its own ShapeCache of that size.  If stats is on, the
+  workers collect their own and their rows are merged into it.  Yields
+  (name,fileName,seconds,info) for each sheet as it finishes.
+  """
+  if jobs <= 1:
+    enableShapeCache(cacheSize)
+    for name in names:
+      yield timedRenderSheet(name,outDir,**options)
+    return
+  with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,initializer=initWorker,initargs=(cacheSize,stats is not None)) as pool:
+    futures = [pool.submit(timedRenderSheet,name,outDir,**options) for name in names]
+    for future in concurrent.futures.as_completed(futures):
+      result = future.result()
+      if stats is not None:
+        stats.merge(result[3]['stats'])
+      yield result
 
 ## Test 1 w/o vertex
-dwg = svgwrite.Drawing('test1'+suffix+'.svg',size=("181mm","181mm"),viewBox="0 0 181 181")
-path = dwg.path(None,stroke=color,stroke_width=width,fill="none")
-wlEnds = wavyLine(path,(10,70),(170,70),capped1=True,capped2=True)
-sl1Ends = straightLineArrow(path,(10,100),(170,100),forward=True,capped1=True,capped2=True)
-sl2Ends = straightLineArrow(path,(10,125),(170,125),forward=False,capped1=True,capped2=True)
-sl3Ends = straightLine(path,(10,150),(170,160),capped1=True,capped2=True)
-spEnds =  spiralLine(path,(10,40),(170,40),capped1=True,capped2=True)
-dwg.add(path)
-dwg.save()
+@sheet('test1',(181,181))
+def drawTest1(path):
+  wlEnds = wavyLine(path,(10,70),(170,70),capped1=True,capped2=True)
+  sl1Ends = straightLineArrow(path,(10,100),(170,100),forward=True,capped1=True,capped2=True)
+  sl2Ends = straightLineArrow(path,(10,125),(170,125),forward=False,capped1=True,capped2=True)
+  sl3Ends = straightLine(path,(10,150),(170,160),capped1=True,capped2=True)
+  spEnds =  spiralLine(path,(10,40),(170,40),capped1=True,capped2=True)
 
 
 ## Test 2 with vertex
-dwg = svgwrite.Drawing('test2'+suffix+'.svg',size=("181mm","181mm"),viewBox="0 0 181 181")
-path = dwg.path(None,stroke=color,stroke_width=width,fill="none")
-wlEnds = wavyLine(path,(20,70),(160,70),capped1=False,capped2=False)
-vertexCircle(path,(160,70),[wlEnds])
-vertexCircle(path,(20,70),[wlEnds])
-sl1Ends = straightLineArrow(path,(20,100),(160,100),forward=False,capped1=False,capped2=False)
-vertexCircle(path,(160,100),[sl1Ends])
-vertexCircle(path,(20,100),[sl1Ends])
-sl2Ends = straightLineArrow(path,(20,125),(160,125),forward=True,capped1=False,capped2=False)
-vertexCircle(path,(160,125),[sl2Ends])
-vertexCircle(path,(20,125),[sl2Ends])
-sl3Ends = straightLine(path,(20,150),(160,160),capped1=False,capped2=False)
-vertexCircle(path,(20,150),[sl3Ends])
-vertexCircle(path,(160,160),[sl3Ends])
-spEnds =  spiralLine(path,(20,40),(160,40),capped1=False,capped2=False)
-vertexCircle(path,(160,40),[spEnds])
-vertexCircle(path,(20,40),[spEnds])
-dwg.add(path)
-dwg.save()
+@sheet('test2',(181,181))
+def drawTest2(path):
+  wlEnds = wavyLine(path,(20,70),(160,70),capped1=False,capped2=False)
+  vertexCircle(path,(160,70),[wlEnds])
+  vertexCircle(path,(20,70),[wlEnds])
+  sl1Ends = straightLineArrow(path,(20,100),(160,100),forward=False,capped1=False,capped2=False)
+  vertexCircle(path,(160,100),[sl1Ends])
+  vertexCircle(path,(20,100),[sl1Ends])
+  sl2Ends = straightLineArrow(path,(20,125),(160,125),forward=True,capped1=False,capped2=False)
+  vertexCircle(path,(160,125),[sl2Ends])
+  vertexCircle(path,(20,125),[sl2Ends])
+  sl3Ends = straightLine(path,(20,150),(160,160),capped1=False,capped2=False)
+  vertexCircle(path,(20,150),[sl3Ends])
+  vertexCircle(path,(160,160),[sl3Ends])
+  spEnds =  spiralLine(path,(20,40),(160,40),capped1=False,capped2=False)
+  vertexCircle(path,(160,40),[spEnds])
+  vertexCircle(path,(20,40),[spEnds])
 
 ## Test 3 Diagram
-dwg = svgwrite.Drawing('test3'+suffix+'.svg',size=("181mm","181mm"),viewBox="0 0 181 181")
-path = dwg.path(None,stroke=color,stroke_width=width,fill="none")
-sl1Ends = straightLineArrow(path,(10,160),(100,120),forward=False,capped2=False)
-sl2Ends = straightLineArrow(path,(100,120),(170,160),forward=False,capped1=False)
-wgEnds = wavyLine(path,(100,55),(100,120),capped1=False,capped2=False)
-vertexCircle(path,(100,120),[sl1Ends,sl2Ends,wgEnds])
-sp1Ends = spiralLine(path,(15,25),(100,55),capped2=False)
-sp2Ends = spiralLine(path,(165,15),(100,55),capped2=False)
-vertexCircle(path,(100,55),[sp1Ends,sp2Ends,wgEnds])
-tri1 = (10,40)
-tri2 = (10,120)
-tri3 = (80,80)
-sl3Ends = straightLineArrow(path,tri1,tri2,forward=False,capped1=False,capped2=False)
-sl4Ends = straightLineArrow(path,tri2,tri3,forward=False,capped1=False,capped2=False)
-sl5Ends = straightLineArrow(path,tri3,tri1,forward=False,capped1=False,capped2=False)
-vertexCircle(path,tri1,[sl3Ends,sl5Ends])
-vertexCircle(path,tri2,[sl3Ends,sl4Ends])
-vertexCircle(path,tri3,[sl4Ends,sl5Ends])
-dwg.add(path)
-dwg.save()
+@sheet('test3',(181,181))
+def drawTest3(path):
+  diagram = Diagram()
+  diagram.addVertex('qqB',(100,120))
+  diagram.addVertex('ggB',(100,55))
+  diagram.addVertex('tri1',(10,40))
+  diagram.addVertex('tri2',(10,120))
+  diagram.addVertex('tri3',(80,80))
+  diagram.addEdge('arrow',(10,160),'qqB',forward=False)
+  diagram.addEdge('arrow','qqB',(170,160),forward=False)
+  diagram.addEdge('wavy','ggB','qqB')
+  diagram.addEdge('spiral',(15,25),'ggB')
+  diagram.addEdge('spiral',(165,15),'ggB')
+  diagram.addEdge('arrow','tri1','tri2',forward=False)
+  diagram.addEdge('arrow','tri2','tri3',forward=False)
+  diagram.addEdge('arrow','tri3','tri1',forward=False)
+  diagram.render(path)
 
 
 # Vertex Tests
-dwg = svgwrite.Drawing('testVertex.svg',size=("181mm","181mm"),viewBox="0 0 181 181")
-path = dwg.path(None,stroke=color,stroke_width=width,fill="none")
-wlEnds = wavyLine(path,(20,20),(160,20),capped1=False,capped2=False)
-vertexCircle(path,(160,20),[wlEnds])
-vertexCircle(path,(20,20),[wlEnds])
-sl1Ends = straightLineArrow(path,(20,50),(20,170),forward=False,capped1=False,capped2=False)
-vertexCircle(path,(20,170),[sl1Ends])
-vertexCircle(path,(20,50),[sl1Ends])
-sl0Ends = straightLineArrow(path,(40,70),(90,40),forward=True,capped1=False,capped2=False)
-sl4Ends = straightLineArrow(path,(170,100),(90,40),forward=True,capped1=False,capped2=False)
-vertexCircle(path,(40,70),[sl0Ends])
-vertexCircle(path,(170,100),[sl4Ends])
-vertexCircle(path,(90,40),[sl0Ends,sl4Ends])
-sl5Ends = straightLineArrow(path,(90,120),(90,40),forward=True,capped1=False,capped2=False)
-sl6Ends = straightLineArrow(path,(90,120),(40,120),forward=True,capped1=False,capped2=False)
-sl7Ends = straightLineArrow(path,(90,120),(170,120),forward=True,capped1=False,capped2=False)
-sl8Ends = straightLineArrow(path,(90,120),(90,170),forward=True,capped1=False,capped2=False)
-vertexCircle(path,(90,120),[sl5Ends,sl6Ends,sl7Ends,sl8Ends])
-dwg.add(path)
-dwg.save()
+@sheet('testVertex',(181,181))
+def drawTestVertex(path):
+  wlEnds = wavyLine(path,(20,20),(160,20),capped1=False,capped2=False)
+  sl1Ends = straightLineArrow(path,(20,50),(20,170),forward=False,capped1=False,capped2=False)
+  sl0Ends = straightLineArrow(path,(40,70),(90,40),forward=True,capped1=False,capped2=False)
+  sl4Ends = straightLineArrow(path,(170,100),(90,40),forward=True,capped1=False,capped2=False)
+  sl5Ends = straightLineArrow(path,(90,120),(90,40),forward=True,capped1=False,capped2=False)
+  sl6Ends = straightLineArrow(path,(90,120),(40,120),forward=True,capped1=False,capped2=False)
+  sl7Ends = straightLineArrow(path,(90,120),(170,120),forward=True,capped1=False,capped2=False)
+  sl8Ends = straightLineArrow(path,(90,120),(90,170),forward=True,capped1=False,capped2=False)
+  endIndex = EndIndex([wlEnds,sl1Ends,sl0Ends,sl4Ends,sl5Ends,sl6Ends,sl7Ends,sl8Ends])
+  vertexCircles(path,[(160,20),(20,20),(20,170),(20,50),(40,70),(170,100),(90,40),(90,120)],endIndex)
 
 ## test4 Toward 2 2->2 Diagrams
-dwg = svgwrite.Drawing('test4.svg',size=("384mm","384mm"),viewBox="0 0 384 384")
-path = dwg.path(None,stroke=color,stroke_width=width,fill="none")
-q1 = (10,10)
-q1p = (182,10)
-q1B = (96,268/3.+10)
-q2 = (10,278)
-q2p = (182,278)
-q2B = (96,2*268/3.+10)
-q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
-q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
-q2Ends = straightLineArrow(path,q2,q2B,forward=True,capped2=False)
-q2pEnds = straightLineArrow(path,q2p,q2B,forward=False,capped2=False)
-BEnds = wavyLine(path,q1B,q2B,capped1=False,capped2=False)
-vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
-vertexCircle(path,q2B,[q2Ends,q2pEnds,BEnds])
-q1 = numpy.array(q1)+numpy.array([192,0])
-q1p = numpy.array(q1p)+numpy.array([192,0])
-q1B = numpy.array(q1B)+numpy.array([192,0])
-q2 = numpy.array(q2)+numpy.array([192,0])
-q2p = numpy.array(q2p)+numpy.array([192,0])
-q2B = numpy.array(q2B)+numpy.array([192,0])
-q1Ends = spiralLine(path,q1,q1B,capped2=False)
-q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
-q2Ends = straightLineArrow(path,q2,q2B,forward=True,capped2=False)
-q2pEnds = spiralLine(path,q2p,q2B,capped2=False)
-BEnds = straightLineArrow(path,q1B,q2B,forward=False,capped1=False,capped2=False)
-vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
-vertexCircle(path,q2B,[q2Ends,q2pEnds,BEnds])
-tri1 = (152,140)
-tri2 = (232,140)
-tri3 = (192,75)
-g1 = (132,220)
-g2 = (252,220)
-h1 = (192,5)
-sl3Ends = straightLineArrow(path,tri1,tri2,forward=False,capped1=False,capped2=False)
-sl4Ends = straightLineArrow(path,tri2,tri3,forward=False,capped1=False,capped2=False)
-sl5Ends = straightLineArrow(path,tri3,tri1,forward=False,capped1=False,capped2=False)
-g1Ends = spiralLine(path,tri1,g1,capped1=False)
-g2Ends = spiralLine(path,g2,tri2,capped2=False)
-h1Ends = straightLine(path,tri3,h1,capped1=False)
-#h1Ends = wavyLine(path,tri3,h1,capped1=False)
-vertexCircle(path,tri1,[sl3Ends,sl5Ends,g1Ends])
-vertexCircle(path,tri2,[sl3Ends,sl4Ends,g2Ends])
-vertexCircle(path,tri3,[sl4Ends,sl5Ends,h1Ends])
-q1 = (33,380)
-q1p = (159,380)
-q1B = (96,320)
-B = (96,225)
-q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
-q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
-BEnds = spiralLine(path,q1B,B,capped1=False,capped2=True)
-vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
-q1 = numpy.array(q1)+numpy.array([192,0])
-q1p = numpy.array(q1p)+numpy.array([192,0])
-q1B = numpy.array(q1B)+numpy.array([192,0])
-B = numpy.array(B)+numpy.array([192,0])
-B[1] += 20.
-q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
-q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
-BEnds = wavyLine(path,q1B,B,capped1=False,capped2=True)
-vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
-dwg.add(path)
-dwg.save()
+@sheet('test4',(384,384))
+def drawTest4(path):
+  q1 = (10,10)
+  q1p = (182,10)
+  q1B = (96,268/3.+10)
+  q2 = (10,278)
+  q2p = (182,278)
+  q2B = (96,2*268/3.+10)
+  q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
+  q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
+  q2Ends = straightLineArrow(path,q2,q2B,forward=True,capped2=False)
+  q2pEnds = straightLineArrow(path,q2p,q2B,forward=False,capped2=False)
+  BEnds = wavyLine(path,q1B,q2B,capped1=False,capped2=False)
+  vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
+  vertexCircle(path,q2B,[q2Ends,q2pEnds,BEnds])
+  q1 = numpy.array(q1)+numpy.array([192,0])
+  q1p = numpy.array(q1p)+numpy.array([192,0])
+  q1B = numpy.array(q1B)+numpy.array([192,0])
+  q2 = numpy.array(q2)+numpy.array([192,0])
+  q2p = numpy.array(q2p)+numpy.array([192,0])
+  q2B = numpy.array(q2B)+numpy.array([192,0])
+  q1Ends = spiralLine(path,q1,q1B,capped2=False)
+  q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
+  q2Ends = straightLineArrow(path,q2,q2B,forward=True,capped2=False)
+  q2pEnds = spiralLine(path,q2p,q2B,capped2=False)
+  BEnds = straightLineArrow(path,q1B,q2B,forward=False,capped1=False,capped2=False)
+  vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
+  vertexCircle(path,q2B,[q2Ends,q2pEnds,BEnds])
+  tri1 = (152,140)
+  tri2 = (232,140)
+  tri3 = (192,75)
+  g1 = (132,220)
+  g2 = (252,220)
+  h1 = (192,5)
+  sl3Ends = straightLineArrow(path,tri1,tri2,forward=False,capped1=False,capped2=False)
+  sl4Ends = straightLineArrow(path,tri2,tri3,forward=False,capped1=False,capped2=False)
+  sl5Ends = straightLineArrow(path,tri3,tri1,forward=False,capped1=False,capped2=False)
+  g1Ends = spiralLine(path,tri1,g1,capped1=False)
+  g2Ends = spiralLine(path,g2,tri2,capped2=False)
+  h1Ends = straightLine(path,tri3,h1,capped1=False)
+  #h1Ends = wavyLine(path,tri3,h1,capped1=False)
+  vertexCircle(path,tri1,[sl3Ends,sl5Ends,g1Ends])
+  vertexCircle(path,tri2,[sl3Ends,sl4Ends,g2Ends])
+  vertexCircle(path,tri3,[sl4Ends,sl5Ends,h1Ends])
+  q1 = (33,380)
+  q1p = (159,380)
+  q1B = (96,320)
+  B = (96,225)
+  q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
+  q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
+  BEnds = spiralLine(path,q1B,B,capped1=False,capped2=True)
+  vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
+  q1 = numpy.array(q1)+numpy.array([192,0])
+  q1p = numpy.array(q1p)+numpy.array([192,0])
+  q1B = numpy.array(q1B)+numpy.array([192,0])
+  B = numpy.array(B)+numpy.array([192,0])
+  B[1] += 20.
+  q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
+  q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
+  BEnds = wavyLine(path,q1B,B,capped1=False,capped2=True)
+  vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
 
 
 ## H->ff 384x384
-dwg = svgwrite.Drawing('Hff.svg',size=("384mm","384mm"),viewBox="0 0 384 384")
-path = dwg.path(None,stroke=color,stroke_width=width,fill="none")
-q1 = (5,85)
-q1p = (5,384)
-q1B = (40,212)
-q2 = (229,85)
-q2p = (229,384)
-q2B = (194,212)
-BB = (117,212)
-Hff = (117,284)
-f1 = (71,384)
-f2 = (172,384)
-q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
-q2Ends = straightLineArrow(path,q2,q2B,forward=True,capped2=False)
-q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
-q2pEnds = straightLineArrow(path,q2p,q2B,forward=False,capped2=False)
-B1Ends = wavyLine(path,q1B,BB,capped1=False,capped2=False)
-B2Ends = wavyLine(path,q2B,BB,capped1=False,capped2=False)
-HEnds = straightLine(path,Hff,BB,capped1=False,capped2=False)
-f1Ends = straightLineArrow(path,Hff,f1,forward=False,capped1=False)
-f2Ends = straightLineArrow(path,Hff,f2,forward=True,capped1=False)
-vertexCircle(path,q1B,[q1Ends,q1pEnds,B1Ends])
-vertexCircle(path,q2B,[q2Ends,q2pEnds,B2Ends])
-vertexCircle(path,BB,[HEnds,B1Ends,B2Ends])
-vertexCircle(path,Hff,[HEnds,f1Ends,f2Ends])
-tri1 = (275,290)
-tri2 = (355,290)
-tri3 = (315,225)
-g1 = (255,385)
-g2 = (375,385)
-Hff = (315,160)
-f1 = (260,85)
-f2 = (370,85)
-sl3Ends = straightLineArrow(path,tri1,tri2,forward=False,capped1=False,capped2=False)
-sl4Ends = straightLineArrow(path,tri2,tri3,forward=False,capped1=False,capped2=False)
-sl5Ends = straightLineArrow(path,tri3,tri1,forward=False,capped1=False,capped2=False)
-g1Ends = spiralLine(path,tri1,g1,capped1=False)
-g2Ends = spiralLine(path,g2,tri2,capped2=False)
-HEnds = straightLine(path,tri3,Hff,capped1=False,capped2=False)
-f1Ends = straightLineArrow(path,Hff,f1,forward=False,capped1=False)
-f2Ends = straightLineArrow(path,Hff,f2,forward=True,capped1=False)
-vertexCircle(path,tri1,[sl3Ends,sl5Ends,g1Ends])
-vertexCircle(path,tri2,[sl3Ends,sl4Ends,g2Ends])
-vertexCircle(path,tri3,[sl4Ends,sl5Ends,HEnds])
-vertexCircle(path,Hff,[HEnds,f1Ends,f2Ends])
-q1 = (320,5)
-q1p = (320,125)
-q1B = (255,60)
-BH = numpy.array((170.,60.))
-B2 = rotate(numpy.array((0.,-80.)),-45.)+BH
-Hff = rotate(numpy.array((0.,60.)),45.)+BH
-f1 = rotate(numpy.array((60.,70.)),45.)+Hff
-f2 = rotate(numpy.array((-60.,70.)),45.)+Hff
-q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
-q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
-BEnds = wavyLine(path,q1B,BH,capped1=False,capped2=False)
-B2Ends = wavyLine(path,BH,B2,capped1=False,capped2=True)
-HEnds = straightLine(path,BH,Hff,capped1=False,capped2=False)
-f1Ends = straightLineArrow(path,Hff,f1,forward=False,capped1=False)
-f2Ends = straightLineArrow(path,Hff,f2,forward=True,capped1=False)
-vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
-vertexCircle(path,BH,[HEnds,BEnds,B2Ends])
-vertexCircle(path,Hff,[HEnds,f1Ends,f2Ends])
-dwg.add(path)
-dwg.save()
+@sheet('Hff',(384,384))
+def drawHff(path):
+  q1 = (5,85)
+  q1p = (5,384)
+  q1B = (40,212)
+  q2 = (229,85)
+  q2p = (229,384)
+  q2B = (194,212)
+  BB = (117,212)
+  Hff = (117,284)
+  f1 = (71,384)
+  f2 = (172,384)
+  q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
+  q2Ends = straightLineArrow(path,q2,q2B,forward=True,capped2=False)
+  q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
+  q2pEnds = straightLineArrow(path,q2p,q2B,forward=False,capped2=False)
+  B1Ends = wavyLine(path,q1B,BB,capped1=False,capped2=False)
+  B2Ends = wavyLine(path,q2B,BB,capped1=False,capped2=False)
+  HEnds = straightLine(path,Hff,BB,capped1=False,capped2=False)
+  f1Ends = straightLineArrow(path,Hff,f1,forward=False,capped1=False)
+  f2Ends = straightLineArrow(path,Hff,f2,forward=True,capped1=False)
+  vertexCircle(path,q1B,[q1Ends,q1pEnds,B1Ends])
+  vertexCircle(path,q2B,[q2Ends,q2pEnds,B2Ends])
+  vertexCircle(path,BB,[HEnds,B1Ends,B2Ends])
+  vertexCircle(path,Hff,[HEnds,f1Ends,f2Ends])
+  tri1 = (275,290)
+  tri2 = (355,290)
+  tri3 = (315,225)
+  g1 = (255,385)
+  g2 = (375,385)
+  Hff = (315,160)
+  f1 = (260,85)
+  f2 = (370,85)
+  sl3Ends = straightLineArrow(path,tri1,tri2,forward=False,capped1=False,capped2=False)
+  sl4Ends = straightLineArrow(path,tri2,tri3,forward=False,capped1=False,capped2=False)
+  sl5Ends = straightLineArrow(path,tri3,tri1,forward=False,capped1=False,capped2=False)
+  g1Ends = spiralLine(path,tri1,g1,capped1=False)
+  g2Ends = spiralLine(path,g2,tri2,capped2=False)
+  HEnds = straightLine(path,tri3,Hff,capped1=False,capped2=False)
+  f1Ends = straightLineArrow(path,Hff,f1,forward=False,capped1=False)
+  f2Ends = straightLineArrow(path,Hff,f2,forward=True,capped1=False)
+  vertexCircle(path,tri1,[sl3Ends,sl5Ends,g1Ends])
+  vertexCircle(path,tri2,[sl3Ends,sl4Ends,g2Ends])
+  vertexCircle(path,tri3,[sl4Ends,sl5Ends,HEnds])
+  vertexCircle(path,Hff,[HEnds,f1Ends,f2Ends])
+  q1 = (320,5)
+  q1p = (320,125)
+  q1B = (255,60)
+  BH = numpy.array((170.,60.))
+  B2 = rotate(numpy.array((0.,-80.)),-45.)+BH
+  Hff = rotate(numpy.array((0.,60.)),45.)+BH
+  f1 = rotate(numpy.array((60.,70.)),45.)+Hff
+  f2 = rotate(numpy.array((-60.,70.)),45.)+Hff
+  q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
+  q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
+  BEnds = wavyLine(path,q1B,BH,capped1=False,capped2=False)
+  B2Ends = wavyLine(path,BH,B2,capped1=False,capped2=True)
+  HEnds = straightLine(path,BH,Hff,capped1=False,capped2=False)
+  f1Ends = straightLineArrow(path,Hff,f1,forward=False,capped1=False)
+  f2Ends = straightLineArrow(path,Hff,f2,forward=True,capped1=False)
+  vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
+  vertexCircle(path,BH,[HEnds,BEnds,B2Ends])
+  vertexCircle(path,Hff,[HEnds,f1Ends,f2Ends])
 
 ## H->gamma gamma 384x384
-dwg = svgwrite.Drawing('Hgamgam.svg',size=("384mm","384mm"),viewBox="0 0 384 384")
-path = dwg.path(None,stroke=color,stroke_width=width,fill="none")
-tri1 = numpy.array((275,290))
-tri2 = numpy.array((355,290))
-tri3 = numpy.array((315,225))
-tri21 = tri1*numpy.array([1.,-1.])+numpy.array([0.,2*225.-70])
-tri22 = tri2*numpy.array([1.,-1.])+numpy.array([0.,2*225.-70])
-tri23 = tri3*numpy.array([1.,-1.])+numpy.array([0.,2*225.-70])
-g1 = (255,385)
-g2 = (375,385)
-B1 = (255,3)
-B2 = (375,3)
-sl3Ends = straightLineArrow(path,tri1,tri2,forward=False,capped1=False,capped2=False)
-sl4Ends = straightLineArrow(path,tri2,tri3,forward=False,capped1=False,capped2=False)
-sl5Ends = straightLineArrow(path,tri3,tri1,forward=False,capped1=False,capped2=False)
-g1Ends = spiralLine(path,tri1,g1,capped1=False)
-g2Ends = spiralLine(path,g2,tri2,capped2=False)
-HEnds = straightLine(path,tri3,tri23,capped1=False,capped2=False)
-sl6Ends = straightLineArrow(path,tri21,tri22,forward=False,capped1=False,capped2=False)
-sl7Ends = straightLineArrow(path,tri22,tri23,forward=False,capped1=False,capped2=False)
-sl8Ends = straightLineArrow(path,tri23,tri21,forward=False,capped1=False,capped2=False)
-B1Ends = wavyLine(path,tri21,B1,capped1=False,capped2=True)
-B2Ends = wavyLine(path,tri22,B2,capped1=False,capped2=True)
-vertexCircle(path,tri1,[sl3Ends,sl5Ends,g1Ends])
-vertexCircle(path,tri2,[sl3Ends,sl4Ends,g2Ends])
-vertexCircle(path,tri3,[sl4Ends,sl5Ends,HEnds])
-vertexCircle(path,tri21,[sl6Ends,sl8Ends,B1Ends])
-vertexCircle(path,tri22,[sl6Ends,sl7Ends,B2Ends])
-vertexCircle(path,tri23,[sl7Ends,sl8Ends,HEnds])
-q1 = (5,5)
-q1p = (5,304)
-q1B = (40,132)
-q2 = (229,5)
-q2p = (229,304)
-q2B = (194,132)
-BB = (117,132)
-f1 = (52,375)  #(71,304)
-f2 = (182,375) #(172,304)
-tri1 = numpy.array((77,269))  #numpy.array((275,290))
-tri2 = numpy.array((157,269))  #numpy.array((355,290))
-tri3 = numpy.array((117,204))  #numpy.array((315,225))
-q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
-q2Ends = straightLineArrow(path,q2,q2B,forward=True,capped2=False)
-q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
-q2pEnds = straightLineArrow(path,q2p,q2B,forward=False,capped2=False)
-B1Ends = wavyLine(path,q1B,BB,capped1=False,capped2=False)
-B2Ends = wavyLine(path,q2B,BB,capped1=False,capped2=False)
-HEnds = straightLine(path,tri3,BB,capped1=False,capped2=False)
-f1Ends = wavyLine(path,tri1,f1,capped1=False)
-f2Ends = wavyLine(path,tri2,f2,capped1=False)
-sl3Ends = straightLineArrow(path,tri1,tri2,forward=False,capped1=False,capped2=False)
-sl4Ends = straightLineArrow(path,tri2,tri3,forward=False,capped1=False,capped2=False)
-sl5Ends = straightLineArrow(path,tri3,tri1,forward=False,capped1=False,capped2=False)
-vertexCircle(path,q1B,[q1Ends,q1pEnds,B1Ends])
-vertexCircle(path,q2B,[q2Ends,q2pEnds,B2Ends])
-vertexCircle(path,BB,[HEnds,B1Ends,B2Ends])
-vertexCircle(path,tri3,[sl4Ends,sl5Ends,HEnds])
-vertexCircle(path,tri1,[sl3Ends,sl5Ends,f1Ends])
-vertexCircle(path,tri2,[sl3Ends,sl4Ends,f2Ends])
-dwg.add(path)
-dwg.save()
+@sheet('Hgamgam',(384,384))
+def drawHgamgam(path):
+  tri1 = numpy.array((275,290))
+  tri2 = numpy.array((355,290))
+  tri3 = numpy.array((315,225))
+  tri21 = tri1*numpy.array([1.,-1.])+numpy.array([0.,2*225.-70])
+  tri22 = tri2*numpy.array([1.,-1.])+numpy.array([0.,2*225.-70])
+  tri23 = tri3*numpy.array([1.,-1.])+numpy.array([0.,2*225.-70])
+  g1 = (255,385)
+  g2 = (375,385)
+  B1 = (255,3)
+  B2 = (375,3)
+  sl3Ends = straightLineArrow(path,tri1,tri2,forward=False,capped1=False,capped2=False)
+  sl4Ends = straightLineArrow(path,tri2,tri3,forward=False,capped1=False,capped2=False)
+  sl5Ends = straightLineArrow(path,tri3,tri1,forward=False,capped1=False,capped2=False)
+  g1Ends = spiralLine(path,tri1,g1,capped1=False)
+  g2Ends = spiralLine(path,g2,tri2,capped2=False)
+  HEnds = straightLine(path,tri3,tri23,capped1=False,capped2=False)
+  sl6Ends = straightLineArrow(path,tri21,tri22,forward=False,capped1=False,capped2=False)
+  sl7Ends = straightLineArrow(path,tri22,tri23,forward=False,capped1=False,capped2=False)
+  sl8Ends = straightLineArrow(path,tri23,tri21,forward=False,capped1=False,capped2=False)
+  B1Ends = wavyLine(path,tri21,B1,capped1=False,capped2=True)
+  B2Ends = wavyLine(path,tri22,B2,capped1=False,capped2=True)
+  vertexCircle(path,tri1,[sl3Ends,sl5Ends,g1Ends])
+  vertexCircle(path,tri2,[sl3Ends,sl4Ends,g2Ends])
+  vertexCircle(path,tri3,[sl4Ends,sl5Ends,HEnds])
+  vertexCircle(path,tri21,[sl6Ends,sl8Ends,B1Ends])
+  vertexCircle(path,tri22,[sl6Ends,sl7Ends,B2Ends])
+  vertexCircle(path,tri23,[sl7Ends,sl8Ends,HEnds])
+  q1 = (5,5)
+  q1p = (5,304)
+  q1B = (40,132)
+  q2 = (229,5)
+  q2p = (229,304)
+  q2B = (194,132)
+  BB = (117,132)
+  f1 = (52,375)  #(71,304)
+  f2 = (182,375) #(172,304)
+  tri1 = numpy.array((77,269))  #numpy.array((275,290))
+  tri2 = numpy.array((157,269))  #numpy.array((355,290))
+  tri3 = numpy.array((117,204))  #numpy.array((315,225))
+  q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
+  q2Ends = straightLineArrow(path,q2,q2B,forward=True,capped2=False)
+  q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
+  q2pEnds = straightLineArrow(path,q2p,q2B,forward=False,capped2=False)
+  B1Ends = wavyLine(path,q1B,BB,capped1=False,capped2=False)
+  B2Ends = wavyLine(path,q2B,BB,capped1=False,capped2=False)
+  HEnds = straightLine(path,tri3,BB,capped1=False,capped2=False)
+  f1Ends = wavyLine(path,tri1,f1,capped1=False)
+  f2Ends = wavyLine(path,tri2,f2,capped1=False)
+  sl3Ends = straightLineArrow(path,tri1,tri2,forward=False,capped1=False,capped2=False)
+  sl4Ends = straightLineArrow(path,tri2,tri3,forward=False,capped1=False,capped2=False)
+  sl5Ends = straightLineArrow(path,tri3,tri1,forward=False,capped1=False,capped2=False)
+  vertexCircle(path,q1B,[q1Ends,q1pEnds,B1Ends])
+  vertexCircle(path,q2B,[q2Ends,q2pEnds,B2Ends])
+  vertexCircle(path,BB,[HEnds,B1Ends,B2Ends])
+  vertexCircle(path,tri3,[sl4Ends,sl5Ends,HEnds])
+  vertexCircle(path,tri1,[sl3Ends,sl5Ends,f1Ends])
+  vertexCircle(path,tri2,[sl3Ends,sl4Ends,f2Ends])
 
 ## H->VV 384x384
-dwg = svgwrite.Drawing('HVV.svg',size=("384mm","384mm"),viewBox="0 0 384 384")
-path = dwg.path(None,stroke=color,stroke_width=width,fill="none")
-tri1 = (152,290)
-tri2 = (232,290)
-tri3 = (192,225)
-g1 = (132,385)
-g2 = (252,385)
-Hvv = numpy.array((192,160))
-v1 = numpy.array((137,92))
-v2 = numpy.array((247,92))
-f1 = v1+numpy.array((-89,-25))
-f2 = v1+numpy.array((-7,-92))
-f3 = v2+numpy.array((7,-92))
-f4 = v2+numpy.array((89,-25))
-sl3Ends = straightLineArrow(path,tri1,tri2,forward=False,capped1=False,capped2=False)
-sl4Ends = straightLineArrow(path,tri2,tri3,forward=False,capped1=False,capped2=False)
-sl5Ends = straightLineArrow(path,tri3,tri1,forward=False,capped1=False,capped2=False)
-g1Ends = spiralLine(path,tri1,g1,capped1=False)
-g2Ends = spiralLine(path,g2,tri2,capped2=False)
-HEnds = straightLine(path,tri3,Hvv,capped1=False,capped2=False)
-v1Ends = wavyLine(path,Hvv,v1,capped1=False,capped2=False)
-v2Ends = wavyLine(path,Hvv,v2,capped1=False,capped2=False)
-f1Ends = straightLineArrow(path,v1,f1,capped1=False)
-f2Ends = straightLineArrow(path,v1,f2,forward=False,capped1=False)
-f3Ends = straightLineArrow(path,v2,f3,capped1=False)
-f4Ends = straightLineArrow(path,v2,f4,forward=False,capped1=False)
-vertexCircle(path,tri1,[sl3Ends,sl5Ends,g1Ends])
-vertexCircle(path,tri2,[sl3Ends,sl4Ends,g2Ends])
-vertexCircle(path,tri3,[sl4Ends,sl5Ends,HEnds])
-vertexCircle(path,Hvv,[HEnds,v1Ends,v2Ends])
-vertexCircle(path,v1,[v1Ends,f1Ends,f2Ends])
-vertexCircle(path,v2,[v2Ends,f3Ends,f4Ends])
-# gg->gam gam Box diagram
-goVec = numpy.array((0,-97))
-g1 = numpy.array((270,385))
-g2 = g1+numpy.array((97,0))
-box1 = g1+goVec
-box2 = g2+goVec
-box3 = box1+goVec
-box4 = box2+goVec
-B1 = box3+goVec
-B2 = box4+goVec
-sl1Ends = straightLineArrow(path,box2,box1,forward=False,capped1=False,capped2=False)
-sl2Ends = straightLineArrow(path,box1,box3,forward=False,capped1=False,capped2=False)
-sl3Ends = straightLineArrow(path,box3,box4,forward=False,capped1=False,capped2=False)
-sl4Ends = straightLineArrow(path,box4,box2,forward=False,capped1=False,capped2=False)
-g1Ends = spiralLine(path,box1,g1,capped1=False)
-g2Ends = spiralLine(path,g2,box2,capped2=False)
-B1Ends = wavyLine(path,box3,B1,capped1=False,capped2=True)
-B2Ends = wavyLine(path,box4,B2,capped1=False,capped2=True)
-vertexCircle(path,box1,[sl1Ends,sl2Ends,g1Ends])
-vertexCircle(path,box2,[sl1Ends,sl4Ends,g2Ends])
-vertexCircle(path,box3,[sl2Ends,sl3Ends,B1Ends])
-vertexCircle(path,box4,[sl3Ends,sl4Ends,B2Ends])
-## qqbar->4f background
-q1In = numpy.array((42,383))
-q2In = q1In+numpy.array((79,0))
-v1 = q1In+numpy.array((0,-80))
-v2 = q2In+numpy.array((0,-80))
-v3 = v1+numpy.array((0,-80))
-v4 = v2+numpy.array((0,-80))
-f1Out = v3+numpy.array((-37,-70))
-f2Out = v3+numpy.array((+37,-70))
-f3Out = v4+numpy.array((-37,-70))
-f4Out = v4+numpy.array((+37,-70))
-q1Ends = straightLineArrow(path,q1In,v1,forward=True,capped1=True,capped2=False)
-q2Ends = straightLineArrow(path,q2In,v2,forward=False,capped1=True,capped2=False)
-qTEnds = straightLineArrow(path,v1,v2,forward=True,capped1=False,capped2=False)
-v1Ends = wavyLine(path,v1,v3,capped1=False,capped2=False)
-v2Ends = wavyLine(path,v2,v4,capped1=False,capped2=False)
-f1Ends = straightLineArrow(path,f1Out,v3,forward=False,capped1=True,capped2=False)
-f2Ends = straightLineArrow(path,f2Out,v3,forward=True,capped1=True,capped2=False)
-f3Ends = straightLineArrow(path,f3Out,v4,forward=False,capped1=True,capped2=False)
-f4Ends = straightLineArrow(path,f4Out,v4,forward=True,capped1=True,capped2=False)
-vertexCircle(path,v1,[q1Ends,qTEnds,v1Ends])
-vertexCircle(path,v2,[q2Ends,qTEnds,v2Ends])
-vertexCircle(path,v3,[f1Ends,f2Ends,v1Ends])
-vertexCircle(path,v4,[f3Ends,f4Ends,v2Ends])
-dwg.add(path)
-dwg.save()
+@sheet('HVV',(384,384))
+def drawHVV(path):
+  tri1 = (152,290)
+  tri2 = (232,290)
+  tri3 = (192,225)
+  g1 = (132,385)
+  g2 = (252,385)
+  Hvv = numpy.array((192,160))
+  v1 = numpy.array((137,92))
+  v2 = numpy.array((247,92))
+  f1 = v1+numpy.array((-89,-25))
+  f2 = v1+numpy.array((-7,-92))
+  f3 = v2+numpy.array((7,-92))
+  f4 = v2+numpy.array((89,-25))
+  sl3Ends = straightLineArrow(path,tri1,tri2,forward=False,capped1=False,capped2=False)
+  sl4Ends = straightLineArrow(path,tri2,tri3,forward=False,capped1=False,capped2=False)
+  sl5Ends = straightLineArrow(path,tri3,tri1,forward=False,capped1=False,capped2=False)
+  g1Ends = spiralLine(path,tri1,g1,capped1=False)
+  g2Ends = spiralLine(path,g2,tri2,capped2=False)
+  HEnds = straightLine(path,tri3,Hvv,capped1=False,capped2=False)
+  v1Ends = wavyLine(path,Hvv,v1,capped1=False,capped2=False)
+  v2Ends = wavyLine(path,Hvv,v2,capped1=False,capped2=False)
+  f1Ends = straightLineArrow(path,v1,f1,capped1=False)
+  f2Ends = straightLineArrow(path,v1,f2,forward=False,capped1=False)
+  f3Ends = straightLineArrow(path,v2,f3,capped1=False)
+  f4Ends = straightLineArrow(path,v2,f4,forward=False,capped1=False)
+  vertexCircle(path,tri1,[sl3Ends,sl5Ends,g1Ends])
+  vertexCircle(path,tri2,[sl3Ends,sl4Ends,g2Ends])
+  vertexCircle(path,tri3,[sl4Ends,sl5Ends,HEnds])
+  vertexCircle(path,Hvv,[HEnds,v1Ends,v2Ends])
+  vertexCircle(path,v1,[v1Ends,f1Ends,f2Ends])
+  vertexCircle(path,v2,[v2Ends,f3Ends,f4Ends])
+  # gg->gam gam Box diagram
+  goVec = numpy.array((0,-97))
+  g1 = numpy.array((270,385))
+  g2 = g1+numpy.array((97,0))
+  box1 = g1+goVec
+  box2 = g2+goVec
+  box3 = box1+goVec
+  box4 = box2+goVec
+  B1 = box3+goVec
+  B2 = box4+goVec
+  sl1Ends = straightLineArrow(path,box2,box1,forward=False,capped1=False,capped2=False)
+  sl2Ends = straightLineArrow(path,box1,box3,forward=False,capped1=False,capped2=False)
+  sl3Ends = straightLineArrow(path,box3,box4,forward=False,capped1=False,capped2=False)
+  sl4Ends = straightLineArrow(path,box4,box2,forward=False,capped1=False,capped2=False)
+  g1Ends = spiralLine(path,box1,g1,capped1=False)
+  g2Ends = spiralLine(path,g2,box2,capped2=False)
+  B1Ends = wavyLine(path,box3,B1,capped1=False,capped2=True)
+  B2Ends = wavyLine(path,box4,B2,capped1=False,capped2=True)
+  vertexCircle(path,box1,[sl1Ends,sl2Ends,g1Ends])
+  vertexCircle(path,box2,[sl1Ends,sl4Ends,g2Ends])
+  vertexCircle(path,box3,[sl2Ends,sl3Ends,B1Ends])
+  vertexCircle(path,box4,[sl3Ends,sl4Ends,B2Ends])
+  ## qqbar->4f background
+  q1In = numpy.array((42,383))
+  q2In = q1In+numpy.array((79,0))
+  v1 = q1In+numpy.array((0,-80))
+  v2 = q2In+numpy.array((0,-80))
+  v3 = v1+numpy.array((0,-80))
+  v4 = v2+numpy.array((0,-80))
+  f1Out = v3+numpy.array((-37,-70))
+  f2Out = v3+numpy.array((+37,-70))
+  f3Out = v4+numpy.array((-37,-70))
+  f4Out = v4+numpy.array((+37,-70))
+  q1Ends = straightLineArrow(path,q1In,v1,forward=True,capped1=True,capped2=False)
+  q2Ends = straightLineArrow(path,q2In,v2,forward=False,capped1=True,capped2=False)
+  qTEnds = straightLineArrow(path,v1,v2,forward=True,capped1=False,capped2=False)
+  v1Ends = wavyLine(path,v1,v3,capped1=False,capped2=False)
+  v2Ends = wavyLine(path,v2,v4,capped1=False,capped2=False)
+  f1Ends = straightLineArrow(path,f1Out,v3,forward=False,capped1=True,capped2=False)
+  f2Ends = straightLineArrow(path,f2Out,v3,forward=True,capped1=True,capped2=False)
+  f3Ends = straightLineArrow(path,f3Out,v4,forward=False,capped1=True,capped2=False)
+  f4Ends = straightLineArrow(path,f4Out,v4,forward=True,capped1=True,capped2=False)
+  vertexCircle(path,v1,[q1Ends,qTEnds,v1Ends])
+  vertexCircle(path,v2,[q2Ends,qTEnds,v2Ends])
+  vertexCircle(path,v3,[f1Ends,f2Ends,v1Ends])
+  vertexCircle(path,v4,[f3Ends,f4Ends,v2Ends])
 
 ### Penguin 384x384  ## Need curves to do correctly!!
-#dwg = svgwrite.Drawing('Penguin.svg',size=("384mm","384mm"),viewBox="0 0 384 384")
-#path = dwg.path(None,stroke=color,stroke_width=width,fill="none")
-#armL = numpy.array((2,70))
-#neckL = armL+numpy.array((80,-20))
-#neckR = neckL + numpy.array((150,0))
-#armR = neckR+numpy.array((80,20))
-#gluT = (neckL+neckR)/2+numpy.array((0,170))
-#gluB = gluT+numpy.array((0,50))
-#legL = gluB+numpy.array((-55,70))
-#legR = gluB+numpy.array((55,70))
-#armLEnds = straightLineArrow(path,armL,neckL,forward=True,capped1=True,capped2=False)
-#armREnds = straightLineArrow(path,armR,neckR,forward=False,capped1=True,capped2=False)
-#neckEnds = wavyLine(path,neckL,neckR,capped1=False,capped2=False)
-#bodyLEnds = straightLineArrow(path,neckL,gluT,capped1=False,capped2=False)
-#bodyREnds = straightLineArrow(path,neckR,gluT,forward=False,capped1=False,capped2=False)
-#gluEnds = wavyLine(path,gluB,gluT,capped1=False,capped2=False)
-#legLEnds = straightLineArrow(path,legL,gluB,forward=True,capped1=True,capped2=False)
-#legREnds = straightLineArrow(path,legR,gluB,forward=False,capped1=True,capped2=False)
-#vertexCircle(path,neckL,[armLEnds,neckEnds,bodyLEnds])
-#vertexCircle(path,neckR,[armREnds,neckEnds,bodyREnds])
-#vertexCircle(path,gluT,[gluEnds,bodyLEnds,bodyREnds])
-#vertexCircle(path,gluB,[gluEnds,legLEnds,legREnds])
-#dwg.add(path)
-#dwg.save()
+#@sheet('Penguin',(384,384))
+#def drawPenguin(path):
+#  armL = numpy.array((2,70))
+#  neckL = armL+numpy.array((80,-20))
+#  neckR = neckL + numpy.array((150,0))
+#  armR = neckR+numpy.array((80,20))
+#  gluT = (neckL+neckR)/2+numpy.array((0,170))
+#  gluB = gluT+numpy.array((0,50))
+#  legL = gluB+numpy.array((-55,70))
+#  legR = gluB+numpy.array((55,70))
+#  armLEnds = straightLineArrow(path,armL,neckL,forward=True,capped1=True,capped2=False)
+#  armREnds = straightLineArrow(path,armR,neckR,forward=False,capped1=True,capped2=False)
+#  neckEnds = wavyLine(path,neckL,neckR,capped1=False,capped2=False)
+#  bodyLEnds = straightLineArrow(path,neckL,gluT,capped1=False,capped2=False)
+#  bodyREnds = straightLineArrow(path,neckR,gluT,forward=False,capped1=False,capped2=False)
+#  gluEnds = wavyLine(path,gluB,gluT,capped1=False,capped2=False)
+#  legLEnds = straightLineArrow(path,legL,gluB,forward=True,capped1=True,capped2=False)
+#  legREnds = straightLineArrow(path,legR,gluB,forward=False,capped1=True,capped2=False)
+#  vertexCircle(path,neckL,[armLEnds,neckEnds,bodyLEnds])
+#  vertexCircle(path,neckR,[armREnds,neckEnds,bodyREnds])
+#  vertexCircle(path,gluT,[gluEnds,bodyLEnds,bodyREnds])
+#  vertexCircle(path,gluB,[gluEnds,legLEnds,legREnds])
 
 ## Backgrounds
-dwg = svgwrite.Drawing('Backgrounds.svg',size=("384mm","384mm"),viewBox="0 0 384 384")
-path = dwg.path(None,stroke=color,stroke_width=width,fill="none")
-q1 = (10,10)
-q1p = (182,10)
-q1B = (96,268/3.+10)
-q2 = (10,278)
-q2p = (182,278)
-q2B = (96,2*268/3.+10)
-q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
-q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
-q2Ends = straightLineArrow(path,q2,q2B,forward=True,capped2=False)
-q2pEnds = straightLineArrow(path,q2p,q2B,forward=False,capped2=False)
-BEnds = wavyLine(path,q1B,q2B,capped1=False,capped2=False)
-vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
-vertexCircle(path,q2B,[q2Ends,q2pEnds,BEnds])
-q1 = numpy.array(q1)+numpy.array([192,5])
-q1p = numpy.array(q1p)+numpy.array([192,5])
-q1B = numpy.array(q1B)+numpy.array([192,5])
-q2 = numpy.array(q2)+numpy.array([192,5])
-q2p = numpy.array(q2p)+numpy.array([192,5])
-q2B = numpy.array(q2B)+numpy.array([192,5])
-q1Ends = spiralLine(path,q1,q1B,capped2=False)
-q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
-q2Ends = straightLineArrow(path,q2,q2B,forward=True,capped2=False)
-q2pEnds = spiralLine(path,q2p,q2B,capped2=False)
-BEnds = straightLineArrow(path,q1B,q2B,forward=False,capped1=False,capped2=False)
-vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
-vertexCircle(path,q2B,[q2Ends,q2pEnds,BEnds])
-gIn = numpy.array((30,373))
-qIn = gIn + numpy.array((0,-80))
-qV = qIn + numpy.array((100,0))
-gV = gIn + numpy.array((100,0))
-qOut = gV + numpy.array((100,0))
-ffV = qV + numpy.array((100,0))
-f1Out = ffV + numpy.array((60,60))
-f2Out = ffV + numpy.array((60,-60))
-gEnds = spiralLine(path,gIn,gV,capped1=True,capped2=False)
-q1Ends = straightLineArrow(path,qIn,qV,forward=True,capped2=False)
-vvEnds = straightLineArrow(path,qV,gV,forward=True,capped1=False,capped2=False)
-qOutEnds = straightLineArrow(path,gV,qOut,forward=True,capped1=False,capped2=True)
-BEnds = wavyLine(path,qV,ffV,capped1=False,capped2=False)
-f1Ends = straightLineArrow(path,ffV,f1Out,forward=True,capped1=False,capped2=True)
-f2Ends = straightLineArrow(path,ffV,f2Out,forward=False,capped1=False,capped2=True)
-vertexCircle(path,qV,[q1Ends,vvEnds,BEnds])
-vertexCircle(path,gV,[gEnds,vvEnds,qOutEnds])
-vertexCircle(path,ffV,[BEnds,f1Ends,f2Ends])
-dwg.add(path)
-dwg.save()
+@sheet('Backgrounds',(384,384))
+def drawBackgrounds(path):
+  q1 = (10,10)
+  q1p = (182,10)
+  q1B = (96,268/3.+10)
+  q2 = (10,278)
+  q2p = (182,278)
+  q2B = (96,2*268/3.+10)
+  q1Ends = straightLineArrow(path,q1,q1B,forward=True,capped2=False)
+  q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
+  q2Ends = straightLineArrow(path,q2,q2B,forward=True,capped2=False)
+  q2pEnds = straightLineArrow(path,q2p,q2B,forward=False,capped2=False)
+  BEnds = wavyLine(path,q1B,q2B,capped1=False,capped2=False)
+  vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
+  vertexCircle(path,q2B,[q2Ends,q2pEnds,BEnds])
+  q1 = numpy.array(q1)+numpy.array([192,5])
+  q1p = numpy.array(q1p)+numpy.array([192,5])
+  q1B = numpy.array(q1B)+numpy.array([192,5])
+  q2 = numpy.array(q2)+numpy.array([192,5])
+  q2p = numpy.array(q2p)+numpy.array([192,5])
+  q2B = numpy.array(q2B)+numpy.array([192,5])
+  q1Ends = spiralLine(path,q1,q1B,capped2=False)
+  q1pEnds = straightLineArrow(path,q1p,q1B,forward=False,capped2=False)
+  q2Ends = straightLineArrow(path,q2,q2B,forward=True,capped2=False)
+  q2pEnds = spiralLine(path,q2p,q2B,capped2=False)
+  BEnds = straightLineArrow(path,q1B,q2B,forward=False,capped1=False,capped2=False)
+  vertexCircle(path,q1B,[q1Ends,q1pEnds,BEnds])
+  vertexCircle(path,q2B,[q2Ends,q2pEnds,BEnds])
+  gIn = numpy.array((30,373))
+  qIn = gIn + numpy.array((0,-80))
+  qV = qIn + numpy.array((100,0))
+  gV = gIn + numpy.array((100,0))
+  qOut = gV + numpy.array((100,0))
+  ffV = qV + numpy.array((100,0))
+  f1Out = ffV + numpy.array((60,60))
+  f2Out = ffV + numpy.array((60,-60))
+  gEnds = spiralLine(path,gIn,gV,capped1=True,capped2=False)
+  q1Ends = straightLineArrow(path,qIn,qV,forward=True,capped2=False)
+  vvEnds = straightLineArrow(path,qV,gV,forward=True,capped1=False,capped2=False)
+  qOutEnds = straightLineArrow(path,gV,qOut,forward=True,capped1=False,capped2=True)
+  BEnds = wavyLine(path,qV,ffV,capped1=False,capped2=False)
+  f1Ends = straightLineArrow(path,ffV,f1Out,forward=True,capped1=False,capped2=True)
+  f2Ends = straightLineArrow(path,ffV,f2Out,forward=False,capped1=False,capped2=True)
+  vertexCircle(path,qV,[q1Ends,vvEnds,BEnds])
+  vertexCircle(path,gV,[gEnds,vvEnds,qOutEnds])
+  vertexCircle(path,ffV,[BEnds,f1Ends,f2Ends])
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Draws feynman graph sheets as SVG for the laser cutter")
+  subparsers = parser.add_subparsers(dest="command")
+  renderParser = subparsers.add_parser("render",help="render sheets to SVG files")
+  renderParser.add_argument("sheets",nargs="*",help="names of the sheets to render, all of them if none are given")
+  renderParser.add_argument("--out",default=".",help="directory to write the SVG files to")
+  renderParser.add_argument("--engrave",action="store_true",help="draw in the engraving color")
+  renderParser.add_argument("--production",action="store_true",help="use the %s production line width instead of %s" % (widthProduction,widthTesting))
+  renderParser.add_argument("--stream",action="store_true",help="write the SVG as it is drawn instead of building it in memory")
+  renderParser.add_argument("--symbols",action="store_true",help="write each distinct line shape once in <defs> and place it with <use>")
+  renderParser.add_argument("--flatten",action="store_true",help="with --symbols, expand the <use> elements back into one path")
+  renderParser.add_argument("--precision",type=int,metavar="DECIMALS",help="write compact path data rounded to this many decimals")
+  renderParser.add_argument("--optimize",action="store_true",help="reorder the cuts to cut down the laser head travel")
+  renderParser.add_argument("--dedupe",action="store_true",help="remove segments that would be cut twice")
+  renderParser.add_argument("--jobs",type=int,default=1,help="number of worker processes to render sheets in")
+  renderParser.add_argument("--stats",action="store_true",help="print call counts, times, commands and bytes per primitive and sheet")
+  renderParser.add_argument("--stats-json",metavar="FILE",help="write the --stats figures to a JSON file")
+  renderParser.add_argument("--cache",type=int,default=0,metavar="N",help="reuse repeated line shapes from an LRU cache of N shapes")
+  subparsers.add_parser("list",help="list the sheet names")
+  args = parser.parse_args(argv)
+  if args.command == "list":
+    for name,(builder,size) in SHEETS.items():
+      print("%s %gx%gmm" % (name,size[0],size[1]))
+    return
+  if args.command is None:
+    args = renderParser.parse_args([])
+  names = args.sheets or list(SHEETS)
+  for name in names:
+    if name not in SHEETS:
+      parser.error("unknown sheet %s, choose from: %s" % (name," ".join(SHEETS)))
+  if args.stream and args.symbols:
+    parser.error("--stream and --symbols can't be used together")
+  if (args.optimize or args.dedupe) and (args.stream or args.symbols):
+    parser.error("--optimize and --dedupe can't be used with --stream or --symbols")
+  if not os.path.isdir(args.out):
+    os.makedirs(args.out)
+  strokeWidth = widthTesting
+  if args.production:
+    strokeWidth = widthProduction
+  if args.stats or args.stats_json:
+    enableStats()
+  start = time.time()
+  for name,fileName,seconds,info in renderSheets(names,args.out,args.jobs,args.cache,engrave=args.engrave,strokeWidth=strokeWidth,stream=args.stream,symbols=args.symbols,flatten=args.flatten,precision=args.precision,optimize=args.optimize,dedupe=args.dedupe):
+    line = "%-12s %7.3fs  %s" % (name,seconds,fileName)
+    if 'bytesSaved' in info:
+      line += "  (%d bytes saved)" % info['bytesSaved']
+    if 'duplicates' in info:
+      line += "  (%d duplicate segments)" % info['duplicates']
+    if 'travel' in info:
+      line += "  (travel %.0fmm -> %.0fmm)" % info['travel']
+    print(line)
+  print("%d sheets in %.3fs" % (len(names),time.time()-start))
+  if shapeCache is not None:
+    print("shape cache: %d hits, %d misses" % (shapeCache.hits,shapeCache.misses))
+  if stats is not None:
+    if args.stats:
+      print(stats.table())
+    if args.stats_json:
+      with open(args.stats_json,'w') as statsFile:
+        json.dump(stats.asDicts(),statsFile,indent=2)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""
+Layout and outlines of the components of the 3D printable diagram, in plain
+arithmetic so both feynmanDiagram, which builds them with CadQuery, and
+feynmanExtrude, which extrudes them with numpy, draw the same geometry.
+
+The model is in millimeters with y up.  Each leg is drawn from the center
+of its vertex, and each vertex is a circle with a radius of the
+vertexDiameter parameter, as the CadQuery model has always had it.
+"""
+
+import math
+
+sqrt = math.sqrt
+def distance2d(p1,p2):
+  return sqrt((p1[1]-p2[1])**2+(p1[0]-p2[0])**2)
+def getVector2d(p1,p2):
+  return (p2[0]-p1[0],p2[1]-p1[1])
+def getnormVector2d(p1,p2):
+  dist = distance2d(p1,p2)
+  vec = getVector2d(p1,p2)
+  return (vec[0]/dist,vec[1]/dist)
+def scaleVector2d(p,sf):
+  return (p[0]*sf,p[1]*sf)
+def addVectors2d(p1,p2):
+  return (p1[0]+p2[0],p1[1]+p2[1])
+
+# the external legs leave the vertices at this angle, in degrees
+EXTERNAL_ANGLE = 45.
+
+# the 8 points of each wiggle period, as multiples of the amplitude across
+# the line: a threePointArc through the first to the second, and so on
+WIGGLE_STEPS = ((0.7,0.3),(-0.3,-0.7),(-0.7,-0.3),(0.3,0.7))
+
+def wiggleOutline(endPoint,wigglePeriod=5.0,amplitude=2,width=0.25):
+  """
+  Outline of a boson line from the origin to endPoint, as the edges that
+  follow the origin: ("line",point) or ("arc",through,point) for the arc
+  through the current point, through and point.  It closes back to the
+  origin.  Each side wiggles through 8 points per period, the sides being
+  width apart across the line.
+  """
+  currentPoint = (0,0)
+  nPeriods = int(distance2d(currentPoint,endPoint)/wigglePeriod)
+  normVector = getnormVector2d(currentPoint,endPoint)
+  perpVector = (-normVector[1],normVector[0])
+  advanceVector = scaleVector2d(normVector,wigglePeriod/8.)
+  ampVector = scaleVector2d(perpVector,amplitude)
+  edges = []
+  currentPoint = addVectors2d(currentPoint,scaleVector2d(perpVector,width/2.))
+  edges.append(("line",currentPoint))
+  for side in range(2):
+    if side:
+      currentPoint = addVectors2d(currentPoint,scaleVector2d(perpVector,-width))
+      edges.append(("line",currentPoint))
+      advanceVector = scaleVector2d(advanceVector,-1)
+      ampVector = scaleVector2d(ampVector,-1)
+    for i in range(nPeriods):
+      for first,second in WIGGLE_STEPS:
+        currentPointM1 = addVectors2d(addVectors2d(currentPoint,advanceVector),scaleVector2d(ampVector,first))
+        currentPoint = addVectors2d(addVectors2d(currentPointM1,advanceVector),scaleVector2d(ampVector,second))
+        edges.append(("arc",currentPointM1,currentPoint))
+  return edges
+
+def lineOutline(endPoint,width=0.25):
+  """
+  Corners of the rectangle of a fermion line from the origin to endPoint.
+  """
+  normVector = getnormVector2d((0.0,0.0),endPoint)
+  perpVector = (-normVector[1],normVector[0])
+  return [
+    scaleVector2d(perpVector,-width/2.),
+    scaleVector2d(perpVector,width/2.),
+    addVectors2d(endPoint,scaleVector2d(perpVector,width/2.)),
+    addVectors2d(endPoint,scaleVector2d(perpVector,-width/2.)),
+  ]
+
+def diagramComponents(parameters):
+  """
+  Describes every solid of the diagram as a (kind,origin,endPoint,width,
+  depth) tuple, kind being "circle", "wiggle" or "line", from parameters,
+  which maps the feynmanDiagram parameter names to their values.  Circles
+  have no end point and take the vertex diameter as their width, which is
+  their radius.  The legs are drawn from origin, the center of their
+  vertex, to origin+endPoint.
+  """
+  depth = parameters['thickness']
+  left = (-parameters['propagatorLength']/2.,0.)
+  right = (parameters['propagatorLength']/2.,0.)
+  angle = EXTERNAL_ANGLE*math.pi/180.
+  externalLenX = abs(parameters['externalLength']*math.cos(angle))
+  externalLenY = abs(parameters['externalLength']*math.sin(angle))
+  legs = [
+    ('propagatorIsBoson',left,(parameters['propagatorLength'],0.)),
+    ('upperLeftExternalIsBoson',left,(-externalLenX,externalLenY)),
+    ('lowerLeftExternalIsBoson',left,(-externalLenX,-externalLenY)),
+    ('upperRightExternalIsBoson',right,(externalLenX,externalLenY)),
+    ('lowerRightExternalIsBoson',right,(externalLenX,-externalLenY)),
+  ]
+  specs = [("circle",left,None,parameters['vertexDiameter'],depth),("circle",right,None,parameters['vertexDiameter'],depth)]
+  for name,origin,endPoint in legs:
+    if parameters[name]:
+      specs.append(("wiggle",origin,endPoint,parameters['bosonWidth'],depth))
+    else:
+      specs.append(("line",origin,endPoint,parameters['fermionWidth'],depth))
+  return specs
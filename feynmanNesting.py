@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+"""
+Packs feynman diagrams onto as few Ponoko sheets as possible.
+
+Placement uses a skyline bottom-left bin packer: each sheet keeps the height
+of the packed material along x as a list of (x,y,width) segments, and each
+diagram goes where its top edge ends up lowest, on the first sheet with room
+for it.  Diagrams are packed tallest first.
+"""
+
+import numpy
+import feynmanGraphSVG
+import feynmanGeometry
+
+SHEET_SIZES = {
+  'small':(181.,181.),
+  'medium':(384.,384.),
+  'large':(790.,384.),
+}
+
+class Skyline(object):
+  """
+  The skyline of one sheet of usable size (width,height).
+  """
+
+  def __init__(self,width,height):
+    self.width = width
+    self.height = height
+    self.segments = [[0.,0.,width]]
+    self.freeArea = width*height
+
+  def fit(self,iSegment,w):
+    """
+    Returns the y a w wide rectangle would sit at if its left edge is at the
+    start of segment iSegment, or None if it runs off the sheet.
+    """
+    x = self.segments[iSegment][0]
+    if x+w > self.width+1e-9:
+      return None
+    y = 0.
+    widthLeft = w
+    i = iSegment
+    while widthLeft > 1e-9:
+      y = max(y,self.segments[i][1])
+      widthLeft -= self.segments[i][2]
+      i += 1
+    return y
+
+  def find(self,w,h):
+    """
+    Returns (iSegment,x,y) of the bottom-left position for a w x h
+    rectangle, or None if it doesn't fit.
+    """
+    if w*h > self.freeArea+1e-9:
+      return None
+    best = None
+    for iSegment in range(len(self.segments)):
+      y = self.fit(iSegment,w)
+      if y is None or y+h > self.height+1e-9:
+        continue
+      x = self.segments[iSegment][0]
+      if best is None or (y+h,x) < (best[2]+h,best[1]):
+        best = (iSegment,x,y)
+    return best
+
+  def place(self,iSegment,x,y,w,h):
+    self.segments.insert(iSegment,[x,y+h,w])
+    i = iSegment+1
+    # trim the segments now under the new one
+    while i < len(self.segments):
+      segment = self.segments[i]
+      overlap = x+w-segment[0]
+      if overlap <= 1e-9:
+        break
+      segment[0] += overlap
+      segment[2] -= overlap
+      if segment[2] > 1e-9:
+        break
+      del self.segments[i]
+    # merge neighbours at the same height
+    i = 0
+    while i < len(self.segments)-1:
+      if self.segments[i][1] == self.segments[i+1][1]:
+        self.segments[i][2] += self.segments[i+1][2]
+        del self.segments[i+1]
+      else:
+        i += 1
+    self.freeArea -= w*h
+
+def nestRectangles(sizes,sheetSize,margin=2.):
+  """
+  Packs rectangles of the given (width,height) sizes onto sheets of
+  sheetSize, keeping margin between rectangles and from the sheet edges.
+
+  Returns (placements,nSheets) where placements holds (iSheet,x,y) of the
+  lower left corner of each rectangle, in the order of sizes.
+  """
+  sizes = numpy.array(sizes,dtype=numpy.dtype(float)).reshape(-1,2)
+  # every rectangle carries a margin on its right and top, and the sheet
+  # loses one on its left and bottom
+  padded = sizes+margin
+  usableWidth = sheetSize[0]-margin
+  usableHeight = sheetSize[1]-margin
+  tooBig = (padded[:,0] > usableWidth+1e-9) | (padded[:,1] > usableHeight+1e-9)
+  if tooBig.any():
+    raise ValueError("Rectangle %d of size %s doesn't fit on a %s sheet" % (tooBig.argmax(),tuple(sizes[tooBig.argmax()]),tuple(sheetSize)))
+  order = numpy.lexsort((-padded[:,0],-padded[:,1]))
+  sheets = []
+  placements = [None]*len(sizes)
+  for iRect in order.tolist():
+    w,h = padded[iRect]
+    for iSheet,skyline in enumerate(sheets):
+      position = skyline.find(w,h)
+      if position is not None:
+        break
+    else:
+      sheets.append(Skyline(usableWidth,usableHeight))
+      iSheet = len(sheets)-1
+      skyline = sheets[-1]
+      position = skyline.find(w,h)
+    iSegment,x,y = position
+    skyline.place(iSegment,x,y,w,h)
+    placements[iRect] = (iSheet,x+margin,y+margin)
+  return placements,len(sheets)
+
+def nestDiagrams(diagrams,bboxes,sheetSize,margin=2.):
+  """
+  Packs Diagrams with bounding boxes (xmin,ymin,xmax,ymax) onto sheets.
+  If bboxes is None they are worked out with feynmanGeometry.diagramBBox.
+  Returns a list of sheets, each a list of (diagram,offset) where offset
+  moves the diagram into its place on the sheet.
+  """
+  if bboxes is None:
+    bboxes = [feynmanGeometry.diagramBBox(diagram) for diagram in diagrams]
+  bboxes = numpy.array(bboxes,dtype=numpy.dtype(float)).reshape(-1,4)
+  placements,nSheets = nestRectangles(bboxes[:,2:]-bboxes[:,:2],sheetSize,margin)
+  sheets = [[] for iSheet in range(nSheets)]
+  for diagram,bbox,(iSheet,x,y) in zip(diagrams,bboxes,placements):
+    sheets[iSheet].append((diagram,numpy.array([x,y])-bbox[:2]))
+  return sheets
+
+def renderNestedSheets(sheets,sheetSize,baseName,**options):
+  """
+  Saves each sheet returned by nestDiagrams as baseName_<n>.svg, passing
+  options on to feynmanGraphSVG.renderDrawing.  Returns the file names.
+  """
+  fileNames = []
+  for iSheet,placed in enumerate(sheets):
+    def builder(path,placed=placed):
+      for diagram,offset in placed:
+        diagram.render(path,offset)
+    fileName = "%s_%d.svg" % (baseName,iSheet)
+    feynmanGraphSVG.renderDrawing(builder,sheetSize,fileName,**options)
+    fileNames.append(fileName)
+  return fileNames
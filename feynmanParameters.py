@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+"""
+Parsing of feynmanDiagram parameter values given on the command line, shared
+by feynmanSweep, feynmanExtrude and feynmanBenchmark.
+"""
+
+def parseValue(text,default):
+  """
+  Parses text as the type of the parameter's default value.
+  """
+  if isinstance(default,bool):
+    if text.lower() in ("1","true","yes","boson"):
+      return True
+    if text.lower() in ("0","false","no","fermion"):
+      return False
+    raise ValueError("not a boolean: %s" % text)
+  return type(default)(text)
+
+def parseSettings(settings,defaults):
+  """
+  Turns "name=value" settings into a dict of parsed values, defaults mapping
+  each parameter name to its default value.
+  """
+  values = {}
+  for setting in settings:
+    name,sep,value = setting.partition("=")
+    if not sep or name not in defaults:
+      raise ValueError("expected name=value with name one of %s, got %s" % (", ".join(sorted(defaults)),setting))
+    values[name] = parseValue(value,defaults[name])
+  return values
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""
+Builds every combination of a grid of feynmanDiagram parameters in parallel
+worker processes, one STL file per variant named after its parameters.
+
+  ./feynmanSweep.py --all-bosons --set propagatorLength=40,50 --set thickness=2,3
+
+builds the 32 boson/fermion combinations of the propagator and legs for each
+of the 4 size presets.
+"""
+
+import os
+import sys
+import time
+import argparse
+import itertools
+import traceback
+import concurrent.futures
+from feynmanParameters import parseValue
+
+BOSON_PARAMETERS = (
+  "propagatorIsBoson","upperLeftExternalIsBoson","upperRightExternalIsBoson",
+  "lowerLeftExternalIsBoson","lowerRightExternalIsBoson",
+)
+
+def parseGrid(settings,allBosons=False,defaults=None):
+  """
+  Turns "name=v1,v2,..." settings into a list of (name,values), in the
+  order of defaults, which maps each parameter name to its default value.
+  """
+  grid = []
+  if allBosons:
+    grid.extend((name,[False,True]) for name in BOSON_PARAMETERS if name in defaults)
+  for setting in settings:
+    name,sep,values = setting.partition("=")
+    if not sep or name not in defaults:
+      raise ValueError("expected name=v1,v2,... with name one of %s, got %s" % (", ".join(sorted(defaults)),setting))
+    grid = [(other,otherValues) for other,otherValues in grid if other != name]
+    grid.append((name,[parseValue(value,defaults[name]) for value in values.split(",")]))
+  order = list(defaults)
+  return sorted(grid,key=lambda item: order.index(item[0]))
+
+def variants(grid):
+  """
+  Every combination of the grid as a list of (name,value) lists.
+  """
+  names = [name for name,values in grid]
+  return [list(zip(names,combination)) for combination in itertools.product(*[values for name,values in grid])]
+
+def formatValue(value):
+  if isinstance(value,bool):
+    return "1" if value else "0"
+  return "%g" % value
+
+def variantFileName(variant,outDir,extension="stl"):
+  """
+  outDir/feynmanDiagram_name-value_....extension for a variant.
+  """
+  parts = ["%s-%s" % (name,formatValue(value)) for name,value in variant]
+  return os.path.join(outDir,"_".join(["feynmanDiagram"]+parts)+"."+extension)
+
+def buildVariant(variant,outDir,tolerance=0.1,angularTolerance=0.1,cache=True):
+  """
+  Builds one variant in a worker process and saves it as STL.  Returns
+  (fileName,seconds,error) with error None on success.
+  """
+  fileName = variantFileName(variant,outDir)
+  start = time.time()
+  try:
+    import feynmanDiagram
+    for name,value in variant:
+      getattr(feynmanDiagram,name).value = value
+    result = feynmanDiagram.build(cache=cache)
+    feynmanDiagram.exportBinarySTL(result,fileName,tolerance,angularTolerance)
+  except Exception:
+    return fileName,time.time()-start,traceback.format_exc().strip().splitlines()[-1]
+  return fileName,time.time()-start,None
+
+def sweep(grid,outDir=".",jobs=None,log=None,**options):
+  """
+  Builds every variant of grid across a pool of jobs worker processes,
+  passing options on to buildVariant.  Returns the list of
+  (fileName,seconds,error) in the order they finished.
+  """
+  results = []
+  with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+    futures = [pool.submit(buildVariant,variant,outDir,**options) for variant in variants(grid)]
+    for future in concurrent.futures.as_completed(futures):
+      fileName,seconds,error = future.result()
+      results.append((fileName,seconds,error))
+      if log is not None:
+        log("%7.2fs  %s%s" % (seconds,fileName,"  FAILED: "+error if error else ""))
+  return results
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Builds a grid of feynmanDiagram variants as STL files")
+  parser.add_argument("--set",action="append",default=[],metavar="NAME=V1,V2",help="values to sweep a parameter over, can be given more than once")
+  parser.add_argument("--all-bosons",action="store_true",help="sweep the propagator and all four legs over boson and fermion")
+  parser.add_argument("--out",default=".",help="directory to write the STL files to")
+  parser.add_argument("--jobs",type=int,help="number of worker processes, one per CPU by default")
+  parser.add_argument("--tolerance",type=float,default=0.1,help="linear tessellation tolerance in mm")
+  parser.add_argument("--angular-tolerance",type=float,default=0.1,help="angular tessellation tolerance in radians")
+  parser.add_argument("--no-cache",action="store_true",help="build every variant from scratch")
+  parser.add_argument("--dry-run",action="store_true",help="only list the files that would be built")
+  args = parser.parse_args(argv)
+  try:
+    import feynmanDiagram
+  except ImportError as error:
+    parser.error("feynmanDiagram needs CadQuery: %s" % error)
+  defaults = feynmanDiagram.parameterValues()
+  try:
+    grid = parseGrid(args.set,args.all_bosons,defaults)
+  except ValueError as error:
+    parser.error(str(error))
+  if args.dry_run:
+    for variant in variants(grid):
+      print(variantFileName(variant,args.out))
+    return 0
+  if not os.path.isdir(args.out):
+    os.makedirs(args.out)
+  start = time.time()
+  results = sweep(grid,args.out,args.jobs,log=print,tolerance=args.tolerance,angularTolerance=args.angular_tolerance,cache=not args.no_cache)
+  failures = [result for result in results if result[2] is not None]
+  buildTimes = [seconds for fileName,seconds,error in results if error is None]
+  print("%d variants in %.2fs: %d built, %d failed" % (len(results),time.time()-start,len(buildTimes),len(failures)))
+  if buildTimes:
+    print("build time per variant: mean %.2fs, max %.2fs" % (sum(buildTimes)/len(buildTimes),max(buildTimes)))
+  for fileName,seconds,error in failures:
+    print("FAILED %s: %s" % (fileName,error))
+  return 1 if failures else 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+
+"""
+Orders the subpaths of a sheet to cut down the distance the laser head
+travels between cuts.
+
+The path is split at its moves into subpaths, each a run of drawing commands.
+A nearest neighbour tour is built first, going from the head's home position
+to whichever subpath can be entered closest to where the last one finished.
+Open subpaths can be entered from either end if reversal is allowed and
+closed ones from the start of any of their segments.  The tour is then
+improved with 2-opt, reversing blocks of subpaths while that shortens it, and
+finally each subpath's entry point is picked again with its new neighbours.
+
+Segments that are cut twice, where edges of neighbouring diagrams or lines
+and vertex circles coincide, can be removed first with dedupeCommands.
+Straight lines are found through a grid of the cells along them.  Two lines
+count as the same cut where the ends of one are within tolerance of the
+other, and the parts of a line already cut by earlier ones are subtracted
+from it.
+Curves and arcs are hashed by the grid cell of the centroid of their
+points, and dropped if one through the same points, in either direction, was
+already cut.
+"""
+
+import math
+import collections
+import numpy
+from feynmanGraphSVG import PATH_COMMANDS,PATH_ARITY
+from feynmanGeometry import toAbsolute
+
+CODE_M = PATH_COMMANDS.index("M")
+CODE_L = PATH_COMMANDS.index("L")
+CODE_Q = PATH_COMMANDS.index("Q")
+CODE_C = PATH_COMMANDS.index("C")
+CODE_A = PATH_COMMANDS.index("A")
+
+class Subpath(object):
+  """
+  A run of absolute drawing commands.  previous (n,2) holds the point each
+  command starts from.
+  """
+
+  def __init__(self,codes,coords,previous,tolerance=1e-3):
+    self.codes = codes
+    self.coords = coords
+    self.previous = previous
+    arity = PATH_ARITY[codes]
+    self.starts = numpy.cumsum(arity)-arity
+    self.start = previous[0]
+    self.end = coords[-2:]
+    self.closed = numpy.hypot(*(self.end-self.start)) <= tolerance
+
+  def commands(self,first=0,reverse=False):
+    """
+    Returns (codes,coords) drawing the subpath from the start of command
+    first, which must be 0 unless the subpath is closed, going backwards if
+    reverse is set.
+    """
+    order = numpy.roll(numpy.arange(len(self.codes)),-first)
+    if not reverse:
+      index = numpy.concatenate([numpy.arange(self.starts[i],self.starts[i]+PATH_ARITY[self.codes[i]]) for i in order])
+      return self.codes[order],self.coords[index]
+    coords = []
+    for i in order[::-1]:
+      code = self.codes[i]
+      values = self.coords[self.starts[i]:self.starts[i]+PATH_ARITY[code]]
+      start = self.previous[i]
+      if code == CODE_L:
+        coords.append(start)
+      elif code == CODE_Q:
+        coords.extend((values[0:2],start))
+      elif code == CODE_C:
+        coords.extend((values[2:4],values[0:2],start))
+      else:
+        coords.extend((values[0:4],[1.-values[4]],start))
+    return self.codes[order[::-1]],numpy.concatenate(coords)
+
+def splitSubpaths(codes,coords,tolerance=1e-3):
+  """
+  Splits path commands at their moves into a list of Subpaths, dropping any
+  moves that aren't followed by drawing.
+  """
+  codes,coords,previous = toAbsolute(codes,coords)
+  arity = PATH_ARITY[codes]
+  starts = numpy.cumsum(arity)-arity
+  isMove = codes == CODE_M
+  # label each command with the number of moves so far
+  label = numpy.cumsum(isMove)
+  subpaths = []
+  for value in numpy.unique(label[~isMove]):
+    index = numpy.flatnonzero((label == value) & ~isMove)
+    coordIndex = numpy.concatenate([numpy.arange(starts[i],starts[i]+arity[i]) for i in index])
+    subpaths.append(Subpath(codes[index],coords[coordIndex],previous[index],tolerance))
+  return subpaths
+
+def travelDistance(subpaths,origin=(0.,0.)):
+  """
+  Distance the head moves without cutting to draw the subpaths in order,
+  starting at origin.
+  """
+  if not subpaths:
+    return 0.
+  starts = numpy.array([subpath.start for subpath in subpaths])
+  ends = numpy.vstack(([origin],[subpath.end for subpath in subpaths[:-1]]))
+  return float(numpy.hypot(*(starts-ends).T).sum())
+
+def entryOptions(subpaths,allowReverse=True,pickStart=True):
+  """
+  Every way into each subpath as arrays (iSubpath,first,reverse,entry,exit).
+  """
+  iSubpath = []
+  first = []
+  reverse = []
+  entries = []
+  exits = []
+  for i,subpath in enumerate(subpaths):
+    if subpath.closed and pickStart:
+      n = len(subpath.codes)
+      iSubpath.extend([i]*n)
+      first.extend(range(n))
+      reverse.extend([False]*n)
+      entries.append(subpath.previous)
+      exits.append(subpath.previous)
+      continue
+    iSubpath.append(i)
+    first.append(0)
+    reverse.append(False)
+    entries.append([subpath.start])
+    exits.append([subpath.end])
+    if allowReverse and not subpath.closed:
+      iSubpath.append(i)
+      first.append(0)
+      reverse.append(True)
+      entries.append([subpath.end])
+      exits.append([subpath.start])
+  return numpy.array(iSubpath,dtype=int),numpy.array(first,dtype=int),numpy.array(reverse,dtype=bool),numpy.vstack(entries),numpy.vstack(exits)
+
+def nearestNeighbourTour(options,nSubpaths,origin=(0.,0.)):
+  """
+  Greedy tour over the entryOptions.  Returns the chosen option indices in
+  cutting order.
+  """
+  iSubpath,first,reverse,entries,exits = options
+  available = numpy.ones(len(iSubpath),dtype=bool)
+  position = numpy.asarray(origin,dtype=numpy.float64)
+  tour = []
+  for step in range(nSubpaths):
+    distance = numpy.hypot(*(entries-position).T)
+    distance[~available] = numpy.inf
+    best = int(distance.argmin())
+    tour.append(best)
+    available[iSubpath == iSubpath[best]] = False
+    position = exits[best]
+  return tour
+
+def twoOpt(entries,exits,origin=(0.,0.),maxPasses=50):
+  """
+  Improves a tour given by the (n,2) entry and exit points of its subpaths
+  by reversing blocks of it, which also reverses each subpath in the block.
+  Returns (order,flipped) where flipped marks the subpaths to run backwards.
+  """
+  entries = numpy.array(entries,dtype=numpy.float64)
+  exits = numpy.array(exits,dtype=numpy.float64)
+  n = len(entries)
+  order = numpy.arange(n)
+  flipped = numpy.zeros(n,dtype=bool)
+  origin = numpy.asarray(origin,dtype=numpy.float64)
+  for iPass in range(maxPasses):
+    improved = False
+    for i in range(n):
+      before = exits[i-1] if i > 0 else origin
+      j = numpy.arange(i,n)
+      after = numpy.vstack((entries[i+1:],numpy.full((1,2),numpy.nan)))
+      linkOld = numpy.nan_to_num(numpy.hypot(*(exits[j]-after).T))
+      linkNew = numpy.nan_to_num(numpy.hypot(*(entries[i]-after).T))
+      delta = numpy.hypot(*(before-exits[j]).T)+linkNew-numpy.hypot(*(before-entries[i]))-linkOld
+      best = int(delta.argmin())
+      if delta[best] < -1e-9:
+        k = i+best
+        entries[i:k+1],exits[i:k+1] = exits[i:k+1][::-1].copy(),entries[i:k+1][::-1].copy()
+        order[i:k+1] = order[i:k+1][::-1].copy()
+        flipped[i:k+1] = ~flipped[i:k+1][::-1]
+        improved = True
+    if not improved:
+      break
+  return order,flipped
+
+def orderSubpaths(subpaths,allowReverse=True,pickStart=True,improve=True,origin=(0.,0.)):
+  """
+  Finds a short cutting order.  Returns a list of (subpath,first,reverse)
+  to pass on to Subpath.commands.
+  """
+  if not subpaths:
+    return []
+  options = entryOptions(subpaths,allowReverse,pickStart)
+  iSubpath,first,reverse,entries,exits = options
+  tour = nearestNeighbourTour(options,len(subpaths),origin)
+  choice = [[iSubpath[k],first[k],reverse[k]] for k in tour]
+  tourEntries = entries[tour]
+  tourExits = exits[tour]
+  if improve and allowReverse:
+    order,flipped = twoOpt(tourEntries,tourExits,origin)
+    choice = [choice[k] for k in order]
+    for item,flip in zip(choice,flipped):
+      item[2] ^= bool(flip)
+    tourEntries,tourExits = numpy.where(flipped[:,numpy.newaxis],tourExits[order],tourEntries[order]),numpy.where(flipped[:,numpy.newaxis],tourEntries[order],tourExits[order])
+  # pick each entry again now the neighbours are settled
+  position = numpy.asarray(origin,dtype=numpy.float64)
+  for k,item in enumerate(choice):
+    mask = iSubpath == item[0]
+    if not allowReverse:
+      mask &= ~reverse
+    candidates = numpy.flatnonzero(mask)
+    cost = numpy.hypot(*(entries[candidates]-position).T)
+    if k+1 < len(choice):
+      cost += numpy.hypot(*(exits[candidates]-tourEntries[k+1]).T)
+    best = candidates[cost.argmin()]
+    if subpaths[item[0]].closed and pickStart:
+      # closed loops keep the direction 2-opt gave them
+      item[1] = first[best]
+    elif allowReverse:
+      item[2] = bool(reverse[best])
+    position = exits[best]
+  return [(subpaths[i],f,r) for i,f,r in choice]
+
+def orderCommands(codes,coords,allowReverse=True,pickStart=True,improve=True,origin=(0.,0.),tolerance=1e-3):
+  """
+  Reorders path commands to cut down the travel between subpaths.  Subpaths
+  whose ends are within tolerance are taken as closed.  Returns the new
+  absolute (codes,coords) along with the travel distance before and after.
+  """
+  subpaths = splitSubpaths(codes,coords,tolerance)
+  before = travelDistance(subpaths,origin)
+  newCodes = []
+  newCoords = []
+  position = numpy.asarray(origin,dtype=numpy.float64)
+  after = 0.
+  for subpath,first,reverse in orderSubpaths(subpaths,allowReverse,pickStart,improve,origin):
+    subCodes,subCoords = subpath.commands(first,reverse)
+    entry = subpath.end if reverse and not subpath.closed else subpath.previous[first]
+    after += numpy.hypot(*(entry-position))
+    newCodes.append([CODE_M])
+    newCoords.append(entry)
+    newCodes.append(subCodes)
+    newCoords.append(subCoords)
+    position = subCoords[-2:]
+  if not newCodes:
+    return numpy.zeros(0,dtype=numpy.uint8),numpy.zeros(0),before,0.
+  return numpy.concatenate(newCodes).astype(numpy.uint8),numpy.concatenate(newCoords),before,float(after)
+
+def optimizePath(path,**options):
+  """
+  Reorders a PathBuffer in place with orderCommands, taking the same
+  options.  Returns (travel before,travel after).
+  """
+  codes,coords,before,after = orderCommands(*path.commandArrays(),**options)
+  path.nCodes = 0
+  path.nCoords = 0
+  path.extendCodes(codes,coords)
+  return before,after
+
+# cell size, in mm, of the grid dedupeCommands finds nearby lines with
+LINE_CELL_SIZE = 2.
+
+def lineCells(start,end,cellSize):
+  """
+  The grid cells of points spaced at most cellSize apart along the segment
+  start-end, ends included.
+  """
+  x0,y0 = float(start[0]),float(start[1])
+  dx,dy = float(end[0])-x0,float(end[1])-y0
+  nSteps = max(1,int(math.ceil(math.hypot(dx,dy)/cellSize)))
+  cells = set()
+  for i in range(nSteps+1):
+    t = float(i)/nSteps
+    cells.add((int(math.floor((x0+t*dx)/cellSize)),int(math.floor((y0+t*dy)/cellSize))))
+  return cells
+
+def alongLine(p0,p1,start,end,tolerance):
+  """
+  Whether p0 and p1 are both within tolerance of the infinite line through
+  start and end.
+  """
+  dx,dy = end[0]-start[0],end[1]-start[1]
+  limit = tolerance*math.hypot(dx,dy)
+  return abs(dx*(p0[1]-start[1])-dy*(p0[0]-start[0])) <= limit and abs(dx*(p1[1]-start[1])-dy*(p1[0]-start[0])) <= limit
+
+def subtractIntervals(t0,t1,covered,tolerance):
+  """
+  The parts of [t0,t1] not inside any of the covered (a,b) intervals, as a
+  list of intervals longer than tolerance.  Overlaps shorter than tolerance,
+  as where two lines meet end to end, are left alone.
+  """
+  pieces = [(t0,t1)]
+  for a,b in sorted(covered):
+    left = []
+    for p0,p1 in pieces:
+      if b <= p0+tolerance or a >= p1-tolerance:
+        left.append((p0,p1))
+        continue
+      if a > p0:
+        left.append((p0,a))
+      if b < p1:
+        left.append((b,p1))
+    pieces = left
+  return [(p0,p1) for p0,p1 in pieces if p1-p0 > tolerance]
+
+def sameCurve(points,params,otherPoints,otherParams,tolerance):
+  """
+  Whether two curves given by their points, plus the arc parameters for
+  arcs, trace the same shape within tolerance in either direction.
+  """
+  if len(points) != len(otherPoints):
+    return False
+  if params is not None and numpy.abs(params[:4]-otherParams[:4]).max() > tolerance:
+    return False
+  if numpy.abs(points-otherPoints).max() <= tolerance:
+    return params is None or params[4] == otherParams[4]
+  if numpy.abs(points[::-1]-otherPoints).max() <= tolerance:
+    return params is None or params[4] != otherParams[4]
+  return False
+
+def dedupeCommands(codes,coords,tolerance=1e-3):
+  """
+  Removes segments that retrace ones earlier in the path, within tolerance,
+  along with zero length segments.  Returns the new absolute (codes,coords)
+  and the number of segments removed or trimmed.
+  """
+  codes,coords,previous = toAbsolute(codes,coords)
+  arity = PATH_ARITY[codes]
+  starts = numpy.cumsum(arity)-arity
+  cellSize = max(LINE_CELL_SIZE,2*tolerance)
+  lineGrid = collections.defaultdict(list)
+  linePieces = []
+  curves = collections.defaultdict(list)
+  kept = []
+  nRemoved = 0
+  for i in numpy.flatnonzero(codes != CODE_M).tolist():
+    code = codes[i]
+    start = previous[i]
+    values = coords[starts[i]:starts[i]+arity[i]]
+    end = values[-2:]
+    points = numpy.vstack((start,values.reshape(-1,2))) if code != CODE_A else numpy.vstack((start,end))
+    if numpy.abs(points-start).max() <= tolerance:
+      nRemoved += 1
+      continue
+    if code != CODE_L:
+      # the centroid doesn't depend on the direction the curve was drawn in
+      params = values[:5] if code == CODE_A else None
+      centroid = points.mean(axis=0)
+      iX,iY = numpy.floor(centroid/tolerance).astype(int).tolist()
+      duplicate = False
+      for jX in (iX-1,iX,iX+1):
+        for jY in (iY-1,iY,iY+1):
+          for otherPoints,otherParams in curves.get((code,jX,jY),()):
+            if sameCurve(points,params,otherPoints,otherParams,tolerance):
+              duplicate = True
+      if duplicate:
+        nRemoved += 1
+        continue
+      curves[(code,iX,iY)].append((points,params))
+      kept.append((code,start,values))
+      continue
+    # lines are near coincident if the ends of one are within tolerance of
+    # the other, found through the grid cells along them
+    length = numpy.hypot(*(end-start))
+    direction = (end-start)/length
+    cells = lineCells(start,end,cellSize)
+    neighbours = set((iX+jX,iY+jY) for iX,iY in cells for jX in (-1,0,1) for jY in (-1,0,1))
+    candidates = set()
+    for cell in neighbours:
+      if cell in lineGrid:
+        candidates.update(lineGrid[cell])
+    covered = []
+    for j in sorted(candidates):
+      p0,p1 = linePieces[j]
+      if alongLine(p0,p1,start,end,tolerance) or alongLine(start,end,p0,p1,tolerance):
+        covered.append(tuple(sorted((numpy.dot(p0-start,direction),numpy.dot(p1-start,direction)))))
+    pieces = subtractIntervals(0.,length,covered,tolerance)
+    if pieces != [(0.,length)]:
+      nRemoved += 1
+    for a,b in pieces:
+      pieceStart = start if a == 0. else start+a*direction
+      pieceEnd = end if b == length else start+b*direction
+      for cell in lineCells(pieceStart,pieceEnd,cellSize):
+        lineGrid[cell].append(len(linePieces))
+      linePieces.append((pieceStart,pieceEnd))
+      kept.append((CODE_L,pieceStart,pieceEnd))
+  newCodes = []
+  newCoords = []
+  position = None
+  for code,start,values in kept:
+    if position is None or numpy.abs(start-position).max() > 0.:
+      newCodes.append(CODE_M)
+      newCoords.append(start)
+    newCodes.append(code)
+    newCoords.append(values)
+    position = values[-2:]
+  if not newCodes:
+    return numpy.zeros(0,dtype=numpy.uint8),numpy.zeros(0),nRemoved
+  return numpy.array(newCodes,dtype=numpy.uint8),numpy.concatenate(newCoords),nRemoved
+
+def dedupePath(path,tolerance=1e-3):
+  """
+  Removes retraced segments from a PathBuffer in place with dedupeCommands.
+  Returns the number of segments removed or trimmed.
+  """
+  codes,coords,nRemoved = dedupeCommands(*path.commandArrays(),tolerance=tolerance)
+  path.nCodes = 0
+  path.nCoords = 0
+  path.extendCodes(codes,coords)
+  return nRemoved